@@ -1,2 +1,2 @@
 # flake8: noqa
-from .rsterm_config import RsTermConfig
+from .rsterm_config import RsTermConfig, rsterm_cache_dir
@@ -1,17 +1,148 @@
 import os
+import re
 import sys
-import yaml
-import psycopg2
-from psycopg2.extensions import connection
+import copy
+import json
+import hashlib
+import threading
 from argparse import ArgumentParser, Namespace
-from typing import Dict, List, Tuple, Any
+from contextlib import contextmanager
+from typing import Dict, List, Set, Tuple, Any, Optional, Iterator, TYPE_CHECKING
 from pathlib import Path
-from dotenv import load_dotenv
+
+if TYPE_CHECKING:
+    # psycopg2, yaml and dotenv are imported where they are used, so that commands which
+    # never touch them do not pay for loading them.
+    from psycopg2.extensions import connection
+    from rsterm.database.pool import ConnectionPool
+    from rsterm.database.async_connection import AsyncConnection
+    from rsterm.secrets.resolver import SecretResolver
+    from rsterm.database.query_cache import QueryCache
+    from rsterm.database.instrumentation import QueryRecorder
+    from rsterm.storage.backends import StorageBackend
+
+CONFIG_CACHE_VERSION = 1
+
+# parsed yaml documents, keyed on absolute path, stored with the stat key they were parsed at
+_parsed_files: Dict[str, Tuple[List[int], Dict[str, Any]]] = {}
+
+# merged (config + override file) kwargs, keyed on absolute config path and override path. The kwargs are kept
+# as json, which is quicker to load into a fresh copy than deepcopy is, unless they can not be represented as json
+_loaded_configs: Dict[Tuple[str, str], Tuple[List, Any]] = {}
+
+# env files loaded into the environment, as (absolute path, stat key) pairs
+_loaded_env_files: Set[Tuple[str, Tuple[int, ...]]] = set()
+
+# config snapshots embedded in an app built with rsterm build project, keyed on absolute config path. Each is
+# stored with a stat key made from its hash, which stands in for the stat of the file it replaces
+_frozen_configs: Dict[str, Tuple[List[int], Dict[str, Any]]] = {}
+
+
+def rsterm_cache_dir() -> Path:
+    """
+    Returns: Path the root directory used for rsterm's on disk caches. Can be overridden
+             with the RSTERM_CACHE_DIR environment variable.
+    """
+    # the xdg spec says a relative path is invalid and must be ignored, as it would depend on the working directory
+    xdg_cache_home = os.environ.get('XDG_CACHE_HOME', '')
+    base = Path(xdg_cache_home) if os.path.isabs(xdg_cache_home) else Path.home() / '.cache'
+    return Path(os.environ.get('RSTERM_CACHE_DIR') or base / 'rsterm')
+
+
+def stat_key(path: Path) -> Optional[List[int]]:
+    """
+    Returns: List[int] [mtime_ns, size] of the path, or None if it does not exist.
+    """
+    try:
+        stat = path.stat()
+    except OSError:
+        frozen = _frozen_configs.get(Path(path).absolute().as_posix()) if _frozen_configs else None
+        return frozen[0] if frozen else None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def sources_unchanged(sources: List) -> bool:
+    """
+    Returns: bool True if every [path, stat_key] pair still matches the file on disk.
+    """
+    return all(stat_key(Path(path)) == key for path, key in sources)
+
+
+def read_config_file(config_path: Path) -> Dict[str, Any]:
+    """
+    Parse a yaml config file once per process. The file is only parsed again if it has changed on disk.
+    Returns: Dict[str, Any] the contents of the rsterm key, which must not be mutated by the caller.
+    """
+    config_path = Path(config_path)
+    key = config_path.absolute().as_posix()
+    file_stat = stat_key(config_path)
+    cached = _parsed_files.get(key)
+
+    if cached and file_stat is not None and cached[0] == file_stat:
+        return cached[1]
+
+    if key in _frozen_configs:
+        return _frozen_configs[key][1]
+
+    import yaml
+
+    with config_path.open() as config_file:
+        content = yaml.safe_load(config_file)['rsterm']
+
+    _parsed_files[key] = (file_stat, content)
+    return content
+
+
+def freeze_config(config_path: Path, config: str) -> None:
+    """
+    Use a snapshot of a config file, as json, in place of parsing the file. The override file is still applied
+    on load, as it belongs to the directory the app is run from, and the merged result is cached as usual.
+    """
+    digest = hashlib.sha256(config.encode()).hexdigest()
+    _frozen_configs[Path(config_path).absolute().as_posix()] = ([0, int(digest[:15], 16)], json.loads(config))
+
+
+def config_cache_path(config_path: Path, override_path: Path) -> Path:
+    key = f"{Path(config_path).absolute().as_posix()}:{Path(override_path).as_posix()}"
+    return rsterm_cache_dir() / 'configs' / f"{hashlib.sha256(key.encode()).hexdigest()}.json"
+
+
+def read_config_cache(cache_path: Path) -> Optional[Tuple[List, Dict[str, Any]]]:
+    """
+    Read the merged config kwargs from the on disk cache. The cache is only valid when every
+    file it was built from has the same stat key as when it was written.
+    """
+    try:
+        data = json.loads(cache_path.read_text())
+        if data['version'] != CONFIG_CACHE_VERSION or not sources_unchanged(data['sources']):
+            return None
+        return data['sources'], data['config']
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def write_config_cache(cache_path: Path, sources: List, config: Dict[str, Any]) -> None:
+    """
+    Write the merged config kwargs to the on disk cache, readable only by the user as they may hold credentials. The
+    file is written under a name of its own and then renamed, so that a reader never sees it half written.
+    """
+    try:
+        content = json.dumps({'version': CONFIG_CACHE_VERSION, 'sources': sources, 'config': config})
+        cache_path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        tmp_path = cache_path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        fd = os.open(tmp_path.as_posix(), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as cache_file:
+            cache_file.write(content)
+        tmp_path.replace(cache_path)
+    except (OSError, TypeError, ValueError):
+        # values yaml can produce, but json can not represent are simply not cached
+        pass
 
 
 class RsTermConfig:
     root_dir = Path.cwd().absolute()
-    optional_kwargs = ['db_connections', 'environment', 'iam_roles', 's3_buckets', 'aws_secrets']
+    optional_kwargs = ['db_connections', 'environment', 'iam_roles', 's3_buckets', 'aws_secrets', 'secrets',
+                       'query_cache', 'pipelines', 'instrumentation', 'storage']
 
     def __init__(self, app: Dict[str, str],
                  entrypoint_paths: Dict[str, List],
@@ -47,6 +178,26 @@ class RsTermConfig:
     def aws_secrets(self) -> Dict[str, str]:
         return getattr(self, '_aws_secrets', {})
 
+    @property
+    def secrets(self) -> Dict[str, Any]:
+        return getattr(self, '_secrets', {})
+
+    @property
+    def query_cache(self) -> Dict[str, Any]:
+        return getattr(self, '_query_cache', {})
+
+    @property
+    def pipelines(self) -> Dict[str, Any]:
+        return getattr(self, '_pipelines', {})
+
+    @property
+    def instrumentation(self) -> Dict[str, Any]:
+        return getattr(self, '_instrumentation', {})
+
+    @property
+    def storage(self) -> Dict[str, Any]:
+        return getattr(self, '_storage', {})
+
     @property
     def load_env(self) -> bool:
         return bool(self.environment.get('load_env', False))
@@ -75,6 +226,22 @@ class RsTermConfig:
     def nouns(self) -> List[str]:
         return self.terminal['nouns']
 
+    @property
+    def budgets(self) -> Dict[str, Dict[str, Any]]:
+        return self.terminal.get('budgets') or {}
+
+    @property
+    def metrics_path(self) -> Optional[Path]:
+        """
+        Returns: Optional[Path] the jsonl file the resources used by each command are appended to, set by metrics_file
+                 in the terminal section, metrics.jsonl in the app's cache directory when it is true. None, the
+                 default, when metrics_file is not set or false.
+        """
+        metrics_file = self.terminal.get('metrics_file', False)
+        if metrics_file is False or metrics_file is None:
+            return None
+        return self.cache_dir / 'metrics.jsonl' if metrics_file is True else Path(metrics_file).expanduser()
+
     @property
     def verb_noun_map(self) -> List[str]:
         return [f"{verb}_{noun}" for verb in self.verbs for noun in self.nouns]
@@ -83,6 +250,10 @@ class RsTermConfig:
     def override_file(self) -> str:
         return self.app.get('override_file', None)
 
+    @property
+    def cache_dir(self) -> Path:
+        return rsterm_cache_dir() / self.app_name
+
     def get_entrypoint_paths(self) -> List[Path]:
         return [Path(p) for p in self.entrypoint_paths]
 
@@ -94,19 +265,320 @@ class RsTermConfig:
         value = self.iam_roles[iam_role]
         return os.environ.get(value, value)
 
-    def get_db_connection(self, connection_name: str) -> connection:
+    def get_storage_backend(self, bucket_name: str) -> 'StorageBackend':
+        """
+        The backend holding a bucket from s3_buckets, configured by the storage section.
+
+        storage:
+          backend: s3         # the default, or local to keep each bucket in a directory under root
+          options:            # region_name and profile_name for s3, root for local
+            region_name: eu-west-1
+
+        Returns: StorageBackend
+        """
+        from rsterm.storage import LocalBackend, get_backend
+
+        bucket = self.get_s3_bucket(bucket_name)
+        options = dict(self.storage.get('options') or {})
+
+        if self.storage.get('backend', 's3') == 'local':
+            return LocalBackend(Path(options['root']) / bucket)
+        return get_backend(self.storage.get('backend', 's3'), bucket=bucket, **options)
+
+    def get_sync_manifest_path(self, bucket_name: str, prefix: str = '') -> Path:
+        """
+        Returns: Path of the manifest of what has been synced to a bucket and prefix, in the app's cache directory
+        """
+        bucket = re.sub(r'[^\w.-]', '_', self.get_s3_bucket(bucket_name))
+        return self.cache_dir / 'sync' / bucket / f"{hashlib.sha256(prefix.strip('/').encode()).hexdigest()[:16]}.json"
+
+    def get_secret_resolver(self) -> 'SecretResolver':
+        """
+        The process wide resolver for this app's secrets, configured by the secrets section.
+
+        secrets:
+          backend: aws        # env (the default), file or aws
+          options:            # kwargs of the backend, path for file, region_name and profile_name for aws
+            region_name: eu-west-1
+          ttl: 300            # seconds values are cached for
+          file_cache: true    # also cache values in an encrypted file, in the app's cache directory
+          key_env: RSTERM_SECRETS_KEY   # env var holding the Fernet key of the file cache, which is off if unset
+
+        Returns: SecretResolver
+        """
+        from rsterm.secrets import SecretResolver, EncryptedFileCache, get_backend, get_resolver
+
+        settings = self.secrets
+
+        def create() -> SecretResolver:
+            file_cache = None
+            key = os.environ.get(settings.get('key_env', 'RSTERM_SECRETS_KEY'))
+
+            if settings.get('file_cache') and key:
+                file_cache = EncryptedFileCache(self.cache_dir / 'secrets.bin', key)
+
+            backend = get_backend(settings.get('backend', 'env'), **(settings.get('options') or {}))
+            return SecretResolver(backend, ttl=float(settings.get('ttl', 300)), file_cache=file_cache)
+
+        return get_resolver(f"{self.app_name}:{json.dumps(settings, sort_keys=True)}", create)
+
+    def resolve_secrets(self, names: List[str]) -> Dict[str, str]:
+        """
+        Resolve secrets from the aws_secrets section by name, fetching all those which are not cached in one batch.
+        An entry is either the secret id, or a mapping with a secret_id key. As with the other sections, an entry
+        naming an environment variable which is set resolves to the value of that variable.
+
+        aws_secrets:
+          key: AWS_ACCESS_KEY_ID
+          warehouse_password:
+            secret_id: prod/warehouse#password
+
+        Returns: Dict[str, str] name -> secret value
+        Raises:  SecretNotFound if any secret can not be found
+        """
+        secrets, secret_ids = {}, {}
+
+        for name in names:
+            value = self.aws_secrets[name]
+
+            if isinstance(value, dict):
+                secret_ids[name] = value['secret_id']
+            elif value in os.environ:
+                secrets[name] = os.environ[value]
+            else:
+                secret_ids[name] = value
+
+        if secret_ids:
+            resolved = self.get_secret_resolver().resolve(sorted(set(secret_ids.values())))
+            secrets.update({name: resolved[secret_id] for name, secret_id in secret_ids.items()})
+        return secrets
+
+    def get_aws_secret(self, name: str) -> str:
+        return self.resolve_secrets([name])[name]
+
+    def get_query_cache(self) -> 'QueryCache':
+        """
+        The on disk cache used by EntryPoint.cached_query, configured by the query_cache section.
+
+        query_cache:
+          directory: .query_cache   # defaults to query_cache in the app's cache directory
+          max_size_mb: 512          # least recently used results are removed beyond this size
+          ttl: 3600                 # seconds a result is kept for, unless the query gives its own ttl
+
+        Returns: QueryCache
+        """
+        from rsterm.database.query_cache import QueryCache
+
+        settings = self.query_cache
+        directory = Path(settings['directory']) if 'directory' in settings else self.cache_dir / 'query_cache'
+
+        return QueryCache(directory, max_bytes=int(float(settings.get('max_size_mb', 512)) * 1024 * 1024),
+                          default_ttl=float(settings.get('ttl', 3600)))
+
+    def get_query_recorder(self) -> 'QueryRecorder':
+        """
+        The process wide recorder of the statements run on instrumented connections, configured by the
+        instrumentation section. Connections are only instrumented when the section is enabled.
+
+        instrumentation:
+          enabled: true
+          connections: [redshift]   # defaults to every connection
+          slow_query_ms: 1000       # statements taking longer are written to the slow query log
+          slow_query_log: slow.jsonl   # defaults to slow_queries.jsonl in the app's cache directory
+          summary: true             # print the statements which took the most time when a command finishes
+          statsd:
+            host: localhost
+            port: 8125
+            prefix: my_app
+          prometheus:
+            path: /var/lib/node_exporter/textfile/my_app.prom
+
+        Returns: QueryRecorder
+        """
+        from rsterm.database.instrumentation import QueryRecorder, StatsdExporter, PrometheusExporter, get_recorder
+
+        settings = self.instrumentation
+
+        def create() -> QueryRecorder:
+            slow_query_ms = settings.get('slow_query_ms', 1000)
+            slow_log = settings.get('slow_query_log')
+            exporters = []
+
+            if settings.get('statsd') is not None:
+                exporters.append(StatsdExporter(**dict({'prefix': self.app_name}, **(settings['statsd'] or {}))))
+            if settings.get('prometheus'):
+                exporters.append(PrometheusExporter(Path(settings['prometheus']['path']), self.app_name))
+
+            return QueryRecorder(slow_seconds=float(slow_query_ms) / 1000 if slow_query_ms is not None else None,
+                                 slow_log_path=Path(slow_log) if slow_log else self.cache_dir / 'slow_queries.jsonl',
+                                 print_summary=bool(settings.get('summary', True)), exporters=exporters)
+
+        return get_recorder(f"{self.app_name}:{json.dumps(settings, sort_keys=True)}", create)
+
+    def is_instrumented(self, connection_name: str) -> bool:
+        settings = self.instrumentation
+        connections = settings.get('connections')
+        return bool(settings.get('enabled')) and (connections is None or connection_name in connections)
+
+    def get_connection_string(self, connection_name: str) -> str:
+        value = self.db_connections[connection_name]
+
+        if isinstance(value, dict):
+            value = value['url']
+        return os.environ.get(value, value)
+
+    def get_pool_options(self, connection_name: str) -> Optional[Dict[str, Any]]:
+        """
+        A connection is pooled when its db_connections entry is a mapping with a pool section.
+
+        db_connections:
+          redshift:
+            url: DATABASE_URL
+            pool:
+              min_size: 1
+              max_size: 5
+              idle_timeout: 300
+              health_check: true
+              checkout_timeout: 30
+
+        Returns: Dict[str, Any] ConnectionPool kwargs, or None if the connection is not pooled.
+        """
         value = self.db_connections[connection_name]
-        connection_string = os.environ.get(value, value)
-        return psycopg2.connect(connection_string)
+
+        if isinstance(value, dict) and 'pool' in value:
+            return dict(value['pool'] or {})
+        return None
+
+    def get_db_connection(self, connection_name: str) -> 'connection':
+        """
+        Open a connection by name. Pooled connections are checked out of the pool instead, and
+        calling close() on them returns them to the pool. When the connection is instrumented, the statements
+        run on it are recorded, see get_query_recorder.
+        """
+        if self.get_pool_options(connection_name) is not None:
+            conn = self.get_db_pool(connection_name).getconn()
+        else:
+            import psycopg2
+
+            conn = psycopg2.connect(self.get_connection_string(connection_name))
+
+        if self.is_instrumented(connection_name):
+            from rsterm.database.instrumentation import InstrumentedConnection
+
+            return InstrumentedConnection(conn, connection_name, self.get_query_recorder())
+        return conn
+
+    def get_db_pool(self, connection_name: str) -> 'ConnectionPool':
+        """
+        Returns: ConnectionPool the process wide pool for a connection name. Connections which have no
+                 pool section in the config get a pool with the default options.
+        """
+        from rsterm.database.pool import get_pool
+
+        connection_string = self.get_connection_string(connection_name)
+        options = self.get_pool_options(connection_name) or {}
+
+        def connect():
+            import psycopg2
+
+            return psycopg2.connect(connection_string)
+
+        return get_pool(f"{connection_name}:{connection_string}", connect, **options)
+
+    def get_async_db_connection(self, connection_name: str, max_workers: int = None) -> 'AsyncConnection':
+        """
+        Returns: AsyncConnection awaitable access to a connection, backed by its pool. The number of queries in flight
+                 is bounded by max_workers, which defaults to, and can not be more than, the max_size of the
+                 connection's pool, 5 unless set in its pool section.
+        """
+        from rsterm.database.async_connection import AsyncConnection
+
+        return AsyncConnection(self.get_db_pool(connection_name), max_workers=max_workers)
+
+    @contextmanager
+    def db_connection(self, connection_name: str) -> Iterator['connection']:
+        """
+        Context manager around get_db_connection, the connection is closed (or returned to its pool) on exit.
+        """
+        conn = self.get_db_connection(connection_name)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def close_db_pools() -> None:
+        # nothing to close if no pool was ever used
+        pool_module = sys.modules.get('rsterm.database.pool')
+
+        if pool_module is not None:
+            pool_module.close_pools()
+
+    @staticmethod
+    def close_instrumentation() -> None:
+        # nothing to close if no connection was ever instrumented
+        instrumentation = sys.modules.get('rsterm.database.instrumentation')
+
+        if instrumentation is not None:
+            instrumentation.close_recorders()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Returns: Dict[str, Any] the kwargs this config can be rebuilt from.
+        """
+        config = {'app': self.app, 'entrypoint_paths': self.entrypoint_paths, 'terminal': self.terminal}
+
+        for optional_kwarg in self.optional_kwargs:
+            if hasattr(self, f"_{optional_kwarg}"):
+                config[optional_kwarg] = getattr(self, f"_{optional_kwarg}")
+        return copy.deepcopy(config)
 
     @staticmethod
     def parse_config(config_path: Path, override: bool = False) -> 'RsTermConfig':
+        content = copy.deepcopy(read_config_file(config_path))
 
-        with config_path.open() as config_file:
-            if not override:
-                return RsTermConfig(**yaml.safe_load(config_file)['rsterm'])
-            else:
-                return yaml.safe_load(config_file)['rsterm']
+        if not override:
+            return RsTermConfig(**content)
+        else:
+            return content
+
+    @staticmethod
+    def load(config_path: Path) -> 'RsTermConfig':
+        """
+        Load a config with its override file applied. The merged result is memoized for the process, and
+        cached on disk keyed on the stat of the config and override files, so that a warm start does not parse
+        any yaml at all.
+        """
+        config_path = Path(config_path)
+        override_dir = Path.cwd().absolute()
+        memo_key = (config_path.absolute().as_posix(), override_dir.as_posix())
+        memo = _loaded_configs.get(memo_key)
+
+        if memo and sources_unchanged(memo[0]):
+            return RsTermConfig(**(json.loads(memo[1]) if isinstance(memo[1], str) else copy.deepcopy(memo[1])))
+
+        cache_path = config_cache_path(config_path, override_dir)
+        cached = read_config_cache(cache_path)
+
+        if cached is None:
+            rsterm = RsTermConfig.parse_config(config_path)
+            sources = [[memo_key[0], stat_key(config_path)]]
+
+            if rsterm.override_file:
+                override_path = override_dir / rsterm.override_file
+                sources.append([override_path.as_posix(), stat_key(override_path)])
+                rsterm = RsTermConfig.override_config(rsterm)
+
+            cached = (sources, rsterm.to_dict())
+            write_config_cache(cache_path, *cached)
+
+        try:
+            _loaded_configs[memo_key] = (cached[0], json.dumps(cached[1]))
+        except (TypeError, ValueError):
+            _loaded_configs[memo_key] = (cached[0], copy.deepcopy(cached[1]))
+
+        # cached was built for this call, so the memo is the only other copy
+        return RsTermConfig(**cached[1])
 
     @staticmethod
     def override_config(rsterm: 'RsTermConfig') -> 'RsTermConfig':
@@ -126,15 +598,28 @@ class RsTermConfig:
 
     @staticmethod
     def load_rsterm_env(rsterm: 'RsTermConfig') -> None:
+        """
+        Load the app's env file into the environment, once per process for as long as the file is unchanged. A
+        missing file is skipped without importing dotenv.
+        """
         env_file_path = Path().cwd() / rsterm.env_file_name
+        file_stat = stat_key(env_file_path)
+        key = (env_file_path.absolute().as_posix(), tuple(file_stat or ()))
+
+        if file_stat is None or key in _loaded_env_files:
+            return
+
+        from dotenv import load_dotenv
+
         load_dotenv(env_file_path)
+        _loaded_env_files.add(key)
 
-    def parse_nouns_and_verbs(self) -> Namespace:
+    def parse_nouns_and_verbs(self, args: List[str] = None) -> Namespace:
         arg_parser = ArgumentParser()
 
         for command, options in self.get_formatted_actions().items():
             arg_parser.add_argument(*command, **options)
-        return arg_parser.parse_args(sys.argv[1:3])
+        return arg_parser.parse_args(sys.argv[1:3] if args is None else args[:2])
 
     def get_formatted_actions(self) -> Dict[Tuple[str], Dict[str, Any]]:
         return {
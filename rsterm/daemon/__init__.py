@@ -0,0 +1,4 @@
+# flake8: noqa
+from .client import forward_command, stop_daemon
+from .server import DaemonServer
+from .daemon import run_daemon_option
@@ -0,0 +1,65 @@
+import os
+import sys
+import json
+import socket
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+
+def send_request(socket_path: Path, request: Dict[str, Any]) -> Optional[socket.socket]:
+    """
+    Returns: socket connected to the daemon with the request sent, or None if no daemon is listening.
+    """
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(socket_path.as_posix())
+        connection.sendall(json.dumps(request).encode() + b'\n')
+    except OSError:
+        connection.close()
+        return None
+    return connection
+
+
+def forward_command(socket_path: Path, args: List[str]) -> Optional[int]:
+    """
+    Run a command in the daemon, writing its output to this process's stdout and stderr as it arrives.
+
+    Returns: Optional[int] the exit code of the command, or None if no daemon is running, in which case
+             the command should be run in process.
+    """
+    request = {'argv': args, 'cwd': os.getcwd(), 'env': dict(os.environ)}
+    connection = send_request(socket_path, request)
+
+    if connection is None:
+        return None
+
+    streams = {'stdout': sys.stdout, 'stderr': sys.stderr}
+
+    with connection, connection.makefile('rb') as frames:
+        for line in frames:
+            frame = json.loads(line.decode())
+
+            if 'exit' in frame:
+                sys.stdout.flush()
+                return frame['exit']
+
+            stream = streams[frame['stream']]
+            stream.write(frame['data'])
+            stream.flush()
+
+    print("rsterm daemon closed the connection before the command completed", file=sys.stderr)
+    return 1
+
+
+def stop_daemon(socket_path: Path) -> bool:
+    """
+    Returns: bool True if a daemon was running and has been asked to stop.
+    """
+    connection = send_request(socket_path, {'command': 'stop'})
+
+    if connection is None:
+        return False
+
+    with connection:
+        connection.recv(1024)
+    return True
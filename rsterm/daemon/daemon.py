@@ -0,0 +1,23 @@
+from pathlib import Path
+from rsterm.configs.rsterm_config import RsTermConfig
+from rsterm.discovery.discovery import daemon_socket_path
+from rsterm.daemon.client import stop_daemon
+from rsterm.daemon.server import DaemonServer
+
+
+def run_daemon_option(config_path: Path, option: str) -> int:
+    """
+    Handle the --rsterm-serve and --rsterm-stop options of run_entry_point.
+    Returns: int exit code
+    """
+    socket_path = daemon_socket_path(RsTermConfig.load(config_path))
+
+    if option == '--rsterm-stop':
+        if stop_daemon(socket_path):
+            print("rsterm daemon stopped")
+            return 0
+        print("no rsterm daemon is running")
+        return 1
+
+    DaemonServer(config_path, socket_path).serve()
+    return 0
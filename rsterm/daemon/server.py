@@ -0,0 +1,155 @@
+import os
+import sys
+import json
+import signal
+import socket
+import traceback
+import socketserver
+from pathlib import Path
+from contextlib import redirect_stdout, redirect_stderr
+from typing import Any, Dict
+from rsterm.configs.rsterm_config import RsTermConfig
+from rsterm.discovery.discovery import dispatch, daemon_socket_path
+from rsterm.discovery.manifest import EntryPointManifest
+
+
+class FrameWriter:
+    """
+    File like object used in place of stdout / stderr while a command runs in the daemon. Every write is sent
+    to the client straight away as a json line, {"stream": "stdout", "data": "..."}
+    """
+
+    def __init__(self, connection: socket.socket, stream: str) -> None:
+        self.connection = connection
+        self.stream = stream
+        self.encoding = 'utf-8'
+
+    def write(self, data: str) -> int:
+        if data:
+            send_frame(self.connection, {'stream': self.stream, 'data': data})
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def isatty(self) -> bool:
+        return False
+
+
+def send_frame(connection: socket.socket, frame: Dict[str, Any]) -> None:
+    connection.sendall(json.dumps(frame).encode() + b'\n')
+
+
+class CommandHandler(socketserver.StreamRequestHandler):
+    """
+    Handles one request from a client. A request is a single json line, either
+    {"argv": ["verb", "noun", ...], "cwd": "/path", "env": {...}} to run a command, or {"command": "stop"}.
+    """
+
+    server: 'DaemonServer'
+
+    def handle(self) -> None:
+        try:
+            request = json.loads(self.rfile.readline().decode())
+        except ValueError:
+            send_frame(self.connection, {'exit': 2, 'error': 'invalid request'})
+            return
+
+        if request.get('command') == 'stop':
+            send_frame(self.connection, {'exit': 0})
+            self.server.stopping = True
+            return
+
+        send_frame(self.connection, {'exit': self.server.run_command(request, self.connection)})
+
+
+class DaemonServer(socketserver.UnixStreamServer):
+    """
+    Resident process which holds the parsed config, the entry point manifest, imported entry point modules and
+    pooled db connections, and runs commands sent to it over a unix socket. Commands are run one at a time, as
+    each one has the process's stdout, stderr, working directory and environment to itself while it runs.
+    """
+
+    def __init__(self, config_path: Path, socket_path: Path = None) -> None:
+        self.config_path = config_path
+        self.config = RsTermConfig.load(config_path)
+        self.socket_path = socket_path or daemon_socket_path(self.config)
+        self.stopping = False
+        # handle_request returns at least this often, so a SIGTERM is noticed
+        self.timeout = 1.0
+
+        self.socket_path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        remove_stale_socket(self.socket_path)
+
+        # the socket is created by bind, and must never be connectable by other users, even before the chmod
+        umask = os.umask(0o077)
+        try:
+            super().__init__(self.socket_path.as_posix(), CommandHandler)
+        finally:
+            os.umask(umask)
+        os.chmod(self.socket_path.as_posix(), 0o600)
+
+        # warm up, so the first command does not pay for discovery
+        EntryPointManifest.for_config(self.config)
+
+    def run_command(self, request: Dict[str, Any], connection: socket.socket) -> int:
+        cwd = os.getcwd()
+        environ = dict(os.environ)
+
+        try:
+            os.chdir(request.get('cwd', cwd))
+            if 'env' in request:
+                os.environ.clear()
+                os.environ.update(request['env'])
+
+            with redirect_stdout(FrameWriter(connection, 'stdout')), redirect_stderr(FrameWriter(connection, 'stderr')):
+                try:
+                    return dispatch(self.config_path, list(request.get('argv', [])))
+                except Exception:
+                    traceback.print_exc()
+                    return 1
+        finally:
+            os.chdir(cwd)
+            os.environ.clear()
+            os.environ.update(environ)
+
+    def serve(self) -> None:
+        def stop(signum, frame):
+            self.stopping = True
+
+        signal.signal(signal.SIGTERM, stop)
+        print(f"rsterm daemon for {self.config.app_name} listening on {self.socket_path}", file=sys.stderr)
+
+        try:
+            while not self.stopping:
+                self.handle_request()
+        finally:
+            self.server_close()
+            if self.socket_path.exists():
+                self.socket_path.unlink()
+            RsTermConfig.close_db_pools()
+            RsTermConfig.close_instrumentation()
+
+    def handle_error(self, request, client_address) -> None:
+        # a client which goes away mid command must not take the daemon down with it
+        traceback.print_exc()
+
+
+def remove_stale_socket(socket_path: Path) -> None:
+    """
+    Remove a socket file left behind by a daemon which is no longer running.
+    Raises: RuntimeError if a daemon is listening on the socket.
+    """
+    if not socket_path.exists():
+        return
+
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path.as_posix())
+    except OSError:
+        socket_path.unlink()
+        return
+    finally:
+        probe.close()
+
+    raise RuntimeError(f"a daemon is already listening on {socket_path}")
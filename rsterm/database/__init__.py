@@ -0,0 +1,9 @@
+# flake8: noqa
+from .pool import ConnectionPool, PooledConnection, get_pool, close_pools
+from .export import export_query, ExportResult, RollingFileWriter
+from .sql_runner import SqlScriptRunner, build_script_graph
+from .async_connection import AsyncConnection
+from .query_cache import QueryCache, QueryResult, cached_query, normalize_sql
+from .batches import fetch_batches
+from .bulk_load import BulkLoader, LoadResult
+from .instrumentation import QueryRecorder, QueryExporter, InstrumentedConnection
@@ -0,0 +1,90 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Sequence, TypeVar, TYPE_CHECKING
+from rsterm.database.pool import ConnectionPool
+
+if TYPE_CHECKING:
+    from psycopg2.extensions import connection
+
+T = TypeVar('T')
+
+
+class AsyncConnection:
+    """
+    Awaitable access to a named database connection. psycopg2 is blocking, so each call checks a connection out
+    of the connection's pool and runs on a worker thread, which lets a single command overlap many independent
+    queries. Use with the bounded helpers in rsterm.scheduler, for example
+
+    async with self.rsterm.get_async_db_connection('redshift', max_workers=10) as db:
+        counts = await map_bounded(lambda t: db.fetchone(f"select count(*) from {t}"), tables, limit=10)
+
+    Args:
+        pool:        ConnectionPool the connections are checked out of
+        max_workers: int queries run at once, defaults to the pool's max_size (5 unless set in the pool section of
+                     the connection). It can not be more than max_size, as every query holds a connection, and
+                     further workers would only wait for one, up to the pool's checkout_timeout
+    Raises: ValueError if max_workers is more than the pool's max_size
+    """
+
+    def __init__(self, pool: ConnectionPool, max_workers: int = None) -> None:
+        if max_workers is not None and not 1 <= max_workers <= pool.max_size:
+            raise ValueError(f"max_workers={max_workers} must be between 1 and the max_size={pool.max_size} of the "
+                             f"pool, raise max_size in the pool section of the connection to run more queries at once")
+
+        self.pool = pool
+        self.max_workers = max_workers or pool.max_size
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='rsterm-async-db')
+
+    async def run(self, func: Callable[['connection'], T]) -> T:
+        """
+        Run a blocking function with a pooled connection on a worker thread. The transaction is committed
+        if the function returns, and rolled back if it raises.
+        """
+        def call() -> T:
+            with self.pool.connection() as conn:
+                try:
+                    result = func(conn)
+                    conn.commit()
+                    return result
+                except Exception:
+                    conn.rollback()
+                    raise
+
+        return await asyncio.get_event_loop().run_in_executor(self._executor, call)
+
+    async def execute(self, sql: str, params: Sequence = None) -> int:
+        """
+        Returns: int the number of rows affected
+        """
+        def execute(conn: 'connection') -> int:
+            with conn.cursor() as cursor:
+                cursor.execute(sql, params)
+                return cursor.rowcount
+
+        return await self.run(execute)
+
+    async def fetchall(self, sql: str, params: Sequence = None) -> List[tuple]:
+        def fetchall(conn: 'connection') -> List[tuple]:
+            with conn.cursor() as cursor:
+                cursor.execute(sql, params)
+                return cursor.fetchall()
+
+        return await self.run(fetchall)
+
+    async def fetchone(self, sql: str, params: Sequence = None) -> Any:
+        def fetchone(conn: 'connection') -> Any:
+            with conn.cursor() as cursor:
+                cursor.execute(sql, params)
+                return cursor.fetchone()
+
+        return await self.run(fetchone)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+
+    async def __aenter__(self) -> 'AsyncConnection':
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        # waiting for the workers to finish, and their connections to be returned, blocks
+        await asyncio.get_event_loop().run_in_executor(None, self.close)
@@ -0,0 +1,186 @@
+import uuid
+from datetime import timezone
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Sequence, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from psycopg2.extensions import connection
+
+OUTPUTS = ('numpy', 'arrow', 'auto')
+
+# postgres / redshift type oids, as found in cursor.description, by the kind of array they are converted to
+TYPE_KINDS = {
+    16: 'bool',
+    20: 'int', 21: 'int', 23: 'int', 26: 'int',
+    700: 'float', 701: 'float',
+    1700: 'decimal',
+    18: 'string', 19: 'string', 25: 'string', 1042: 'string', 1043: 'string',
+    1082: 'date',
+    1114: 'timestamp',
+    1184: 'timestamptz'
+}
+
+# numpy dtypes of each kind, for columns without nulls. Ints with nulls become float64 with nan, and bools with
+# nulls stay objects. Decimals are converted to float64, use output='arrow' to keep their precision
+NUMPY_DTYPES = {
+    'bool': 'bool',
+    'int': 'int64',
+    'float': 'float64',
+    'decimal': 'float64',
+    'date': 'datetime64[D]',
+    'timestamp': 'datetime64[us]',
+    'timestamptz': 'datetime64[us]'
+}
+
+
+class BatchColumn(NamedTuple):
+    name: str
+    kind: str
+    precision: Optional[int] = None
+    scale: Optional[int] = None
+
+
+def describe_columns(description: Sequence[Sequence[Any]]) -> List[BatchColumn]:
+    """
+    Returns: List[BatchColumn] the name and kind of every column in a cursor description. Types which are not
+             mapped, such as json or uuid, are of kind object.
+    """
+    columns = []
+    for column in description:
+        precision = column[4] if len(column) > 4 else None
+        scale = column[5] if len(column) > 5 else None
+        columns.append(BatchColumn(column[0], TYPE_KINDS.get(column[1], 'object'), precision, scale))
+    return columns
+
+
+def import_numpy() -> Any:
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("fetching numpy batches requires the numpy package. pip install numpy")
+    return numpy
+
+
+def import_pyarrow() -> Any:
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("fetching arrow batches requires the pyarrow package. pip install pyarrow")
+    return pyarrow
+
+
+def to_utc(values: Sequence[Any]) -> List[Any]:
+    return [value.astimezone(timezone.utc).replace(tzinfo=None) if value is not None else None for value in values]
+
+
+def to_numpy_array(column: BatchColumn, values: Sequence[Any]) -> Any:
+    """
+    Returns: numpy.ndarray of the values of one column, typed by the kind of the column
+    """
+    numpy = import_numpy()
+    dtype = NUMPY_DTYPES.get(column.kind)
+    has_nulls = None in values
+
+    if column.kind == 'timestamptz':
+        # numpy has no time zones, so aware timestamps are converted to naive utc
+        values = to_utc(values)
+
+    if dtype is None or (has_nulls and column.kind == 'bool'):
+        array = numpy.empty(len(values), dtype=object)
+        array[:] = values
+        return array
+
+    if has_nulls and column.kind == 'int':
+        dtype = 'float64'
+
+    if has_nulls and dtype == 'float64':
+        # None is only read as nan for floats, when it is not mixed with decimals
+        values = [float('nan') if value is None else float(value) for value in values]
+
+    return numpy.array(values, dtype=dtype)
+
+
+def arrow_type(column: BatchColumn) -> Any:
+    """
+    Returns: pyarrow.DataType for the kind of a column, or None to let pyarrow infer it
+    """
+    pyarrow = import_pyarrow()
+
+    if column.kind == 'decimal':
+        if column.precision and 0 < column.precision <= 38:
+            return pyarrow.decimal128(column.precision, column.scale or 0)
+        return None
+
+    return {
+        'bool': pyarrow.bool_(),
+        'int': pyarrow.int64(),
+        'float': pyarrow.float64(),
+        'string': pyarrow.string(),
+        'date': pyarrow.date32(),
+        'timestamp': pyarrow.timestamp('us'),
+        'timestamptz': pyarrow.timestamp('us', tz='UTC')
+    }.get(column.kind)
+
+
+def to_record_batch(columns: List[BatchColumn], rows: List[Sequence[Any]]) -> Any:
+    """
+    Returns: pyarrow.RecordBatch of the rows
+    """
+    pyarrow = import_pyarrow()
+    values = list(zip(*rows)) if rows else [() for _ in columns]
+    arrays = [pyarrow.array(list(column_values), type=arrow_type(column))
+              for column, column_values in zip(columns, values)]
+    return pyarrow.RecordBatch.from_arrays(arrays, names=[column.name for column in columns])
+
+
+def to_numpy_batch(columns: List[BatchColumn], rows: List[Sequence[Any]]) -> Dict[str, Any]:
+    """
+    Returns: Dict[str, numpy.ndarray] column name -> array of the rows
+    """
+    values = list(zip(*rows)) if rows else [() for _ in columns]
+    return {column.name: to_numpy_array(column, column_values) for column, column_values in zip(columns, values)}
+
+
+def fetch_batches(conn: 'connection', sql: str, params: Sequence = None, batch_size: int = 10000,
+                  output: str = 'numpy') -> Iterator[Any]:
+    """
+    Run a query through a named server side cursor, and yield its result in batches of up to batch_size rows,
+    converted to arrays by the column types in the cursor description. Only one batch of rows is held in memory
+    at a time. numpy and pyarrow are imported when the first batch is converted.
+
+    Args:
+        conn:       connection to run the query on
+        sql:        str the query
+        params:     parameters of the query, as given to cursor.execute
+        batch_size: int rows fetched from the server, and converted, at a time
+        output:     str 'numpy' for dicts of column name -> numpy.ndarray, 'arrow' for pyarrow.RecordBatch, or
+                    'auto' for arrow when pyarrow is installed, and numpy otherwise
+
+    Returns: Iterator of batches. A query which returns no rows yields nothing.
+    """
+    if output not in OUTPUTS:
+        raise ValueError(f"unsupported output {output}, must be one of {list(OUTPUTS)}")
+
+    if output == 'auto':
+        try:
+            import pyarrow  # noqa: F401
+            output = 'arrow'
+        except ImportError:
+            output = 'numpy'
+
+    convert = to_record_batch if output == 'arrow' else to_numpy_batch
+
+    # a cursor outside of a transaction must be held open for the rows to be fetched
+    with conn.cursor(name=f"rsterm_batches_{uuid.uuid4().hex}", withhold=bool(conn.autocommit)) as cursor:
+        cursor.itersize = batch_size
+        cursor.execute(sql, params)
+        columns = None
+
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+
+            if columns is None:
+                # a named cursor only has a description once rows have been fetched
+                columns = describe_columns(cursor.description)
+            yield convert(columns, rows)
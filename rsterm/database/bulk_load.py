@@ -0,0 +1,456 @@
+import io
+import re
+import csv
+import json
+import time
+import uuid
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, NamedTuple, Optional, Sequence, Tuple, TYPE_CHECKING
+from rsterm.exceptions import BulkLoadError
+
+if TYPE_CHECKING:
+    from psycopg2.extensions import connection
+
+FORMATS = ('csv', 'jsonl')
+MODES = ('append', 'swap', 'merge')
+
+# bytes read at a time when looking for chunk boundaries
+BLOCK_SIZE = 1024 * 1024
+
+TABLE_NAME = re.compile(r'^[A-Za-z_][\w$]*(\.[A-Za-z_][\w$]*)?$')
+
+# a rejected record, with the number of the chunk it came from and why it was rejected
+Reject = Tuple[int, Any, str]
+
+
+class Chunk(NamedTuple):
+    number: int
+    start: int
+    end: int
+
+    @property
+    def size(self) -> int:
+        return self.end - self.start
+
+
+class LoadResult(NamedTuple):
+    table: str
+    rows: int
+    rejected: int
+    chunks: int
+    bytes: int
+    seconds: float
+    rejects_path: Optional[Path] = None
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else float(self.rows)
+
+    def summary(self) -> str:
+        summary = (f"loaded {self.rows} rows ({self.bytes} bytes) into {self.table} from {self.chunks} chunk(s) in "
+                   f"{self.seconds:.2f}s, {self.rows_per_second:.0f} rows/s, {self.rejected} rejected")
+        return f"{summary}, see {self.rejects_path}" if self.rejected and self.rejects_path else summary
+
+
+def find_boundaries(path: Path, chunk_bytes: int, start: int = 0, quote: Optional[bytes] = b'"') -> List[int]:
+    """
+    Split a file into ranges of about chunk_bytes, ending on a line break. For csv, a line break is only a record
+    boundary when it is not inside a quoted field, which is the case when the number of quotes before it is even,
+    as quotes inside a field are doubled.
+
+    Returns: List[int] offsets of the boundaries, from start to the size of the file
+    """
+    size = path.stat().st_size
+    boundaries = [start]
+
+    with path.open('rb') as input_file:
+        position, quotes = start, 0
+        target = start + chunk_bytes
+
+        while target < size:
+            input_file.seek(position)
+            if quote:
+                quotes += input_file.read(target - position).count(quote)
+            position = target
+            input_file.seek(position)
+
+            while position < size:
+                block = input_file.read(BLOCK_SIZE)
+                offset = block.find(b'\n')
+
+                while offset >= 0 and quote and (quotes + block.count(quote, 0, offset)) % 2:
+                    offset = block.find(b'\n', offset + 1)
+
+                if offset >= 0:
+                    if quote:
+                        quotes += block.count(quote, 0, offset + 1)
+                    position += offset + 1
+                    break
+
+                if quote:
+                    quotes += block.count(quote)
+                position += len(block)
+
+            if position >= size:
+                break
+            boundaries.append(position)
+            target = position + chunk_bytes
+
+    boundaries.append(size)
+    return boundaries
+
+
+def split_file(path: Path, chunk_bytes: int, file_format: str = 'csv', start: int = 0) -> List[Chunk]:
+    boundaries = find_boundaries(path, chunk_bytes, start, quote=b'"' if file_format == 'csv' else None)
+    chunks = [Chunk(number, begin, end) for number, (begin, end) in enumerate(zip(boundaries, boundaries[1:]))]
+    return [chunk for chunk in chunks if chunk.size > 0]
+
+
+class ChunkReader(io.RawIOBase):
+    """
+    Read only binary file over a byte range of a file, which is given to COPY FROM STDIN.
+    """
+
+    def __init__(self, path: Path, chunk: Chunk) -> None:
+        super().__init__()
+        self._file = path.open('rb')
+        self._file.seek(chunk.start)
+        self._remaining = chunk.size
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: Any) -> int:
+        data = self._file.read(min(len(buffer), self._remaining))
+        self._remaining -= len(data)
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self) -> None:
+        self._file.close()
+        super().close()
+
+
+def read_csv_header(path: Path) -> Tuple[List[str], int]:
+    """
+    Returns: Tuple[List[str], int] the column names in the first line of a csv file, and where the data starts
+    """
+    with path.open('rb') as input_file:
+        line = input_file.readline()
+    return next(csv.reader([line.decode()])), len(line)
+
+
+def read_jsonl_columns(path: Path) -> List[str]:
+    with path.open() as input_file:
+        for line in input_file:
+            if line.strip():
+                return list(json.loads(line))
+    return []
+
+
+def csv_field(value: Any) -> str:
+    # COPY reads an unquoted empty field as NULL, and a quoted one as an empty string, so every value but None is quoted
+    if value is None:
+        return ''
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def to_csv(records: Sequence[Sequence[Any]]) -> io.StringIO:
+    buffer = io.StringIO()
+    for record in records:
+        buffer.write(','.join(csv_field(value) for value in record) + '\n')
+    buffer.seek(0)
+    return buffer
+
+
+def split_csv_records(text: str) -> List[str]:
+    """
+    Split csv text into records as they were written, keeping quoted line breaks in their record, and quoted empty
+    fields apart from unquoted ones, which parsing the records would lose.
+    """
+    records, pending = [], ''
+    for line in text.splitlines(keepends=True):
+        pending += line
+        if pending.count('"') % 2 == 0:
+            if pending.strip():
+                records.append(pending)
+            pending = ''
+    if pending.strip():
+        records.append(pending)
+    return records
+
+
+def join_records(records: List[str]) -> io.StringIO:
+    return io.StringIO(''.join(record if record.endswith('\n') else record + '\n' for record in records))
+
+
+def validate_table_name(table: str) -> str:
+    if not TABLE_NAME.match(table):
+        raise ValueError(f"invalid table name {table}, must be [schema.]table")
+    return table
+
+
+def quote_identifier(name: str) -> str:
+    """
+    Quote a column name taken from a file, so that it is used as written, whatever its case or characters, and can
+    never be read as sql.
+    """
+    if not isinstance(name, str) or not name or '\x00' in name:
+        raise ValueError(f"invalid column name {name!r}")
+    return '"' + name.replace('"', '""') + '"'
+
+
+def quote_columns(columns: Sequence[str]) -> str:
+    return ', '.join(quote_identifier(column) for column in columns)
+
+
+class BulkLoader:
+    """
+    Loads a large csv or jsonl file into a table. The file is split into chunks, which are streamed through
+    COPY ... FROM STDIN into a staging table on several connections at once. When every chunk is loaded, the
+    staging table is appended to the target table, swapped with it, or merged into it on key columns, in a single
+    transaction, so the target table is never seen half loaded.
+
+    A chunk which COPY rejects is split in half, and each half loaded again, until the records it can not load are
+    found. Those are written to a rejects file, and the load fails if there are more than max_rejects of them.
+
+    COPY FROM STDIN is supported by postgres, but not by redshift, which only copies from s3.
+
+    Args:
+        connect:     Callable[[], connection] gives a connection to a worker, which closes it when a chunk is loaded.
+                     Use a pool's getconn to load on pooled connections.
+        jobs:        int chunks loaded at once
+        chunk_bytes: int approximate size of each chunk
+        max_rejects: int records which may be rejected before the load fails
+        verbose:     bool print each chunk as it is loaded, and a summary at the end
+    """
+
+    def __init__(self, connect: Callable[[], 'connection'],
+                 jobs: int = 4,
+                 chunk_bytes: int = 64 * 1024 * 1024,
+                 max_rejects: int = 0,
+                 verbose: bool = True) -> None:
+        self.connect = connect
+        self.jobs = jobs
+        self.chunk_bytes = chunk_bytes
+        self.max_rejects = max_rejects
+        self.verbose = verbose
+
+    def load(self, path: Path, table: str, file_format: str = None, header: bool = True, columns: List[str] = None,
+             mode: str = 'append', keys: List[str] = None, rejects_path: Path = None) -> LoadResult:
+        """
+        Args:
+            path:         Path of the csv or jsonl file
+            table:        str [schema.]table to load into
+            file_format:  str csv or jsonl, by default taken from the file extension
+            header:       bool the first line of a csv file holds the column names
+            columns:      List[str] columns to load, by default the csv header, the keys of the first jsonl record,
+                          or every column of the table for a csv file without a header. Names are quoted, so they
+                          must match the case of the table's columns
+            mode:         str append the rows to the table, swap the rows of the table for the loaded rows, or
+                          merge the rows into the table, replacing those with the same keys
+            keys:         List[str] key columns for a merge
+            rejects_path: Path where rejected records are written as jsonl, by default next to the file
+
+        Returns: LoadResult
+        Raises:  BulkLoadError when more than max_rejects records are rejected, and the table is left as it was
+        """
+        path = Path(path)
+        file_format = file_format or path.suffix.lstrip('.').lower()
+        validate_table_name(table)
+
+        if file_format not in FORMATS:
+            raise ValueError(f"unsupported format {file_format}, must be one of {list(FORMATS)}")
+        if mode not in MODES:
+            raise ValueError(f"unsupported mode {mode}, must be one of {list(MODES)}")
+        if mode == 'merge' and not keys:
+            raise ValueError("a merge needs the key columns to match rows on")
+
+        start = 0
+        if file_format == 'csv' and header:
+            header_columns, start = read_csv_header(path)
+            columns = columns or header_columns
+        elif file_format == 'jsonl':
+            columns = columns or read_jsonl_columns(path)
+
+        # checked before any sql is run, as the names are quoted into it
+        quote_columns((columns or []) + (keys or []))
+
+        began = time.perf_counter()
+        chunks = split_file(path, self.chunk_bytes, file_format, start)
+        staging = self.create_staging(table)
+
+        try:
+            rows, rejects = self.load_chunks(path, chunks, staging, file_format, columns)
+            rejects_path = Path(rejects_path) if rejects_path else path.with_name(f"{path.name}.rejects")
+
+            if rejects:
+                self.write_rejects(rejects_path, rejects)
+
+            if len(rejects) > self.max_rejects:
+                raise BulkLoadError(f"{len(rejects)} records were rejected, more than the {self.max_rejects} allowed. "
+                                    f"see {rejects_path}")
+
+            self.finish(table, staging, mode, columns, keys)
+        except BaseException:
+            self.drop_staging(staging)
+            raise
+
+        result = LoadResult(table, rows, len(rejects), len(chunks), path.stat().st_size - start,
+                            time.perf_counter() - began, rejects_path if rejects else None)
+        if self.verbose:
+            print(result.summary())
+        return result
+
+    def execute(self, statements: List[str]) -> None:
+        """
+        Run statements in a single transaction.
+        """
+        conn = self.connect()
+        try:
+            with conn.cursor() as cursor:
+                for statement in statements:
+                    cursor.execute(statement)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def create_staging(self, table: str) -> str:
+        staging = f"{table}_rsterm_staging_{uuid.uuid4().hex[:8]}"
+        self.execute([f"CREATE TABLE {staging} (LIKE {table} INCLUDING DEFAULTS)"])
+        return staging
+
+    def drop_staging(self, staging: str) -> None:
+        try:
+            self.execute([f"DROP TABLE IF EXISTS {staging}"])
+        except Exception:
+            # the original error matters more
+            pass
+
+    def finish(self, table: str, staging: str, mode: str, columns: Optional[List[str]], keys: Optional[List[str]]):
+        column_list = f" ({quote_columns(columns)})" if columns else ''
+        select = quote_columns(columns) if columns else '*'
+        insert = f"INSERT INTO {table}{column_list} SELECT {select} FROM {staging}"
+
+        if mode == 'append':
+            statements = [insert, f"DROP TABLE {staging}"]
+
+        elif mode == 'merge':
+            matches = ' AND '.join(f"{table}.{quote_identifier(key)} = {staging}.{quote_identifier(key)}" for key in keys)
+            statements = [f"DELETE FROM {table} USING {staging} WHERE {matches}", insert, f"DROP TABLE {staging}"]
+
+        else:
+            # truncated and refilled rather than renamed, which keeps the indexes, constraints, grants and dependent
+            # views of the table. TRUNCATE is transactional, readers wait for the commit instead of seeing it empty
+            statements = [f"TRUNCATE {table}", insert, f"DROP TABLE {staging}"]
+
+        self.execute(statements)
+
+    def load_chunks(self, path: Path, chunks: List[Chunk], staging: str, file_format: str,
+                    columns: Optional[List[str]]) -> Tuple[int, List[Reject]]:
+        copy_sql = f"COPY {staging}{' (' + quote_columns(columns) + ')' if columns else ''} FROM STDIN WITH CSV"
+
+        def load(chunk: Chunk) -> Tuple[int, List[Reject]]:
+            start = time.perf_counter()
+            conn = self.connect()
+            try:
+                if file_format == 'csv':
+                    rows, rejects = self.load_csv_chunk(conn, path, chunk, copy_sql)
+                else:
+                    rows, rejects = self.load_jsonl_chunk(conn, path, chunk, copy_sql, columns)
+            finally:
+                conn.close()
+
+            if self.verbose:
+                print(f"[chunk {chunk.number}] {rows} rows in {time.perf_counter() - start:.2f}s, "
+                      f"{len(rejects)} rejected")
+            return rows, rejects
+
+        total, rejects = 0, []
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            for rows, chunk_rejects in executor.map(load, chunks):
+                total += rows
+                rejects.extend(chunk_rejects)
+        return total, rejects
+
+    @staticmethod
+    def copy(conn: 'connection', copy_sql: str, data: Any) -> int:
+        with conn.cursor() as cursor:
+            cursor.copy_expert(copy_sql, data)
+            rows = cursor.rowcount
+        conn.commit()
+        return rows
+
+    def copy_records(self, conn: 'connection', copy_sql: str, records: List[Any], chunk: Chunk,
+                     serialize: Callable[[List[Any]], io.StringIO]) -> Tuple[int, List[Reject]]:
+        """
+        COPY records, splitting them in half whenever COPY rejects them, until the records it can not load are found.
+
+        Returns: Tuple[int, List[Reject]] the rows loaded, and the rejected records
+        """
+        import psycopg2
+
+        pending, rows, rejects = [records], 0, []
+
+        while pending:
+            part = pending.pop()
+            if not part:
+                continue
+            try:
+                rows += self.copy(conn, copy_sql, serialize(part))
+            except (psycopg2.DataError, psycopg2.IntegrityError) as error:
+                conn.rollback()
+                if len(part) == 1:
+                    rejects.append((chunk.number, part[0], str(error).strip()))
+                else:
+                    middle = len(part) // 2
+                    pending.extend([part[middle:], part[:middle]])
+        return rows, rejects
+
+    def load_csv_chunk(self, conn: 'connection', path: Path, chunk: Chunk, copy_sql: str) -> Tuple[int, List[Reject]]:
+        import psycopg2
+
+        try:
+            with ChunkReader(path, chunk) as reader:
+                return self.copy(conn, copy_sql, reader), []
+        except (psycopg2.DataError, psycopg2.IntegrityError):
+            conn.rollback()
+
+        with io.TextIOWrapper(io.BufferedReader(ChunkReader(path, chunk)), newline='') as reader:
+            records = split_csv_records(reader.read())
+        rows, rejects = self.copy_records(conn, copy_sql, records, chunk, join_records)
+        return rows, [(number, record.rstrip('\r\n'), error) for number, record, error in rejects]
+
+    def load_jsonl_chunk(self, conn: 'connection', path: Path, chunk: Chunk, copy_sql: str,
+                         columns: List[str]) -> Tuple[int, List[Reject]]:
+        records, rejects = [], []
+
+        with io.TextIOWrapper(io.BufferedReader(ChunkReader(path, chunk))) as reader:
+            for line in reader:
+                if not line.strip():
+                    continue
+                try:
+                    document = json.loads(line)
+                    records.append([self.csv_value(document.get(column)) for column in columns])
+                except (ValueError, AttributeError) as error:
+                    rejects.append((chunk.number, line.rstrip('\n'), f"invalid json object: {error}"))
+
+        rows, copy_rejects = self.copy_records(conn, copy_sql, records, chunk, to_csv)
+        return rows, rejects + copy_rejects
+
+    @staticmethod
+    def csv_value(value: Any) -> Any:
+        # nested values are loaded as json text, null is left as None for to_csv to write as NULL
+        if isinstance(value, (dict, list)):
+            return json.dumps(value)
+        return value
+
+    @staticmethod
+    def write_rejects(rejects_path: Path, rejects: List[Reject]) -> None:
+        with rejects_path.open('w') as rejects_file:
+            for chunk_number, record, error in rejects:
+                rejects_file.write(json.dumps({'chunk': chunk_number, 'record': record, 'error': error}) + '\n')
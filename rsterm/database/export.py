@@ -0,0 +1,270 @@
+import io
+import csv
+import gzip
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, List, NamedTuple, Optional, Sequence, Union, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from psycopg2.extensions import connection
+
+COMPRESSION_EXTENSIONS = {
+    None: '',
+    'gzip': '.gz',
+    'zstd': '.zst'
+}
+
+
+class ExportResult(NamedTuple):
+    files: List[Path]
+    rows: int
+    bytes: int
+    seconds: float
+    method: str
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else float(self.rows)
+
+    def summary(self) -> str:
+        return (f"exported {self.rows} rows ({self.bytes} bytes) to {len(self.files)} file(s) "
+                f"in {self.seconds:.2f}s, {self.rows_per_second:.0f} rows/s using {self.method}")
+
+
+def open_output(path: Path, compression: Optional[str]) -> Any:
+    """
+    Returns: a binary file like object for the path, with the requested compression applied.
+    """
+    if compression is None:
+        return path.open('wb')
+
+    if compression == 'gzip':
+        return gzip.open(path.as_posix(), 'wb')
+
+    if compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("zstd compression requires the zstandard package. pip install zstandard")
+        return zstandard.ZstdCompressor().stream_writer(path.open('wb'))
+
+    raise ValueError(f"unsupported compression {compression}, must be one of {list(COMPRESSION_EXTENSIONS)}")
+
+
+class RollingFileWriter:
+    """
+    Write only file like object which splits what is written to it into a series of files, rolling over to the next
+    file once max_bytes (uncompressed) or max_rows is reached. Each call to write is treated as a single row, which
+    is how psycopg2 hands over the output of COPY TO STDOUT. When header is set, the first row written is repeated
+    at the top of every file.
+
+    Files are named <prefix>_00000.<extension>[.gz|.zst] in output_dir.
+    """
+
+    def __init__(self, output_dir: Path,
+                 prefix: str,
+                 extension: str = 'csv',
+                 max_bytes: int = None,
+                 max_rows: int = None,
+                 compression: str = None,
+                 header: bool = True,
+                 on_roll: Callable[[Path, int], None] = None) -> None:
+
+        if compression not in COMPRESSION_EXTENSIONS:
+            raise ValueError(f"unsupported compression {compression}, must be one of {list(COMPRESSION_EXTENSIONS)}")
+
+        self.output_dir = Path(output_dir)
+        self.prefix = prefix
+        self.extension = extension
+        self.max_bytes = max_bytes
+        self.max_rows = max_rows
+        self.compression = compression
+        self.header = header
+        self.on_roll = on_roll
+
+        self.files: List[Path] = []
+        self.rows = 0
+        self.bytes = 0
+
+        self._header_row: Optional[bytes] = None
+        self._file = None
+        self._file_rows = 0
+        self._file_bytes = 0
+
+    def write(self, data: Union[bytes, str]) -> int:
+        if isinstance(data, str):
+            data = data.encode()
+
+        if self.header and self._header_row is None:
+            self._header_row = data
+            return len(data)
+
+        if self._file is None or self._is_full():
+            self._roll()
+
+        self._file.write(data)
+        self._file_rows += 1
+        self._file_bytes += len(data)
+        self.rows += 1
+        self.bytes += len(data)
+        return len(data)
+
+    @property
+    def started(self) -> bool:
+        """
+        Returns: bool True once anything, even just the header, has been written
+        """
+        return self._header_row is not None or bool(self.files)
+
+    def close(self) -> None:
+        if self._file is None and self._header_row is not None and not self.files:
+            # a query with no rows still produces a file with its header
+            self._roll()
+        self._close_current()
+
+    def __enter__(self) -> 'RollingFileWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def remove_files(self) -> None:
+        on_roll, self.on_roll = self.on_roll, None
+        self._close_current()
+        self.on_roll = on_roll
+        for path in self.files:
+            if path.exists():
+                path.unlink()
+        self.files, self.rows, self.bytes = [], 0, 0
+
+    def _is_full(self) -> bool:
+        if self.max_rows is not None and self._file_rows >= self.max_rows:
+            return True
+        return self.max_bytes is not None and self._file_bytes >= self.max_bytes
+
+    def _roll(self) -> None:
+        self._close_current()
+
+        file_name = f"{self.prefix}_{len(self.files):05d}.{self.extension}{COMPRESSION_EXTENSIONS[self.compression]}"
+        path = self.output_dir / file_name
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+
+        self._file = open_output(path, self.compression)
+        self._file_rows = 0
+        self._file_bytes = 0
+        self.files.append(path)
+
+        if self._header_row is not None:
+            self._file.write(self._header_row)
+
+    def _close_current(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+            if self.on_roll:
+                self.on_roll(self.files[-1], self._file_rows)
+
+
+def export_copy(conn: 'connection', sql: str, writer: RollingFileWriter, params: Sequence = None) -> None:
+    """
+    Stream a query through COPY (...) TO STDOUT into the writer. Memory use is bounded to a single row.
+    """
+    with conn.cursor() as cursor:
+        query = cursor.mogrify(sql, params).decode() if params else sql
+        cursor.copy_expert(f"COPY ({query.rstrip().rstrip(';')}) TO STDOUT WITH CSV HEADER", writer)
+
+
+def export_cursor(conn: 'connection', sql: str, writer: RollingFileWriter, params: Sequence = None,
+                  fetch_size: int = 10000) -> None:
+    """
+    Stream a query through a named server side cursor into the writer, for servers which do not
+    support COPY TO STDOUT, such as Redshift. Memory use is bounded to fetch_size rows.
+    """
+    buffer = io.StringIO()
+    csv_writer = csv.writer(buffer, lineterminator='\n')
+
+    def write_row(row: Sequence) -> None:
+        csv_writer.writerow(row)
+        writer.write(buffer.getvalue())
+        buffer.seek(0)
+        buffer.truncate()
+
+    with conn.cursor(name=f"rsterm_export_{uuid.uuid4().hex}") as cursor:
+        cursor.itersize = fetch_size
+        cursor.execute(sql, params)
+        header_written = False
+
+        for row in cursor:
+            if not header_written:
+                write_row([column[0] for column in cursor.description])
+                header_written = True
+            write_row(row)
+
+        if not header_written and cursor.description:
+            write_row([column[0] for column in cursor.description])
+
+
+def export_query(conn: 'connection', sql: str, output_dir: Path,
+                 prefix: str = 'export',
+                 params: Sequence = None,
+                 max_bytes: int = None,
+                 max_rows: int = None,
+                 compression: str = None,
+                 method: str = 'auto',
+                 fetch_size: int = 10000,
+                 on_roll: Callable[[Path, int], None] = None) -> ExportResult:
+    """
+    Export the result of a query to csv files in output_dir, using constant memory.
+
+    Args:
+        conn:        connection to run the query on
+        sql:         str the select statement to export
+        output_dir:  Path directory the files are written to
+        prefix:      str file name prefix
+        params:      Sequence query parameters
+        max_bytes:   int roll over to a new file after this many (uncompressed) bytes
+        max_rows:    int roll over to a new file after this many rows
+        compression: str None, 'gzip' or 'zstd'
+        method:      str 'copy' for COPY TO STDOUT, 'cursor' for a server side cursor, or 'auto' to try
+                     COPY first and fall back to a cursor when the server does not support it
+        fetch_size:  int rows fetched per round trip by the server side cursor
+        on_roll:     Callable[[Path, int], None] called with each finished file and its row count
+
+    Returns: ExportResult
+    Raises:  the error of the query, once every file of the export, finished or not, has been removed. With
+             method auto, the query is only run again through a cursor if COPY failed before writing anything
+    """
+    if method not in ('auto', 'copy', 'cursor'):
+        raise ValueError(f"unsupported export method {method}, must be one of auto, copy or cursor")
+
+    writer = RollingFileWriter(output_dir, prefix, max_bytes=max_bytes, max_rows=max_rows,
+                               compression=compression, on_roll=on_roll)
+    start = time.perf_counter()
+    used = 'cursor' if method == 'cursor' else 'copy'
+
+    try:
+        if used == 'copy':
+            import psycopg2
+
+            try:
+                export_copy(conn, sql, writer, params)
+            except psycopg2.Error:
+                if method == 'copy' or writer.started:
+                    # COPY is supported and the query failed part way, running it again could repeat what was written
+                    raise
+
+                conn.rollback()
+                used = 'cursor'
+
+        if used == 'cursor':
+            export_cursor(conn, sql, writer, params, fetch_size=fetch_size)
+
+        writer.close()
+    except BaseException:
+        # no partial export is left behind, and the open file is closed
+        writer.remove_files()
+        raise
+
+    return ExportResult(writer.files, writer.rows, writer.bytes, time.perf_counter() - start, used)
@@ -0,0 +1,506 @@
+import os
+import re
+import sys
+import json
+import time
+import socket
+import threading
+from pathlib import Path
+from functools import lru_cache
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple, Union, TYPE_CHECKING
+from rsterm.database.query_cache import normalize_sql
+from rsterm.profiler.accounting import CommandScope, current_command
+
+if TYPE_CHECKING:
+    from psycopg2.extensions import connection, cursor
+
+# string and numeric literals, replaced with ? so that statements differing only in their values are counted together
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+PROMETHEUS_LINE = re.compile(r'^(\w+)\{(.*)\} (\S+)$')
+
+PROMETHEUS_METRICS = {
+    'rsterm_queries_total': 'Statements run by rsterm commands',
+    'rsterm_query_seconds_total': 'Seconds spent running statements',
+    'rsterm_query_rows_total': 'Rows affected or fetched by statements',
+    'rsterm_query_errors_total': 'Statements which raised an error',
+    'rsterm_slow_queries_total': 'Statements slower than the slow query threshold'
+}
+
+# process wide recorders, keyed on app name and instrumentation settings
+_recorders: Dict[str, 'QueryRecorder'] = {}
+_recorders_lock = threading.Lock()
+
+
+@lru_cache(maxsize=1024)
+def normalize_statement(sql: str) -> str:
+    """
+    Returns: str the sql with comments removed, whitespace collapsed and literals replaced with ?
+    """
+    return LITERALS.sub('?', normalize_sql(sql))
+
+
+class QueryRecord(NamedTuple):
+    connection: str
+    statement: str
+    seconds: float
+    rows: int
+    operation: str = 'execute'
+    failed: bool = False
+
+
+class StatementStats:
+    """
+    Running totals of a normalized statement on a connection.
+    """
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.rows = 0
+        self.errors = 0
+        self.slow = 0
+
+    def add(self, record: QueryRecord, slow: bool) -> None:
+        self.count += 1
+        self.seconds += record.seconds
+        self.max_seconds = max(self.max_seconds, record.seconds)
+        self.rows += record.rows
+        self.errors += record.failed
+        self.slow += slow
+
+
+class QueryExporter:
+    """
+    Hook for sending query metrics elsewhere. on_query is called as each statement finishes, on_command once
+    a command has finished, with the totals of every statement it ran, and close when instrumentation is torn down.
+    """
+
+    def on_query(self, record: QueryRecord, slow: bool) -> None:
+        pass
+
+    def on_command(self, command: str, stats: Dict[Tuple[str, str], StatementStats]) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class QueryRecorder:
+    """
+    Collects the statements run on instrumented connections, writes those slower than slow_seconds to a jsonl
+    slow query log, and keeps totals by connection and normalized statement until the command finishes. Totals are
+    kept per command, see rsterm.profiler.accounting.command_scope, so that commands run at once by
+    --rsterm-batch --jobs or the daemon each only summarize their own statements.
+
+    Args:
+        slow_seconds:   float statements taking longer than this are slow, None for no slow query log
+        slow_log_path:  Path of the slow query log
+        print_summary:  bool print the statements which took the most time to stderr when a command finishes
+        exporters:      List[QueryExporter] sent every statement, and the totals of every command
+    """
+
+    def __init__(self, slow_seconds: Optional[float] = 1.0, slow_log_path: Path = None, print_summary: bool = True,
+                 exporters: List[QueryExporter] = None) -> None:
+        self.slow_seconds = slow_seconds
+        self.slow_log_path = slow_log_path
+        self.print_summary = print_summary
+        self.exporters = list(exporters or [])
+        # command -> (connection, statement) -> totals
+        self._stats: Dict[Optional[CommandScope], Dict[Tuple[str, str], StatementStats]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def stats(self) -> Dict[Tuple[str, str], StatementStats]:
+        """
+        Returns: Dict[Tuple[str, str], StatementStats] the totals of the command running in this context so far
+        """
+        with self._lock:
+            return dict(self._stats.get(current_command(), {}))
+
+    def add_exporter(self, exporter: QueryExporter) -> None:
+        self.exporters.append(exporter)
+
+    def record(self, connection_name: str, sql: str, seconds: float, rows: int, operation: str = 'execute',
+               failed: bool = False) -> QueryRecord:
+        record = QueryRecord(connection_name, normalize_statement(sql), seconds, max(rows, 0), operation, failed)
+        slow = self.slow_seconds is not None and seconds >= self.slow_seconds
+
+        with self._lock:
+            stats = self._stats.setdefault(current_command(), {})
+            stats.setdefault((connection_name, record.statement), StatementStats()).add(record, slow)
+
+        if slow and self.slow_log_path is not None:
+            self.write_slow_query(record)
+        for exporter in self.exporters:
+            exporter.on_query(record, slow)
+        return record
+
+    def write_slow_query(self, record: QueryRecord) -> None:
+        entry = dict(record._asdict(), timestamp=datetime.now(timezone.utc).isoformat(), pid=os.getpid())
+        try:
+            self.slow_log_path.parent.mkdir(parents=True, exist_ok=True)
+            with self.slow_log_path.open('a') as slow_log:
+                slow_log.write(json.dumps(entry) + '\n')
+        except OSError as error:
+            print(f"[rsterm] could not write the slow query log {self.slow_log_path}: {error}", file=sys.stderr)
+
+    def finish_command(self, command: str) -> Dict[Tuple[str, str], StatementStats]:
+        """
+        Print the summary of the command running in this context, which has finished, hand its totals to the
+        exporters, and forget them.
+
+        Returns: Dict[Tuple[str, str], StatementStats] (connection, statement) -> totals of the command
+        """
+        with self._lock:
+            stats = self._stats.pop(current_command(), {})
+
+        if stats:
+            if self.print_summary:
+                print(format_summary(command, stats, self.slow_seconds), file=sys.stderr)
+            for exporter in self.exporters:
+                exporter.on_command(command, stats)
+        return stats
+
+    def close(self) -> None:
+        for exporter in self.exporters:
+            exporter.close()
+
+
+def format_summary(command: str, stats: Dict[Tuple[str, str], StatementStats], slow_seconds: float = None,
+                   limit: int = 10, width: int = 80) -> str:
+    """
+    Returns: str a table of the statements which took the most time, after a line of totals
+    """
+    count = sum(statement.count for statement in stats.values())
+    seconds = sum(statement.seconds for statement in stats.values())
+    slow = sum(statement.slow for statement in stats.values())
+    threshold = f" (over {slow_seconds * 1000:g}ms)" if slow_seconds is not None else ''
+
+    lines = [f"{command}: {count} statement(s) in {seconds:.3f}s, {slow} slow{threshold}",
+             f"{'count':>7}  {'total ms':>10}  {'max ms':>9}  {'rows':>9}  {'connection':<12}  statement"]
+
+    ranked = sorted(stats.items(), key=lambda item: item[1].seconds, reverse=True)
+    for (connection_name, statement), totals in ranked[:limit]:
+        text = statement if len(statement) <= width else f"{statement[:width - 3]}..."
+        lines.append(f"{totals.count:7d}  {totals.seconds * 1000:10.2f}  {totals.max_seconds * 1000:9.2f}  "
+                     f"{totals.rows:9d}  {connection_name:<12}  {text}")
+
+    if len(ranked) > limit:
+        lines.append(f"... and {len(ranked) - limit} more statement(s)")
+    return '\n'.join(lines)
+
+
+def statement_text(query: Any, cursor: 'cursor') -> str:
+    if isinstance(query, bytes):
+        return query.decode(errors='replace')
+    if hasattr(query, 'as_string'):
+        # psycopg2.sql.Composed
+        return query.as_string(cursor)
+    return str(query)
+
+
+class InstrumentedCursor:
+    """
+    Proxy around a cursor which records the time and rows of every statement it runs. Rows fetched through a named,
+    server side, cursor are recorded as fetches of its statement, as that is when the query does its work.
+    Everything else is delegated to the real cursor.
+    """
+
+    def __init__(self, cursor: 'cursor', connection_name: str, recorder: QueryRecorder) -> None:
+        self._cursor = cursor
+        self._connection_name = connection_name
+        self._recorder = recorder
+        self._statement = ''
+
+    def __getattr__(self, item: str) -> Any:
+        return getattr(self._cursor, item)
+
+    def __setattr__(self, key: str, value: Any) -> None:
+        # such as itersize, which must reach the real cursor
+        if key.startswith('_'):
+            object.__setattr__(self, key, value)
+        else:
+            setattr(self._cursor, key, value)
+
+    def __enter__(self) -> 'InstrumentedCursor':
+        self._cursor.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> Any:
+        return self._cursor.__exit__(exc_type, exc_val, exc_tb)
+
+    def __iter__(self) -> Any:
+        return iter(self._cursor)
+
+    def _timed(self, statement: str, operation: str, func: Callable, *args, **kwargs) -> Any:
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = func(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            rows = self._cursor.rowcount if isinstance(self._cursor.rowcount, int) else -1
+            self._recorder.record(self._connection_name, statement, time.perf_counter() - start, rows, operation,
+                                  failed)
+
+    def execute(self, query: Any, vars: Any = None) -> Any:
+        self._statement = statement_text(query, self._cursor)
+        return self._timed(self._statement, 'execute', self._cursor.execute, query, vars)
+
+    def executemany(self, query: Any, vars_list: Any) -> Any:
+        self._statement = statement_text(query, self._cursor)
+        return self._timed(self._statement, 'executemany', self._cursor.executemany, query, vars_list)
+
+    def callproc(self, procname: str, *args) -> Any:
+        return self._timed(f"CALL {procname}", 'callproc', self._cursor.callproc, procname, *args)
+
+    def copy_expert(self, sql: Any, file: Any, *args) -> Any:
+        return self._timed(statement_text(sql, self._cursor), 'copy', self._cursor.copy_expert, sql, file, *args)
+
+    def copy_from(self, file: Any, table: str, *args, **kwargs) -> Any:
+        return self._timed(f"COPY {table} FROM STDIN", 'copy', self._cursor.copy_from, file, table, *args, **kwargs)
+
+    def copy_to(self, file: Any, table: str, *args, **kwargs) -> Any:
+        return self._timed(f"COPY {table} TO STDOUT", 'copy', self._cursor.copy_to, file, table, *args, **kwargs)
+
+    def _fetch(self, func: Callable, *args) -> Any:
+        if not getattr(self._cursor, 'name', None):
+            # a client side cursor already holds every row once execute returns
+            return func(*args)
+
+        start = time.perf_counter()
+        result = func(*args)
+        rows = len(result) if isinstance(result, list) else int(result is not None)
+        self._recorder.record(self._connection_name, self._statement, time.perf_counter() - start, rows, 'fetch')
+        return result
+
+    def fetchone(self) -> Any:
+        return self._fetch(self._cursor.fetchone)
+
+    def fetchmany(self, *args) -> Any:
+        return self._fetch(self._cursor.fetchmany, *args)
+
+    def fetchall(self) -> Any:
+        return self._fetch(self._cursor.fetchall)
+
+
+class InstrumentedConnection:
+    """
+    Proxy around a connection, or a PooledConnection, whose cursors are InstrumentedCursors. Everything else,
+    close included, is delegated to the real connection.
+    """
+
+    def __init__(self, conn: 'connection', connection_name: str, recorder: QueryRecorder) -> None:
+        self._conn = conn
+        self._connection_name = connection_name
+        self._recorder = recorder
+
+    def __getattr__(self, item: str) -> Any:
+        return getattr(self._conn, item)
+
+    def __setattr__(self, key: str, value: Any) -> None:
+        # such as autocommit, which must reach the real connection
+        if key.startswith('_'):
+            object.__setattr__(self, key, value)
+        else:
+            setattr(self._conn, key, value)
+
+    def __enter__(self) -> 'InstrumentedConnection':
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> Any:
+        return self._conn.__exit__(exc_type, exc_val, exc_tb)
+
+    def cursor(self, *args, **kwargs) -> InstrumentedCursor:
+        return InstrumentedCursor(self._conn.cursor(*args, **kwargs), self._connection_name, self._recorder)
+
+
+class StatsdExporter(QueryExporter):
+    """
+    Sends a timer per statement, tagged by connection, and counters of the statements and slow statements of each
+    command, to a statsd server over udp. Metrics are buffered into packets of up to max_packet bytes, and any
+    left are sent when the command finishes. Sending never raises, as metrics must not fail a command.
+    """
+
+    def __init__(self, host: str = 'localhost', port: int = 8125, prefix: str = 'rsterm',
+                 max_packet: int = 1400) -> None:
+        self.address = (host, int(port))
+        self.prefix = prefix
+        self.max_packet = max_packet
+        self._buffer: List[str] = []
+        self._size = 0
+        self._lock = threading.Lock()
+        self._socket: Optional[socket.socket] = None
+
+    @staticmethod
+    def metric_name(name: str) -> str:
+        return re.sub(r'[^\w.-]', '_', name)
+
+    def on_query(self, record: QueryRecord, slow: bool) -> None:
+        connection_name = self.metric_name(record.connection)
+        self.add(f"{self.prefix}.query.{connection_name}:{record.seconds * 1000:.3f}|ms")
+        if record.failed:
+            self.add(f"{self.prefix}.query_errors.{connection_name}:1|c")
+
+    def on_command(self, command: str, stats: Dict[Tuple[str, str], StatementStats]) -> None:
+        command = self.metric_name(command)
+        self.add(f"{self.prefix}.command.{command}.queries:{sum(s.count for s in stats.values())}|c")
+        self.add(f"{self.prefix}.command.{command}.slow_queries:{sum(s.slow for s in stats.values())}|c")
+        self.flush()
+
+    def add(self, line: str) -> None:
+        with self._lock:
+            if self._buffer and self._size + len(line) + 1 > self.max_packet:
+                self._send()
+            self._buffer.append(line)
+            self._size += len(line) + 1
+
+    def flush(self) -> None:
+        with self._lock:
+            self._send()
+
+    def close(self) -> None:
+        with self._lock:
+            self._send()
+            if self._socket is not None:
+                self._socket.close()
+                self._socket = None
+
+    def _send(self) -> None:
+        lines, self._buffer, self._size = self._buffer, [], 0
+        if not lines:
+            return
+        try:
+            if self._socket is None:
+                self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._socket.sendto('\n'.join(lines).encode(), self.address)
+        except OSError:
+            pass
+
+
+class PrometheusExporter(QueryExporter):
+    """
+    Adds the totals of each command, labelled by app, command and connection, to counters in a file for the node
+    exporter's textfile collector. The file is rewritten atomically, under a lock, so that commands finishing at
+    the same time in different processes all get counted. Counts are written as integers, and seconds in full
+    precision, as each rewrite adds to the values read back. Writing never raises, as metrics must not fail a
+    command.
+    """
+
+    def __init__(self, path: Path, app_name: str) -> None:
+        self.path = Path(path)
+        self.app_name = app_name
+
+    @staticmethod
+    def escape(value: str) -> str:
+        return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    @staticmethod
+    def format_value(value: Union[int, float]) -> str:
+        # repr is the shortest text which reads back as the same float
+        return str(value) if isinstance(value, int) else repr(float(value))
+
+    @staticmethod
+    def parse_value(text: str) -> Union[int, float]:
+        try:
+            return int(text)
+        except ValueError:
+            return float(text)
+
+    def read_counters(self) -> Dict[Tuple[str, str], Union[int, float]]:
+        counters = {}
+        try:
+            lines = self.path.read_text().splitlines()
+        except OSError:
+            return counters
+
+        for line in lines:
+            match = PROMETHEUS_LINE.match(line)
+            if match and match.group(1) in PROMETHEUS_METRICS:
+                counters[(match.group(1), match.group(2))] = self.parse_value(match.group(3))
+        return counters
+
+    def write_counters(self, counters: Dict[Tuple[str, str], Union[int, float]]) -> None:
+        lines = []
+        for metric, description in PROMETHEUS_METRICS.items():
+            lines.extend([f"# HELP {metric} {description}", f"# TYPE {metric} counter"])
+            for (name, labels), value in sorted(counters.items()):
+                if name == metric:
+                    lines.append(f"{name}{{{labels}}} {self.format_value(value)}")
+
+        tmp_path = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text('\n'.join(lines) + '\n')
+        tmp_path.replace(self.path)
+
+    def on_command(self, command: str, stats: Dict[Tuple[str, str], StatementStats]) -> None:
+        totals: Dict[str, Dict[str, Union[int, float]]] = {}
+        for (connection_name, _), statement in stats.items():
+            labels = (f'app="{self.escape(self.app_name)}",command="{self.escape(command)}",'
+                      f'connection="{self.escape(connection_name)}"')
+            values = totals.setdefault(labels, dict(dict.fromkeys(PROMETHEUS_METRICS, 0),
+                                                    rsterm_query_seconds_total=0.0))
+            values['rsterm_queries_total'] += statement.count
+            values['rsterm_query_seconds_total'] += statement.seconds
+            values['rsterm_query_rows_total'] += statement.rows
+            values['rsterm_query_errors_total'] += statement.errors
+            values['rsterm_slow_queries_total'] += statement.slow
+
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self.path.with_name(f".{self.path.name}.lock").open('w') as lock_file:
+                try:
+                    import fcntl
+
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                except ImportError:
+                    pass
+
+                counters = self.read_counters()
+                for labels, values in totals.items():
+                    for metric, value in values.items():
+                        counters[(metric, labels)] = counters.get((metric, labels), 0) + value
+                self.write_counters(counters)
+        except OSError as error:
+            print(f"[rsterm] could not write the prometheus textfile {self.path}: {error}", file=sys.stderr)
+
+
+def get_recorder(key: str, create: Callable[[], QueryRecorder]) -> QueryRecorder:
+    """
+    Return the process wide recorder for an app's instrumentation settings, creating it on first use.
+    """
+    with _recorders_lock:
+        recorder = _recorders.get(key)
+
+        if recorder is None:
+            recorder = create()
+            _recorders[key] = recorder
+        return recorder
+
+
+def finish_command(command: str) -> None:
+    """
+    Called by dispatch once a command has finished, to print and export the statements it ran. Called in the
+    command's scope, so that only its own statements are reported.
+    """
+    with _recorders_lock:
+        recorders = list(_recorders.values())
+
+    for recorder in recorders:
+        recorder.finish_command(command)
+
+
+def close_recorders() -> None:
+    """
+    Close the exporters of every process wide recorder, and forget the recorders.
+    """
+    with _recorders_lock:
+        recorders = list(_recorders.values())
+        _recorders.clear()
+
+    for recorder in recorders:
+        recorder.close()
@@ -0,0 +1,284 @@
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Any, TYPE_CHECKING
+from rsterm.exceptions import PoolExhausted, PoolClosed
+
+if TYPE_CHECKING:
+    from psycopg2.extensions import connection
+
+# process wide pools, keyed on connection name and connection string
+_pools: Dict[str, 'ConnectionPool'] = {}
+_pools_lock = threading.Lock()
+
+
+class PooledConnection:
+    """
+    Thin proxy around a psycopg2 connection checked out of a ConnectionPool. Everything is delegated
+    to the real connection, except close() which hands the connection back to its pool.
+    """
+
+    def __init__(self, pool: 'ConnectionPool', conn: 'connection') -> None:
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, item: str) -> Any:
+        conn = self.__dict__.get('_conn')
+        if conn is None:
+            raise AttributeError(f"connection has been returned to the pool, can not access {item}")
+        return getattr(conn, item)
+
+    def __enter__(self) -> 'PooledConnection':
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self._conn.__exit__(exc_type, exc_val, exc_tb)
+
+    @property
+    def closed(self) -> int:
+        return 1 if self._conn is None else self._conn.closed
+
+    def close(self) -> None:
+        """
+        Return the connection to the pool. Calling close more than once has no effect.
+        """
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool.putconn(conn)
+
+
+class ConnectionPool:
+    """
+    Thread safe pool of connections for a single connection name.
+
+    Args:
+        connect:          Callable[[], connection] opens a new connection
+        min_size:         int number of connections opened up front, and kept when idle
+        max_size:         int maximum number of connections open at once
+        idle_timeout:     float seconds an idle connection is kept before it is closed
+        health_check:     bool run "SELECT 1" on a connection before handing it out
+        checkout_timeout: float seconds to wait for a connection when the pool is exhausted
+    """
+
+    def __init__(self, connect: Callable[[], 'connection'],
+                 min_size: int = 0,
+                 max_size: int = 5,
+                 idle_timeout: float = 300.0,
+                 health_check: bool = True,
+                 checkout_timeout: float = 30.0) -> None:
+
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ValueError(f"invalid pool size min_size={min_size} max_size={max_size}")
+
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check = health_check
+        self.checkout_timeout = checkout_timeout
+
+        self._cond = threading.Condition()
+        self._idle = deque()
+        self._in_use = set()
+        self._size = 0
+        self._closed = False
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def idle(self) -> int:
+        return len(self._idle)
+
+    def fill(self) -> None:
+        """
+        Open connections until the pool holds at least min_size.
+        """
+        while True:
+            with self._cond:
+                if self._closed or self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                conn = self._connect()
+            except Exception:
+                self._release_slot()
+                raise
+            with self._cond:
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+
+    def getconn(self) -> PooledConnection:
+        """
+        Check a connection out of the pool. Idle connections are reused, most recently returned first, and
+        new connections are opened while the pool is below max_size.
+        Raises: PoolExhausted if no connection becomes available within checkout_timeout.
+        """
+        deadline = time.monotonic() + self.checkout_timeout
+
+        while True:
+            conn, create = None, False
+
+            # closing a connection can block on the network, so it is never done holding the lock
+            with self._cond:
+                expired = self._evict_idle()
+            for idle_conn in expired:
+                self._close_quietly(idle_conn)
+
+            with self._cond:
+                if self._closed:
+                    raise PoolClosed("connection pool has been closed")
+
+                if self._idle:
+                    conn, _ = self._idle.pop()
+                elif self._size < self.max_size:
+                    self._size += 1
+                    create = True
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolExhausted(f"no connection available after {self.checkout_timeout} seconds")
+                    self._cond.wait(remaining)
+                    continue
+
+            if create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    self._release_slot()
+                    raise
+            elif not self._is_healthy(conn):
+                self._discard(conn)
+                continue
+
+            with self._cond:
+                self._in_use.add(conn)
+            return PooledConnection(self, conn)
+
+    def putconn(self, conn: 'connection', close: bool = False) -> None:
+        """
+        Return a connection to the pool. Any open transaction is rolled back, and broken connections are discarded.
+        """
+        with self._cond:
+            self._in_use.discard(conn)
+
+        if close or self._closed or conn.closed:
+            self._discard(conn)
+            return
+
+        try:
+            from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+            if conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+        except Exception:
+            self._discard(conn)
+            return
+
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self) -> Iterator[PooledConnection]:
+        """
+        Context manager which checks out a connection and always returns it to the pool.
+        """
+        conn = self.getconn()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def closeall(self) -> None:
+        """
+        Close every connection, idle or checked out. The pool can not be used afterwards.
+        """
+        with self._cond:
+            self._closed = True
+            connections = [conn for conn, _ in self._idle] + list(self._in_use)
+            self._idle.clear()
+            self._in_use.clear()
+            self._size = 0
+            self._cond.notify_all()
+
+        for conn in connections:
+            self._close_quietly(conn)
+
+    def _is_healthy(self, conn: 'connection') -> bool:
+        if conn.closed:
+            return False
+
+        if not self.health_check:
+            return True
+
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            if not conn.autocommit:
+                conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _evict_idle(self) -> List['connection']:
+        # must be called holding the lock, and the connections it returns closed once it is released. the oldest
+        # connections are at the left of the deque
+        now = time.monotonic()
+        expired = []
+        while self._idle and self._size > self.min_size and now - self._idle[0][1] > self.idle_timeout:
+            conn, _ = self._idle.popleft()
+            self._size -= 1
+            expired.append(conn)
+        return expired
+
+    def _discard(self, conn: 'connection') -> None:
+        self._close_quietly(conn)
+        self._release_slot()
+
+    def _release_slot(self) -> None:
+        with self._cond:
+            if self._size > 0:
+                self._size -= 1
+            self._cond.notify()
+
+    @staticmethod
+    def _close_quietly(conn: 'connection') -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def get_pool(key: str, connect: Callable[[], 'connection'], **options) -> ConnectionPool:
+    """
+    Return the process wide pool for a connection, creating and filling it on first use.
+    Args:
+        key:       str identifies the pool, usually the connection name and connection string
+        connect:   Callable[[], connection] opens a new connection for the pool
+        **options: ConnectionPool kwargs
+    """
+    with _pools_lock:
+        pool = _pools.get(key)
+
+        if pool is None:
+            pool = ConnectionPool(connect, **options)
+            _pools[key] = pool
+
+    pool.fill()
+    return pool
+
+
+def close_pools() -> None:
+    """
+    Close every pool in the process. Called by the dispatcher once an entry point has finished.
+    """
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+
+    for pool in pools:
+        pool.closeall()
@@ -0,0 +1,335 @@
+import os
+import re
+import json
+import time
+import pickle
+import hashlib
+from pathlib import Path
+from argparse import ArgumentParser
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple, Union, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from psycopg2.extensions import connection
+
+CACHE_FILE_SUFFIX = '.pkl'
+STATS_FILE_NAME = 'stats.json'
+
+# the files the cache writes, results and their temporary files, which are all that eviction and clear remove
+CACHE_FILE = re.compile(r'^[0-9a-f]{64}(\.pkl|\.\d+\.tmp)$')
+
+# string literals and quoted identifiers are kept as they are, comments and runs of whitespace become one space
+SQL_TOKENS = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*")|(?:\s|--[^\n]*|/\*.*?\*/)+""", re.DOTALL)
+
+Params = Union[Sequence[Any], Dict[str, Any], None]
+
+
+class QueryResult(NamedTuple):
+    columns: List[str]
+    rows: List[tuple]
+
+
+class CacheEntry(NamedTuple):
+    path: Path
+    size: int
+    last_used: float
+    # None when the header was not read
+    expires: Optional[float]
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    Returns: str the sql with comments removed and whitespace collapsed, so that formatting does not change the key
+    """
+    def replace(match):
+        return match.group(1) or ' '
+
+    return SQL_TOKENS.sub(replace, sql).strip().rstrip(';').strip()
+
+
+def cache_key(sql: str, params: Params = None, target: str = None) -> str:
+    """
+    Args:
+        sql:    str the query
+        params: parameters of the query
+        target: str what the connection resolves to, such as its connection string, so that a connection name which
+                is pointed at another database does not return the results of the first
+
+    Returns: str the hash of the normalized sql, its parameters and the target
+    """
+    content = json.dumps([normalize_sql(sql), params] + ([target] if target is not None else []),
+                         sort_keys=True, default=str)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def safe_name(connection_name: str) -> str:
+    return re.sub(r'[^\w.-]', '_', connection_name)
+
+
+class QueryCache:
+    """
+    Caches the results of read only queries on local disk, by connection name, normalized sql and parameters.
+    Each result is pickled to its own file under <directory>/<connection_name>/, with a small header holding
+    its expiry, so that eviction never has to load a result. Results expire after their ttl, and once the cache
+    holds more than max_bytes the least recently used results are removed. Hits and misses are counted per
+    connection in a stats file shared by every process using the cache.
+
+    Args:
+        directory:   Path where the results are stored
+        max_bytes:   int size the cache is kept under
+        default_ttl: float seconds a result is kept for, when a query is not given its own ttl
+    """
+
+    def __init__(self, directory: Path, max_bytes: int = 512 * 1024 * 1024, default_ttl: float = 3600.0) -> None:
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+
+    def path_of(self, connection_name: str, key: str) -> Path:
+        return self.directory / safe_name(connection_name) / f"{key}{CACHE_FILE_SUFFIX}"
+
+    def get(self, connection_name: str, key: str) -> Optional[QueryResult]:
+        """
+        Returns: Optional[QueryResult] the cached result, or None if there is none or it has expired
+        """
+        path = self.path_of(connection_name, key)
+        result = None
+
+        try:
+            with path.open('rb') as cache_file:
+                header = pickle.load(cache_file)
+                if header['expires'] > time.time():
+                    result = QueryResult(*pickle.load(cache_file))
+        except (OSError, EOFError, KeyError, TypeError, pickle.UnpicklingError):
+            pass
+
+        if result is not None:
+            try:
+                # the modification time is the last use, for lru eviction
+                os.utime(path.as_posix())
+            except OSError:
+                pass
+
+        self.record(connection_name, hit=result is not None)
+        return result
+
+    def put(self, connection_name: str, key: str, result: QueryResult, ttl: float = None, sql: str = '') -> Path:
+        """
+        Store a result, then evict results until the cache is under max_bytes.
+
+        Returns: Path the file the result was stored in
+        """
+        path = self.path_of(connection_name, key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        header = {'expires': time.time() + (self.default_ttl if ttl is None else ttl), 'sql': sql}
+
+        with tmp_path.open('wb') as cache_file:
+            pickle.dump(header, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(tuple(result), cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+        tmp_path.replace(path)
+
+        self.evict()
+        return path
+
+    @staticmethod
+    def read_expires(path: Path) -> float:
+        try:
+            with path.open('rb') as cache_file:
+                return pickle.load(cache_file)['expires']
+        except (OSError, EOFError, KeyError, TypeError, pickle.UnpicklingError):
+            # unreadable results are evicted first
+            return 0.0
+
+    def entries(self, read_headers: bool = True) -> List[CacheEntry]:
+        """
+        Args:
+            read_headers: bool read the expiry of each result, which opens every file, rather than only stat them
+
+        Returns: List[CacheEntry]
+        """
+        entries = []
+
+        for path in self.directory.glob(f"*/*{CACHE_FILE_SUFFIX}"):
+            if not CACHE_FILE.match(path.name):
+                continue
+            try:
+                stat = path.stat()
+            except OSError:
+                # removed by another process
+                continue
+
+            entries.append(CacheEntry(path, stat.st_size, stat.st_mtime,
+                                      self.read_expires(path) if read_headers else None))
+        return entries
+
+    def evict(self) -> int:
+        """
+        Remove expired results, then the least recently used results until the cache is under max_bytes. Only the
+        sizes of the results are looked at while the cache is under max_bytes, which it usually is after a put.
+
+        Returns: int the number of results removed
+        """
+        entries = self.entries(read_headers=False)
+        total = sum(entry.size for entry in entries)
+
+        if total <= self.max_bytes:
+            return 0
+
+        entries = [entry._replace(expires=self.read_expires(entry.path)) for entry in entries]
+        now = time.time()
+        removed = 0
+
+        for entry in sorted(entries, key=lambda e: (e.expires > now, e.last_used)):
+            if total <= self.max_bytes:
+                break
+            try:
+                entry.path.unlink()
+            except OSError:
+                continue
+            total -= entry.size
+            removed += 1
+        return removed
+
+    def clear(self, connection_name: str = None) -> None:
+        """
+        Remove every cached result, or only those of one connection. The statistics are reset with them. Only the
+        files the cache wrote are removed, as the directory may be shared with others.
+        """
+        if connection_name is None:
+            directories = [path for path in self.directory.glob('*') if path.is_dir()]
+        else:
+            directories = [self.directory / safe_name(connection_name)]
+
+        for directory in directories:
+            for path in directory.glob('*'):
+                if CACHE_FILE.match(path.name):
+                    try:
+                        path.unlink()
+                    except OSError:
+                        pass
+            try:
+                # only when nothing else is in it
+                directory.rmdir()
+            except OSError:
+                pass
+
+        if connection_name is None:
+            try:
+                (self.directory / STATS_FILE_NAME).unlink()
+            except OSError:
+                pass
+            return
+
+        counts = self.read_counts()
+        if counts.pop(connection_name, None) is not None:
+            self.write_counts(counts)
+
+    def read_counts(self) -> Dict[str, List[int]]:
+        try:
+            return json.loads((self.directory / STATS_FILE_NAME).read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def write_counts(self, counts: Dict[str, List[int]]) -> None:
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.directory / f"{STATS_FILE_NAME}.{os.getpid()}.tmp"
+            tmp_path.write_text(json.dumps(counts))
+            tmp_path.replace(self.directory / STATS_FILE_NAME)
+        except OSError:
+            # losing a count is never fatal
+            pass
+
+    def record(self, connection_name: str, hit: bool) -> None:
+        counts = self.read_counts()
+        hits_misses = counts.setdefault(connection_name, [0, 0])
+        hits_misses[0 if hit else 1] += 1
+        self.write_counts(counts)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Returns: Dict[str, Dict[str, Any]] connection name -> hits, misses, hit_rate, entries and bytes
+        """
+        stats = {}
+
+        def connection_stats(name: str) -> Dict[str, Any]:
+            return stats.setdefault(name, {'hits': 0, 'misses': 0, 'hit_rate': 0.0, 'entries': 0, 'bytes': 0})
+
+        for name, (hits, misses) in self.read_counts().items():
+            connection_stats(name).update(hits=hits, misses=misses, hit_rate=hits / (hits + misses or 1))
+
+        now = time.time()
+        for entry in self.entries():
+            if entry.expires > now:
+                named = connection_stats(entry.path.parent.name)
+                named['entries'] += 1
+                named['bytes'] += entry.size
+        return stats
+
+
+def format_stats(stats: Dict[str, Dict[str, Any]]) -> str:
+    lines = [f"{'connection':<20} {'hits':>8} {'misses':>8} {'hit rate':>9} {'entries':>8} {'bytes':>12}"]
+
+    for name, named in sorted(stats.items()):
+        lines.append(f"{name:<20} {named['hits']:>8} {named['misses']:>8} {named['hit_rate']:>9.1%} "
+                     f"{named['entries']:>8} {named['bytes']:>12}")
+    return '\n'.join(lines)
+
+
+def run_query(conn: 'connection', sql: str, params: Params = None) -> QueryResult:
+    with conn.cursor() as cursor:
+        cursor.execute(sql, params)
+        columns = [column[0] for column in cursor.description or []]
+        return QueryResult(columns, [tuple(row) for row in cursor.fetchall()])
+
+
+def cached_query(cache: QueryCache, connection_name: str, connect: Callable[[], 'connection'], sql: str,
+                 params: Params = None, ttl: float = None, refresh: bool = False,
+                 target: str = None) -> Tuple[QueryResult, bool]:
+    """
+    Run a read only query through the cache. connect is only called when the result is not cached. target is what
+    the connection name resolves to, see cache_key.
+
+    Returns: Tuple[QueryResult, bool] the result, and True if it came from the cache
+    """
+    key = cache_key(sql, params, target)
+
+    if not refresh:
+        result = cache.get(connection_name, key)
+        if result is not None:
+            return result, True
+
+    conn = connect()
+    try:
+        result = run_query(conn, sql, params)
+    finally:
+        conn.close()
+
+    cache.put(connection_name, key, result, ttl=ttl, sql=normalize_sql(sql))
+    return result, False
+
+
+def run_query_cache_option(config_path: Path, args: List[str]) -> int:
+    """
+    Handle the --rsterm-query-cache option of run_entry_point.
+
+    my_app --rsterm-query-cache stats                       print hits, misses and size per connection
+    my_app --rsterm-query-cache clear                       remove every cached result
+    my_app --rsterm-query-cache clear --connection redshift remove the results of one connection
+
+    Returns: int exit code
+    """
+    from rsterm.configs.rsterm_config import RsTermConfig
+
+    arg_parser = ArgumentParser(prog='--rsterm-query-cache', description='manage the query result cache')
+    arg_parser.add_argument('action', choices=['clear', 'stats'])
+    arg_parser.add_argument('--connection', help='only clear the results of this connection')
+    ns = arg_parser.parse_args(args)
+
+    cache = RsTermConfig.load(config_path).get_query_cache()
+
+    if ns.action == 'clear':
+        cache.clear(ns.connection)
+    else:
+        print(format_stats(cache.stats()))
+    return 0
@@ -0,0 +1,163 @@
+import re
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple, TYPE_CHECKING
+from rsterm.scheduler import TaskGraph, TaskResult, run_graph, format_results
+from rsterm.exceptions import GraphError
+from rsterm.profiler.accounting import bind_command
+
+if TYPE_CHECKING:
+    from psycopg2.extensions import connection
+
+DEPENDS_PATTERN = re.compile(r'^--\s*depends(?:_on)?\s*:\s*(.*)$', re.IGNORECASE)
+DEFAULT_MANIFEST_NAME = 'sql_manifest.yml'
+
+
+def script_name(value: str) -> str:
+    value = value.strip()
+    return value[:-4] if value.endswith('.sql') else value
+
+
+def read_header_dependencies(script_path: Path) -> List[str]:
+    """
+    Read the dependencies declared in the leading comment block of a sql script.
+
+    -- depends_on: load_users, load_orders.sql
+    -- depends_on: load_products
+    SELECT ...
+
+    Returns: List[str] names of the scripts (without .sql) this script depends on
+    """
+    dependencies = []
+    with script_path.open() as script:
+        for line in script:
+            line = line.strip()
+            if not line:
+                continue
+            if not line.startswith('--'):
+                break
+
+            match = DEPENDS_PATTERN.match(line)
+            if match:
+                dependencies.extend(script_name(dep) for dep in match.group(1).split(',') if dep.strip())
+    return dependencies
+
+
+def read_manifest_dependencies(manifest_path: Path) -> Dict[str, List[str]]:
+    """
+    Read script dependencies from a yaml manifest, which maps a script name to the scripts it depends on.
+
+    build_report:
+      - load_users
+      - load_orders
+    """
+    import yaml
+
+    with manifest_path.open() as manifest_file:
+        content = yaml.safe_load(manifest_file) or {}
+
+    return {script_name(name): [script_name(dep) for dep in deps or []] for name, deps in content.items()}
+
+
+def build_script_graph(directory: Path, manifest_path: Path = None) -> Tuple[TaskGraph, Dict[str, Path]]:
+    """
+    Collect every .sql file in a directory and the dependencies declared in their headers, and in the
+    manifest if there is one. By default the manifest is sql_manifest.yml in the directory.
+
+    Returns: Tuple[TaskGraph, Dict[str, Path]] the dependency graph, and the path of each script by name
+    """
+    directory = Path(directory)
+    scripts = {path.stem: path for path in sorted(directory.glob('*.sql'))}
+    dependencies = {name: read_header_dependencies(path) for name, path in scripts.items()}
+
+    manifest_path = manifest_path or directory / DEFAULT_MANIFEST_NAME
+    if manifest_path.exists():
+        for name, deps in read_manifest_dependencies(manifest_path).items():
+            if name not in dependencies:
+                raise GraphError(f"{name} is listed in {manifest_path.name}, but {name}.sql does not exist")
+            dependencies[name].extend(dep for dep in deps if dep not in dependencies[name])
+
+    return TaskGraph(dependencies), scripts
+
+
+class SqlScriptRunner:
+    """
+    Runs a directory of sql scripts against a database, executing scripts whose dependencies have completed
+    concurrently on a bounded thread pool. Every worker thread uses its own connection, and each script is
+    committed once it has completed. When a script fails nothing else is started.
+
+    Args:
+        connect:         Callable[[], connection] opens a connection for a worker. Pooled connections are returned
+                         to their pool when the run has finished.
+        max_workers:     int maximum number of scripts running at once
+        stop_on_failure: bool stop scheduling scripts as soon as one fails, otherwise only skip its dependants
+        verbose:         bool print each script as it finishes, and a timing table at the end
+    """
+
+    def __init__(self, connect: Callable[[], 'connection'],
+                 max_workers: int = 4,
+                 stop_on_failure: bool = True,
+                 verbose: bool = True) -> None:
+        self.connect = connect
+        self.max_workers = max_workers
+        self.stop_on_failure = stop_on_failure
+        self.verbose = verbose
+
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._scripts: Dict[str, Path] = {}
+
+    def run(self, directory: Path, manifest_path: Path = None) -> Dict[str, TaskResult]:
+        graph, self._scripts = build_script_graph(directory, manifest_path)
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                # scripts run in the command of the caller, so their statements are totalled with it
+                results = run_graph(graph, bind_command(self.execute_script), executor,
+                                    stop_on_failure=self.stop_on_failure,
+                                    on_complete=self.report if self.verbose else None)
+        finally:
+            self.close_connections()
+
+        if self.verbose:
+            print(format_results(results.values()))
+        return results
+
+    def execute_script(self, name: str) -> None:
+        conn = self.get_connection()
+        sql = self._scripts[name].read_text()
+
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(sql)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def get_connection(self) -> 'connection':
+        conn = getattr(self._local, 'conn', None)
+
+        if conn is None:
+            conn = self.connect()
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def close_connections(self) -> None:
+        with self._lock:
+            connections, self._connections = self._connections, []
+
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    @staticmethod
+    def report(result: TaskResult) -> None:
+        message = f"[{result.status}] {result.name} {result.seconds:.2f}s"
+        print(f"{message} {result.error}" if result.error else message)
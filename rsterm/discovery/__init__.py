@@ -1,2 +1,4 @@
 # flake8: noqa
-from .discovery import run_entry_point, collect_entry_points
+from .discovery import run_entry_point, collect_entry_points, dispatch, daemon_socket_path
+from .manifest import EntryPointManifest
+from .parser import CommandParser, get_command_parser
@@ -0,0 +1,122 @@
+import sys
+import time
+import shlex
+import threading
+import traceback
+from pathlib import Path
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, NamedTuple, TextIO
+from rsterm.configs.rsterm_config import RsTermConfig
+from rsterm.discovery.discovery import dispatch
+from rsterm.discovery.manifest import EntryPointManifest
+from rsterm.scheduler import TaskResult, CapturedOutput, format_results, SUCCESS, FAILED
+
+# a line holding only this word waits for every command before it to finish
+BARRIER = 'wait'
+
+
+class BatchCommand(NamedTuple):
+    line_number: int
+    line: str
+    args: List[str]
+
+    @property
+    def name(self) -> str:
+        return f"{self.line_number}: {self.line}"
+
+
+def read_batch(batch_file: TextIO) -> List[List[BatchCommand]]:
+    """
+    Read a batch of commands, one per line, written the same way as on the terminal without the app name.
+    Blank lines and lines starting with # are ignored. A line holding only "wait" splits the batch into groups,
+    which are run one after the other.
+
+    Returns: List[List[BatchCommand]] the groups of commands
+    """
+    groups = [[]]
+
+    for line_number, line in enumerate(batch_file, start=1):
+        line = line.strip()
+
+        if not line or line.startswith('#'):
+            continue
+
+        if line == BARRIER:
+            groups.append([])
+            continue
+
+        groups[-1].append(BatchCommand(line_number, line, shlex.split(line)))
+    return [group for group in groups if group]
+
+
+def run_batch(config_path: Path, groups: List[List[BatchCommand]], jobs: int = 1) -> List[TaskResult]:
+    """
+    Dispatch every command in process. The config, entry point manifest, imported modules and pooled connections
+    are shared by all the commands. With more than one job, the commands in a group run concurrently on a thread
+    pool, and the output of each command is printed in one piece when it finishes.
+
+    Returns: List[TaskResult] one per command, in the order of the batch file. value is the exit code.
+    """
+    manifest = EntryPointManifest.for_config(RsTermConfig.load(config_path))
+    results = []
+
+    def run(command: BatchCommand) -> TaskResult:
+        start = time.perf_counter()
+        try:
+            exit_code = dispatch(config_path, command.args, manifest=manifest, concurrent=jobs > 1)
+            error = None if exit_code == 0 else f"exit code {exit_code}"
+        except Exception as exception:
+            traceback.print_exc()
+            exit_code, error = 1, f"{type(exception).__name__}: {exception}"
+
+        status = SUCCESS if exit_code == 0 else FAILED
+        return TaskResult(command.name, status, time.perf_counter() - start, error, exit_code)
+
+    if jobs <= 1:
+        for group in groups:
+            results.extend(run(command) for command in group)
+        return results
+
+    output = CapturedOutput()
+    lock = threading.Lock()
+
+    def run_captured(command: BatchCommand) -> TaskResult:
+        output.capture_start()
+        try:
+            return run(command)
+        finally:
+            stdout, stderr = output.capture_stop()
+            with lock:
+                output.stdout.stream.write(stdout)
+                output.stderr.stream.write(stderr)
+
+    with output, ThreadPoolExecutor(max_workers=jobs) as executor:
+        for group in groups:
+            results.extend(executor.map(run_captured, group))
+    return results
+
+
+def run_batch_option(config_path: Path, args: List[str]) -> int:
+    """
+    Handle the --rsterm-batch option of run_entry_point.
+
+    my_app --rsterm-batch commands.txt --jobs 4
+    cat commands.txt | my_app --rsterm-batch -
+
+    Returns: int 0 if every command succeeded, otherwise 1
+    """
+    arg_parser = ArgumentParser(prog='--rsterm-batch', description='run many commands in a single process')
+    arg_parser.add_argument('batch_file', help='file with one command per line, or - to read stdin')
+    arg_parser.add_argument('--jobs', '-j', type=int, default=1, help='number of commands to run at once')
+    ns = arg_parser.parse_args(args)
+
+    if ns.batch_file == '-':
+        groups = read_batch(sys.stdin)
+    else:
+        with open(ns.batch_file) as batch_file:
+            groups = read_batch(batch_file)
+
+    results = run_batch(config_path, groups, jobs=ns.jobs)
+    print(format_results(results))
+    return 0 if all(result.status == SUCCESS for result in results) else 1
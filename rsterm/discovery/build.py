@@ -0,0 +1,152 @@
+import os
+import sys
+import json
+import stat
+import tempfile
+import py_compile
+import zipfile
+from pathlib import Path
+from typing import Iterator, List, NamedTuple, Tuple
+from rsterm.configs.rsterm_config import RsTermConfig
+from rsterm.discovery.manifest import EntryPointManifest
+from rsterm.discovery.frozen import FROZEN_MODULE
+
+FROZEN_TEMPLATE = """# generated by rsterm build project, do not edit
+APP_NAME = {app_name!r}
+CONFIG_NAME = {config_name!r}
+CONFIG = {config!r}
+MANIFEST = {manifest!r}
+"""
+
+MAIN_TEMPLATE = """# generated by rsterm build project, do not edit
+import sys
+
+if sys.version_info[:2] != {version!r}:
+    sys.exit("{archive} holds bytecode for python {version_name}, and must be run with that version")
+
+from rsterm.discovery.frozen import run_frozen
+
+run_frozen()
+"""
+
+# never bundled, wherever they are found
+EXCLUDED_DIRS = ('__pycache__', '.git', '.tox', '.mypy_cache', '.pytest_cache')
+EXCLUDED_SUFFIXES = ('.pyc', '.pyo')
+
+
+class BuildResult(NamedTuple):
+    path: Path
+    files: int
+    bytes: int
+
+    def summary(self) -> str:
+        return f"built {self.path} with {self.files} files ({self.bytes} bytes)"
+
+
+def iter_package_files(package_path: Path) -> Iterator[Path]:
+    for dir_path, dir_names, file_names in os.walk(package_path.as_posix()):
+        dir_names[:] = sorted(name for name in dir_names if name not in EXCLUDED_DIRS)
+
+        for file_name in sorted(file_names):
+            if not file_name.endswith(EXCLUDED_SUFFIXES):
+                yield Path(dir_path) / file_name
+
+
+def compile_source(source: str, arcname: str, build_dir: Path, optimize: int = -1) -> bytes:
+    """
+    Returns: bytes the .pyc content of the source, which reports arcname as its file in tracebacks
+    """
+    source_path = build_dir / 'source.py'
+    source_path.write_text(source)
+    pyc_path = py_compile.compile(source_path.as_posix(), cfile=(build_dir / 'source.pyc').as_posix(), dfile=arcname,
+                                  doraise=True, optimize=optimize)
+    return Path(pyc_path).read_bytes()
+
+
+def package_members(package_path: Path, build_dir: Path, optimize: int = -1) -> Iterator[Tuple[str, bytes]]:
+    """
+    Every file of a package, for the archive. Modules are stored only as .pyc next to where their source would be,
+    which zipimport loads without looking for the source or checking if the bytecode is stale.
+
+    Returns: Iterator[Tuple[str, bytes]] name in the archive, content
+    """
+    for path in iter_package_files(package_path):
+        arcname = path.relative_to(package_path.parent).as_posix()
+
+        if path.suffix == '.py':
+            yield f"{arcname}c", compile_source(path.read_text(), arcname, build_dir, optimize)
+        else:
+            yield arcname, path.read_bytes()
+
+
+def freeze(config_path: Path, config: RsTermConfig, manifest: EntryPointManifest, project_path: Path) -> str:
+    """
+    Returns: str the source of the module holding the config snapshot and entry point manifest of an app
+    """
+    manifest_data = {'config_key': manifest.config_key, 'modules': manifest.modules}
+    config_path = Path(config_path).absolute()
+
+    try:
+        config_name = config_path.relative_to(project_path.parent).as_posix()
+    except ValueError:
+        config_name = f"{config.app_name}/{config_path.name}"
+
+    return FROZEN_TEMPLATE.format(app_name=config.app_name, config_name=config_name,
+                                  config=json.dumps(config.to_dict(), sort_keys=True),
+                                  manifest=json.dumps(manifest_data, separators=(',', ':'), sort_keys=True))
+
+
+def build_zipapp(config_path: Path, output: Path, python: str = '/usr/bin/env python3', compress: bool = False,
+                 optimize: int = -1) -> BuildResult:
+    """
+    Package an app, and rsterm itself, into a single executable zip file, runnable as ./my_app.pyz verb noun
+    with the interpreter it was built with. Along with precompiled bytecode, the archive holds a snapshot of the
+    config, without its override file, and the entry point manifest, so a command run from it never scans the
+    entrypoint_paths, parses the config yaml or checks bytecode against its source. Third party packages, such as
+    psycopg2 and yaml, are not bundled and must be installed for the interpreter which runs the archive.
+
+    Args:
+        config_path: Path to the app's rsterm.yml config file
+        output:      Path of the archive to write
+        python:      str interpreter for the shebang line
+        compress:    bool deflate the archive. It is stored uncompressed by default, which is quicker to import from
+        optimize:    int optimization level of the bytecode, as for compile()
+
+    Returns: BuildResult
+    """
+    import rsterm
+
+    config_path = Path(config_path)
+    output = Path(output)
+    config = RsTermConfig.parse_config(config_path)
+    manifest = EntryPointManifest.for_config(config)
+    project_path = Path(EntryPointManifest.get_project_path(config))
+    rsterm_path = Path(rsterm.__file__).absolute().parent
+
+    version = tuple(sys.version_info[:2])
+    main = MAIN_TEMPLATE.format(version=version, version_name='.'.join(map(str, version)), archive=output.name)
+    compression = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+    files: List[str] = []
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = output.with_suffix(f".{os.getpid()}.tmp")
+
+    with tempfile.TemporaryDirectory() as build_dir, tmp_path.open('wb') as archive_file:
+        build_dir = Path(build_dir)
+        archive_file.write(f"#!{python}\n".encode())
+
+        with zipfile.ZipFile(archive_file, 'w', compression=compression) as archive:
+            # the version check must run on any interpreter, so __main__ stays as source
+            archive.writestr('__main__.py', main)
+            frozen = freeze(config_path, config, manifest, project_path)
+            archive.writestr(f"{FROZEN_MODULE}.pyc", compile_source(frozen, f"{FROZEN_MODULE}.py", build_dir, optimize))
+            files.extend(['__main__.py', f"{FROZEN_MODULE}.pyc"])
+
+            for package_path in ([project_path] if project_path == rsterm_path else [project_path, rsterm_path]):
+                for arcname, content in package_members(package_path, build_dir, optimize):
+                    archive.writestr(arcname, content)
+                    files.append(arcname)
+
+    tmp_path.replace(output)
+    output.chmod(output.stat().st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return BuildResult(output, len(files), output.stat().st_size)
@@ -0,0 +1,158 @@
+import re
+from pathlib import Path
+from argparse import ArgumentParser
+from typing import Any, Dict, List, Optional
+from rsterm.configs.rsterm_config import RsTermConfig
+from rsterm.discovery.manifest import EntryPointManifest
+
+COMPLETION_OPTION = '--rsterm-completion'
+COMPLETE_OPTION = '--rsterm-complete'
+
+# options which may be given in place of a verb, see run_entry_point
+RSTERM_OPTIONS = ['--help', '--rsterm-batch', '--rsterm-completion', '--rsterm-fanout', '--rsterm-pipeline',
+                  '--rsterm-profile', '--rsterm-profile-pstats', '--rsterm-query-cache', '--rsterm-serve', '--rsterm-stop']
+
+# argparse actions which do not take a value
+FLAG_ACTIONS = ('store_true', 'store_false', 'store_const', 'append_const', 'count', 'help', 'version')
+
+# actions which may be given more than once, so are still offered after being used
+REPEATABLE_ACTIONS = ('append', 'append_const', 'count', 'extend')
+
+BASH_SCRIPT = """# bash completion for {prog}, generated by rsterm
+# add this line to your ~/.bashrc:  eval "$({prog} {completion_option} bash)"
+_{function}_complete() {{
+    local IFS=$'\\n'
+    COMPREPLY=($({prog} {complete_option} $((COMP_CWORD - 1)) "${{COMP_WORDS[@]:1}}" 2>/dev/null))
+}}
+complete -o default -F _{function}_complete {prog}
+"""
+
+ZSH_SCRIPT = """#compdef {prog}
+# zsh completion for {prog}, generated by rsterm
+# add this line to your ~/.zshrc, after compinit:  eval "$({prog} {completion_option} zsh)"
+_{function}_complete() {{
+    local -a candidates
+    candidates=(${{(f)"$({prog} {complete_option} $((CURRENT - 2)) "${{(@)words[2,-1]}}" 2>/dev/null)"}})
+    if (( ${{#candidates}} )); then
+        compadd -a candidates
+    else
+        _files
+    fi
+}}
+compdef _{function}_complete {prog}
+"""
+
+SCRIPTS = {'bash': BASH_SCRIPT, 'zsh': ZSH_SCRIPT}
+
+
+def completion_script(shell: str, prog: str) -> str:
+    """
+    Returns: str the completion script for the shell, which calls back into prog with the hidden --rsterm-complete
+             option to find the candidates for the word being completed
+    """
+    return SCRIPTS[shell].format(prog=prog, function=re.sub(r'\W', '_', prog), completion_option=COMPLETION_OPTION,
+                                 complete_option=COMPLETE_OPTION)
+
+
+def parse_options(arguments: Optional[List]) -> Dict[str, Dict[str, Any]]:
+    """
+    Read the optional arguments of a command from its serialized entry_point_args in the manifest.
+
+    Returns: Dict[str, Dict[str, Any]] option string -> the ArgumentParser kwargs of the option
+    """
+    options = {}
+    for flags, kwargs in arguments or []:
+        for flag in flags:
+            if isinstance(flag, str) and flag.startswith('-'):
+                options[flag] = kwargs
+    return options
+
+
+def complete_option_value(kwargs: Dict[str, Any]) -> Optional[List[str]]:
+    """
+    Returns: Optional[List[str]] the choices of an option which takes a value, an empty list if it takes
+             any value, or None if it does not take a value
+    """
+    if kwargs.get('action') in FLAG_ACTIONS or kwargs.get('nargs') == 0:
+        return None
+
+    choices = kwargs.get('choices')
+    return [str(choice) for choice in choices] if isinstance(choices, list) else []
+
+
+def complete(config_path: Path, index: int, words: List[str]) -> List[str]:
+    """
+    Find the completions of a word on the command line, using only the config and the commands index written with
+    the entry point manifest. No entry point module is ever imported, and the manifest is neither loaded nor
+    refreshed, so this stays fast no matter how many entry points an app has.
+
+    Args:
+        config_path: Path to the rsterm.yml config file
+        index:       int position of the word being completed in words
+        words:       List[str] the command line, without the app name
+
+    Returns: List[str] the sorted candidates which start with the word being completed
+    """
+    current = words[index] if index < len(words) else ''
+    before = [word for word in words[:index] if not word.startswith('--rsterm-profile')]
+
+    config = RsTermConfig.load(config_path)
+    frozen = EntryPointManifest.get_frozen(config.app_name)
+    commands = frozen.commands if frozen else EntryPointManifest.load_commands(config.cache_dir)
+
+    if not before:
+        candidates = RSTERM_OPTIONS if current.startswith('-') else config.verbs
+
+    elif len(before) == 1:
+        verb = before[0]
+        if verb not in config.verbs:
+            return []
+        # before the manifest is first written, every noun is offered
+        candidates = [noun for noun in config.nouns if not commands or f"{verb}_{noun}" in commands]
+
+    else:
+        command = commands.get(f"{before[0]}_{before[1]}")
+        options = parse_options(command['arguments'] if command else None)
+        previous = options.get(before[-1]) if len(before) > 2 else None
+
+        if previous is not None:
+            values = complete_option_value(previous)
+            if values is not None:
+                return sorted(value for value in values if value.startswith(current))
+
+        used = set(before[2:])
+        candidates = ['--help'] + [flag for flag, kwargs in options.items()
+                                   if flag not in used or kwargs.get('action') in REPEATABLE_ACTIONS]
+        if current and not current.startswith('-'):
+            # positional arguments are left to the shell
+            return []
+
+    return sorted(candidate for candidate in set(candidates) if candidate.startswith(current))
+
+
+def run_completion_option(config_path: Path, args: List[str]) -> int:
+    """
+    Handle the completion options of run_entry_point.
+
+    my_app --rsterm-completion bash          print the bash completion script
+    my_app --rsterm-completion zsh           print the zsh completion script
+    my_app --rsterm-complete 1 run sp        hook called by the scripts, prints one candidate per line
+
+    Returns: int exit code
+    """
+    if args[0] == COMPLETE_OPTION:
+        try:
+            candidates = complete(config_path, int(args[1]), args[2:])
+        except Exception:
+            # a broken completion must never get in the way of typing
+            return 1
+        print('\n'.join(candidates))
+        return 0
+
+    arg_parser = ArgumentParser(prog=COMPLETION_OPTION, description='print a shell completion script')
+    arg_parser.add_argument('shell', choices=sorted(SCRIPTS))
+    arg_parser.add_argument('--prog', help='name of the command to complete, defaults to the app name')
+    ns = arg_parser.parse_args(args[1:])
+
+    print(completion_script(ns.shell, ns.prog or RsTermConfig.load(config_path).app_name), end='')
+    return 0
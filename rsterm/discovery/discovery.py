@@ -1,46 +1,155 @@
-import pkgutil
-import inspect
-from typing import Dict
-from importlib import import_module
+import os
+import sys
+from typing import Dict, List, Optional
+from contextlib import ExitStack
 from pathlib import Path
 from rsterm.entrypoint.entrypoint import EntryPoint
 from rsterm.configs.rsterm_config import RsTermConfig
+from rsterm.discovery.manifest import EntryPointManifest
+from rsterm.discovery.parser import get_command_parser
+from rsterm.exceptions import ResourceBudgetExceeded
+from rsterm.profiler import phase, call_profiled, extract_profile_options, start_profiling, stop_profiling, print_report
+from rsterm.profiler.accounting import ResourceMonitor, get_budget, append_metrics, command_scope, SUCCESS, FAILED, \
+    ABORTED
+
+DAEMON_OPTIONS = ('--rsterm-serve', '--rsterm-stop')
+BATCH_OPTION = '--rsterm-batch'
+COMPLETION_OPTIONS = ('--rsterm-completion', '--rsterm-complete')
+QUERY_CACHE_OPTION = '--rsterm-query-cache'
+PIPELINE_OPTION = '--rsterm-pipeline'
+FANOUT_OPTION = '--rsterm-fanout'
+
+
+def daemon_socket_path(config: RsTermConfig) -> Path:
+    return config.cache_dir / 'daemon.sock'
 
 
 def collect_entry_points(config_path: Path = None) -> Dict[str, EntryPoint]:
     """
     function is used to introspect and collect all EntryPoint classes from the paths
-    configured in the rambo.yml file.
+    configured in the rambo.yml file. The entry point manifest is refreshed as a side effect.
 
     Returns: Dict[str, EntryPoint]
         The return dictionary contains all classes which have inherited from EntryPoint,
         with a corresponding name key. This key is used as a verb_noun_mapping.
     """
-    config = RsTermConfig.parse_config(config_path)
-    entry_points = []
+    config = RsTermConfig.load(config_path)
+    manifest = EntryPointManifest.for_config(config)
+    entry_points = {}
+
+    for key in manifest.entries:
+        entry_point = manifest.get_entry_point(key)
+        if entry_point is not None:
+            entry_points[key] = entry_point
+    return entry_points
+
+
+def exit_code_of(error: SystemExit) -> int:
+    """
+    Returns: int the process exit code a SystemExit would have produced.
+    """
+    if error.code is None:
+        return 0
+    if isinstance(error.code, int):
+        return error.code
+    print(error.code, file=sys.stderr)
+    return 1
 
-    if config.is_pip_package:
-        project_path = getattr(import_module(config.app_name), '__path__')[0]
-    else:
-        project_path = Path(config.app_name).absolute().as_posix()
 
-    for entrypoint_path in config.entrypoint_paths:
-        doted_path = entrypoint_path.replace('/', '.')
+def dispatch(config_path: Path, args: List[str], manifest: EntryPointManifest = None, db_target: str = None,
+             concurrent: bool = False) -> int:
+    """
+    Run a single command in process, without reading sys.argv or exiting. This is what run_entry_point,
+    the daemon and batch mode use to execute a command.
 
-        for _, name, _ in pkgutil.iter_modules([f"{project_path}/{entrypoint_path}"]):
+    Args:
+        config_path: Path to the rsterm.yml config file
+        args:        List[str] the command line, starting with the verb and noun
+        manifest:    EntryPointManifest an already refreshed manifest, to skip checking the entry point files
+        db_target:   str the connection in db_connections the command runs against, set as the entry point's
+                     db_target. Used by --rsterm-fanout
+        concurrent:  bool other commands run in this process at the same time, as with --rsterm-batch --jobs and
+                     --rsterm-fanout, so the resources of the command are measured for its thread, see ResourceMonitor
 
-            if config.is_pip_package:
-                module = import_module(name=f".{name}", package=f"{config.app_name}.{doted_path}")
-            else:
-                module = import_module(doted_path)
+    Returns: int the exit code of the command
+    """
+    try:
+        with phase('load config'):
+            config = RsTermConfig.load(config_path)
 
-            for mod_name, obj in inspect.getmembers(module):
+        with phase('discovery'):
+            manifest = manifest or EntryPointManifest.for_config(config)
 
-                if inspect.isclass(obj) and issubclass(obj, EntryPoint):
+        with phase('parse command line'):
+            key, cmd_args = get_command_parser(config, manifest).parse(args)
 
-                    if obj.is_entry_point():
-                        entry_points.append(obj)
-    return {entry_point.name(): entry_point for entry_point in entry_points}
+        with phase('import entry point'):
+            entry_point_class = manifest.get_entry_point(key)
+
+        if entry_point_class is None:
+            raise NotImplementedError
+        else:
+            # statements are totalled per command. fanned out commands run in the scope of run_fanout_option,
+            # and are totalled together
+            with command_scope(key) if db_target is None else ExitStack():
+                with phase(f"{entry_point_class.__name__}.__init__"):
+                    entry_point = entry_point_class(config_path, cmd_args=cmd_args)
+                entry_point.validate_class_name()
+
+                if db_target is not None:
+                    entry_point.db_target = db_target
+
+                # only measured when there is a budget to enforce or metrics to record
+                budget = get_budget(config, key, entry_point_class)
+                monitor = None
+                if budget.is_set or config.metrics_path is not None:
+                    monitor = ResourceMonitor(budget, per_thread=concurrent)
+
+                status = FAILED
+                try:
+                    with phase(f"{entry_point_class.__name__}.run"), ExitStack() as stack:
+                        if monitor is not None:
+                            stack.enter_context(monitor)
+                        result = call_profiled(entry_point.run)
+
+                        if hasattr(result, '__await__'):
+                            # run was declared with async def
+                            from rsterm.scheduler.aio import run_coroutine
+
+                            call_profiled(lambda: run_coroutine(result))
+                    status = SUCCESS
+
+                except ResourceBudgetExceeded as error:
+                    status = ABORTED
+                    print(f"{key} {error}", file=sys.stderr)
+                    return 1
+
+                except SystemExit as error:
+                    status = SUCCESS if error.code in (None, 0) else FAILED
+                    raise
+
+                finally:
+                    with phase(f"{entry_point_class.__name__}.close_resources"):
+                        entry_point.close_resources()
+
+                    if monitor is not None and config.metrics_path is not None:
+                        append_metrics(config.metrics_path,
+                                       monitor.record(key, status, app=config.app_name, db_target=entry_point.db_target))
+
+                    # nothing to report if no connection was ever instrumented. fanned out commands are reported together
+                    instrumentation = sys.modules.get('rsterm.database.instrumentation')
+                    if instrumentation is not None and db_target is None:
+                        instrumentation.finish_command(key)
+
+    except NotImplementedError:
+        print("invalid command. Not yet implemented, try again.")
+        return 1
+
+    except SystemExit as error:
+        # argparse errors and --help, or an entry point calling exit()
+        return exit_code_of(error)
+
+    return 0
 
 
 def run_entry_point(config_path: Path = None):
@@ -49,23 +158,84 @@ def run_entry_point(config_path: Path = None):
     objects which have inherited from EntryPoint, and maps them to the verb / noun mappings as specified
     in rambo.yml If a mapping combination exists in the config file, but there is no corresponding class
     name, then a NotImplementedError is raised, and the function prints an error message and exits.
+
+    The entry point manifest is used so that only the module implementing the requested command is imported.
+
+    The following options may be given in place of a verb and noun
+        --rsterm-serve  keep the app resident, and serve commands over a unix socket
+        --rsterm-stop   stop a running daemon
+        --rsterm-batch  run every command in a file (or stdin) in this process, see rsterm.discovery.batch
+        --rsterm-completion bash|zsh  print a shell completion script, see rsterm.discovery.completion
+        --rsterm-query-cache clear|stats  manage the query result cache, see rsterm.database.query_cache
+        --rsterm-pipeline NAME  run the steps of a pipeline in parallel, see rsterm.discovery.pipeline
+        --rsterm-fanout PATTERNS  run a command once per matching db connection, see rsterm.discovery.fanout
+
+    --rsterm-profile[=json] and --rsterm-profile-pstats=<path> may be put before any command, to time each phase
+    of dispatch, see rsterm.profiler
+
+    When a daemon is running for the app, commands are forwarded to it unless RSTERM_NO_DAEMON is set.
     """
-    entry_points = collect_entry_points(config_path)
-    config = RsTermConfig.parse_config(config_path)
-    ns = config.parse_nouns_and_verbs()
-    key = f"{ns.verb}_{ns.noun}"
+    if sys.argv[1:2] and sys.argv[1] in COMPLETION_OPTIONS:
+        # answered before anything else, as completion runs on every key press
+        from rsterm.discovery.completion import run_completion_option
+
+        exit(run_completion_option(config_path, sys.argv[1:]))
+
+    args, profile_options = extract_profile_options(sys.argv[1:])
+    profiler = start_profiling(**profile_options) if profile_options else None
     exit_code = 0
 
     try:
-        if key not in entry_points.keys():
-            raise NotImplementedError
+        if args and args[0] in DAEMON_OPTIONS:
+            from rsterm.daemon import run_daemon_option
+
+            exit_code = run_daemon_option(config_path, args[0])
+        elif args and args[0] == BATCH_OPTION:
+            from rsterm.discovery.batch import run_batch_option
+
+            exit_code = run_batch_option(config_path, args[1:])
+        elif args and args[0] == QUERY_CACHE_OPTION:
+            from rsterm.database.query_cache import run_query_cache_option
+
+            exit_code = run_query_cache_option(config_path, args[1:])
+        elif args and args[0] == PIPELINE_OPTION:
+            from rsterm.discovery.pipeline import run_pipeline_option
+
+            exit_code = run_pipeline_option(config_path, args[1:])
+        elif args and args[0] == FANOUT_OPTION:
+            from rsterm.discovery.fanout import run_fanout_option
+
+            exit_code = run_fanout_option(config_path, args[1:])
         else:
-            entry_point = entry_points[key](config_path)
-            entry_point.validate_class_name()
-            entry_point.run()
+            # a profiled command always runs in process, so there is something to measure
+            exit_code = None if profiler else forward_to_daemon(config_path, args)
 
-    except NotImplementedError:
-        print("invalid command. Not yet implemented, try again.")
-        exit_code = 1
+            if exit_code is None:
+                exit_code = dispatch(config_path, args)
+
+    finally:
+        RsTermConfig.close_db_pools()
+        RsTermConfig.close_instrumentation()
+
+        if profiler:
+            stop_profiling()
+            print_report(profiler)
 
     exit(exit_code)  # exit no matter what
+
+
+def forward_to_daemon(config_path: Path, args: List[str]) -> Optional[int]:
+    """
+    Returns: Optional[int] the exit code of the command if a daemon ran it, None to run it in process.
+    """
+    if os.environ.get('RSTERM_NO_DAEMON') or config_path is None:
+        return None
+
+    socket_path = daemon_socket_path(RsTermConfig.load(config_path))
+
+    if not socket_path.exists():
+        return None
+
+    from rsterm.daemon import forward_command
+
+    return forward_command(socket_path, args)
@@ -0,0 +1,136 @@
+import sys
+import json
+import time
+import traceback
+from pathlib import Path
+from fnmatch import fnmatchcase
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, NamedTuple
+from rsterm.configs.rsterm_config import RsTermConfig
+from rsterm.discovery.discovery import dispatch, FANOUT_OPTION
+from rsterm.discovery.manifest import EntryPointManifest
+from rsterm.profiler.accounting import bind_command, command_scope
+from rsterm.scheduler import TaskResult, CapturedOutput, format_results, SUCCESS, FAILED
+
+
+class TargetResult(NamedTuple):
+    result: TaskResult
+    stdout: str
+    stderr: str
+
+    def to_dict(self) -> Dict[str, object]:
+        return {'target': self.result.name, 'status': self.result.status, 'seconds': self.result.seconds,
+                'exit_code': self.result.value, 'error': self.result.error, 'stdout': self.stdout,
+                'stderr': self.stderr}
+
+
+def match_targets(config: RsTermConfig, patterns: List[str]) -> List[str]:
+    """
+    Returns: List[str] the names in db_connections matching any of the glob patterns, in the order of the config
+    Raises:  KeyError naming a pattern which matches nothing
+    """
+    names = list(config.db_connections)
+
+    for pattern in patterns:
+        if not any(fnmatchcase(name, pattern) for name in names):
+            raise KeyError(f"{pattern} matches none of the db_connections {names}")
+    return [name for name in names if any(fnmatchcase(name, pattern) for pattern in patterns)]
+
+
+def run_fanout(config_path: Path, args: List[str], targets: List[str], jobs: int = 4) -> List[TargetResult]:
+    """
+    Dispatch one command once per connection in db_connections, in this process, with the entry point's db_target
+    set to the connection. Up to jobs targets run at once on a thread pool, sharing the config, the manifest and
+    the imported entry point module. The output of each target is captured, and printed in one piece as it
+    finishes. A target which fails does not stop the others.
+
+    Returns: List[TargetResult] one per target, in the order of the targets. The value of each result is the
+             exit code.
+    """
+    manifest = EntryPointManifest.for_config(RsTermConfig.load(config_path))
+    output = CapturedOutput()
+
+    def run(target: str) -> TargetResult:
+        output.capture_start()
+        start = time.perf_counter()
+        try:
+            exit_code = dispatch(config_path, args, manifest=manifest, db_target=target,
+                                 concurrent=jobs > 1 and len(targets) > 1)
+            error = None if exit_code == 0 else f"exit code {exit_code}"
+        except Exception as exception:
+            traceback.print_exc()
+            exit_code, error = 1, f"{type(exception).__name__}: {exception}"
+        finally:
+            seconds = time.perf_counter() - start
+            stdout, stderr = output.capture_stop()
+
+        status = SUCCESS if exit_code == 0 else FAILED
+        return TargetResult(TaskResult(target, status, seconds, error, exit_code), stdout, stderr)
+
+    results = {}
+    with output, ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        # every target runs in the command of the caller, so its statements are totalled together
+        futures = [executor.submit(bind_command(run), target) for target in targets]
+
+        for future in as_completed(futures):
+            target_result = future.result()
+            results[target_result.result.name] = target_result
+
+            result = target_result.result
+            output.stdout.stream.write(f"==> [{result.status}] {result.name} {result.seconds:.2f}s\n")
+            output.stdout.stream.write(target_result.stdout)
+            output.stdout.stream.flush()
+            output.stderr.stream.write(target_result.stderr)
+
+    return [results[target] for target in targets]
+
+
+def run_fanout_option(config_path: Path, args: List[str]) -> int:
+    """
+    Handle the --rsterm-fanout option of run_entry_point.
+
+    my_app --rsterm-fanout 'cluster_*' --jobs 4 run vacuum
+    my_app --rsterm-fanout cluster_eu,cluster_us --report report.json run report --day 2020-01-01
+
+    Returns: int 0 if the command succeeded on every target, otherwise 1
+    """
+    arg_parser = ArgumentParser(prog=FANOUT_OPTION, description='run a command once per db connection',
+                                usage=f"{FANOUT_OPTION} PATTERNS [--jobs N] [--report PATH] [--] verb noun ...")
+    arg_parser.add_argument('patterns', help='comma separated names or glob patterns of connections in db_connections')
+    arg_parser.add_argument('--jobs', '-j', type=int, default=4, help='number of targets to run at once')
+    arg_parser.add_argument('--report', help='also write the result and output of every target to this json file')
+
+    # the command starts at the first verb, or after --
+    config = RsTermConfig.load(config_path)
+    split = next((index for index, arg in enumerate(args) if arg == '--' or arg in config.verbs), len(args))
+    ns = arg_parser.parse_args(args[:split])
+    command = args[split + 1:] if args[split:split + 1] == ['--'] else args[split:]
+
+    if not command:
+        arg_parser.error('a command to run is required')
+
+    try:
+        targets = match_targets(config, [pattern for pattern in ns.patterns.split(',') if pattern])
+    except KeyError as error:
+        arg_parser.error(error.args[0])
+
+    start = time.perf_counter()
+    key = '_'.join(command[:2])
+    with command_scope(key):
+        target_results = run_fanout(config_path, command, targets, jobs=ns.jobs)
+
+        # statements from every target are summarized together, as the targets ran at the same time
+        instrumentation = sys.modules.get('rsterm.database.instrumentation')
+        if instrumentation is not None:
+            instrumentation.finish_command(key)
+    results = [target_result.result for target_result in target_results]
+
+    if ns.report:
+        Path(ns.report).write_text(json.dumps([target_result.to_dict() for target_result in target_results], indent=2))
+
+    print(format_results(results))
+    failed = [result.name for result in results if result.status != SUCCESS]
+    summary = f"{len(results) - len(failed)} of {len(results)} targets succeeded in {time.perf_counter() - start:.2f}s"
+    print(f"{summary}, failed: {', '.join(failed)}" if failed else summary)
+    return 1 if failed else 0
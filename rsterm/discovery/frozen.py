@@ -0,0 +1,31 @@
+import json
+from pathlib import Path
+from rsterm.configs.rsterm_config import freeze_config
+from rsterm.discovery.manifest import EntryPointManifest
+
+# the module holding the config snapshot and entry point manifest of an app built by rsterm.discovery.build
+FROZEN_MODULE = '_rsterm_frozen'
+
+
+def install_frozen(config_path: Path, config: str, manifest: str) -> None:
+    """
+    Use a config snapshot and entry point manifest, as written by rsterm.discovery.build.freeze, for the rest of the process.
+    """
+    freeze_config(config_path, config)
+    kwargs = json.loads(config)
+    data = json.loads(manifest)
+    EntryPointManifest.freeze(kwargs['app']['name'], EntryPointManifest(None, data['config_key'], data['modules']))
+
+
+def run_frozen() -> None:
+    """
+    Entry point of an archive built by rsterm.discovery.build.build_zipapp. The config path points inside the archive, and is only
+    used as a key for the frozen config.
+    """
+    from rsterm.discovery.discovery import run_entry_point
+
+    frozen = __import__(FROZEN_MODULE)
+    config_path = Path(frozen.__file__).parent / frozen.CONFIG_NAME
+
+    install_frozen(config_path, frozen.CONFIG, frozen.MANIFEST)
+    run_entry_point(config_path)
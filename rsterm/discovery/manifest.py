@@ -0,0 +1,401 @@
+import os
+import sys
+import json
+import hashlib
+import threading
+import importlib
+from importlib import import_module
+from importlib.machinery import all_suffixes
+from importlib.util import find_spec
+from typing import Any, Dict, List, Optional, Tuple, Type
+from pathlib import Path
+from rsterm.entrypoint.entrypoint import EntryPoint
+from rsterm.configs.rsterm_config import RsTermConfig
+from rsterm.discovery.parser import describe_entry_point
+from rsterm.profiler import phase
+
+MANIFEST_VERSION = 3
+MANIFEST_FILE_NAME = 'manifest.json'
+# the commands of the manifest alone, small enough to be read on every key press by shell completion
+COMMANDS_FILE_NAME = 'commands.json'
+
+# manifests embedded in an app built with rsterm build project, keyed on app name
+_frozen_manifests: Dict[str, 'EntryPointManifest'] = {}
+
+
+def file_digest(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def iter_modules(search_path: str) -> List[Tuple[str, bool]]:
+    """
+    List the modules and packages in a directory, as pkgutil.iter_modules does, without the cost of importing
+    inspect, which pkgutil pulls in.
+
+    Returns: List[Tuple[str, bool]] sorted (module name, is package) pairs
+    """
+    suffixes = sorted(all_suffixes(), key=len, reverse=True)
+    modules = {}
+
+    try:
+        dir_entries = sorted(os.scandir(search_path), key=lambda dir_entry: dir_entry.name)
+    except OSError:
+        return []
+
+    for dir_entry in dir_entries:
+        if dir_entry.is_dir():
+            if '.' not in dir_entry.name and any(os.path.isfile(os.path.join(dir_entry.path, f"__init__{suffix}"))
+                                                 for suffix in suffixes):
+                modules.setdefault(dir_entry.name, True)
+            continue
+
+        for suffix in suffixes:
+            if dir_entry.name.endswith(suffix):
+                name = dir_entry.name[:-len(suffix)]
+                if name != '__init__' and '.' not in name:
+                    modules.setdefault(name, False)
+                break
+
+    return sorted(modules.items())
+
+
+class EntryPointManifest:
+    """
+    On disk index of the EntryPoint classes found in the configured entrypoint_paths. Each module
+    file is recorded with its mtime, size and content hash, along with the verb_noun keys it provides,
+    so a command can be dispatched by importing only the module which implements it. The help line and
+    entry_point_args of each class are stored too, so the command line parser can be built without
+    importing anything, see rsterm.discovery.parser
+
+    The other modules of the project which were loaded by importing the entry point modules, such as shared helpers,
+    are recorded as dependencies with their mtime and size. When any of them changes, every entry point module is
+    imported again, as any of them may have been affected.
+
+    manifest = {
+        'version': 3,
+        'config_key': '<hash of the app / entrypoint_paths settings>',
+        'dependencies': {
+            '/abs/path/to/helpers.py': {'module': 'app.helpers', 'mtime_ns': 0, 'size': 0}
+        },
+        'modules': {
+            '/abs/path/to/module.py': {
+                'module': 'app.entrypoints.module',
+                'mtime_ns': 0,
+                'size': 0,
+                'sha256': '...',
+                'entry_points': {
+                    'verb_noun': {'class': 'VerbNoun', 'help': '...', 'arguments': [[['--flag'], {...}]]}
+                }
+            }
+        }
+    }
+    """
+
+    def __init__(self, path: Path = None, config_key: str = '', modules: Dict[str, Dict] = None,
+                 dependencies: Dict[str, Dict] = None) -> None:
+        self.path = path
+        self.config_key = config_key
+        self.modules = modules or {}
+        self.dependencies = dependencies or {}
+        self.changed = False
+        self._entries = None
+        self._commands = None
+        self._fingerprint = None
+
+    @property
+    def entries(self) -> Dict[str, Dict[str, str]]:
+        """
+        Returns: Dict[str, Dict[str, str]] verb_noun key -> {'module': module name, 'class': class name}
+        """
+        if self._entries is None:
+            self._entries = {}
+            for module_file in sorted(self.modules):
+                record = self.modules[module_file]
+                for key, entry_point in record['entry_points'].items():
+                    self._entries[key] = {'module': record['module'], 'class': entry_point['class']}
+        return self._entries
+
+    @property
+    def commands(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Returns: Dict[str, Dict[str, Any]] verb_noun key -> {'help': help line, 'arguments': serialized entry_point_args}
+        """
+        if self._commands is None:
+            self._commands = {}
+            for module_file in sorted(self.modules):
+                for key, entry_point in self.modules[module_file]['entry_points'].items():
+                    self._commands[key] = {'help': entry_point['help'], 'arguments': entry_point['arguments']}
+        return self._commands
+
+    @property
+    def fingerprint(self) -> str:
+        """
+        Returns: str a hash which changes whenever any entry point module changes
+        """
+        if self._fingerprint is None:
+            digests = [f"{module_file}:{self.modules[module_file]['sha256']}" for module_file in sorted(self.modules)]
+            self._fingerprint = hashlib.sha256('\n'.join([self.config_key] + digests).encode()).hexdigest()
+        return self._fingerprint
+
+    @classmethod
+    def load(cls, path: Path) -> 'EntryPointManifest':
+        """
+        Load a manifest from disk. A missing, corrupt or out of date manifest results in an empty one.
+        """
+        try:
+            data = json.loads(path.read_text())
+            if data.get('version') != MANIFEST_VERSION:
+                raise ValueError
+            return cls(path, data['config_key'], data['modules'], data['dependencies'])
+        except (OSError, ValueError, KeyError, TypeError):
+            return cls(path)
+
+    @staticmethod
+    def load_commands(cache_dir: Path) -> Dict[str, Dict[str, Any]]:
+        """
+        Read the commands index written next to the manifest, without loading the manifest itself.
+        Returns: Dict[str, Dict[str, Any]] as EntryPointManifest.commands, or an empty dict if there is no index yet
+        """
+        try:
+            data = json.loads((cache_dir / COMMANDS_FILE_NAME).read_text())
+            if data.get('version') != MANIFEST_VERSION:
+                raise ValueError
+            return data['commands']
+        except (OSError, ValueError, KeyError, TypeError):
+            return {}
+
+    def save(self) -> None:
+        """
+        Write the manifest and its commands index to disk if it has changed. Failing to write the cache is never fatal.
+        """
+        if not self.changed or self.path is None:
+            return
+
+        data = {'version': MANIFEST_VERSION, 'config_key': self.config_key, 'modules': self.modules,
+                'dependencies': self.dependencies}
+        commands = {'version': MANIFEST_VERSION, 'commands': self.commands}
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            for path, content in [(self.path.parent / COMMANDS_FILE_NAME, commands), (self.path, data)]:
+                # unique to the writer, so that processes and threads refreshing the manifest at once never
+                # publish each other's partly written files
+                tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+                tmp_path.write_text(json.dumps(content, separators=(',', ':'), sort_keys=True))
+                tmp_path.replace(path)
+            self.changed = False
+        except OSError:
+            pass
+
+    @classmethod
+    def for_config(cls, config: RsTermConfig, refresh: bool = True) -> 'EntryPointManifest':
+        """
+        Load the manifest belonging to an app config, bring it up to date with the files on disk and save it.
+        A frozen manifest is returned as it is, without looking at any file.
+        """
+        frozen = _frozen_manifests.get(config.app_name)
+        if frozen is not None:
+            return frozen
+
+        with phase('load manifest'):
+            manifest = cls.load(config.cache_dir / MANIFEST_FILE_NAME)
+
+        if refresh:
+            with phase('refresh manifest'):
+                manifest.refresh(config)
+                manifest.save()
+        return manifest
+
+    @staticmethod
+    def freeze(app_name: str, manifest: 'EntryPointManifest') -> None:
+        """
+        Use a manifest for an app in place of the one on disk, for the rest of the process.
+        """
+        _frozen_manifests[app_name] = manifest
+
+    @staticmethod
+    def get_frozen(app_name: str) -> Optional['EntryPointManifest']:
+        return _frozen_manifests.get(app_name)
+
+    @staticmethod
+    def get_project_path(config: RsTermConfig) -> str:
+        if config.is_pip_package:
+            spec = find_spec(config.app_name)
+            if spec is None or not spec.submodule_search_locations:
+                # fall back to importing the package, as the original discovery did
+                return getattr(import_module(config.app_name), '__path__')[0]
+            return list(spec.submodule_search_locations)[0]
+        return Path(config.app_name).absolute().as_posix()
+
+    @staticmethod
+    def get_config_key(config: RsTermConfig, project_path: str) -> str:
+        settings = [config.app_name, config.is_pip_package, list(config.entrypoint_paths), project_path]
+        return hashlib.sha256(json.dumps(settings).encode()).hexdigest()
+
+    @staticmethod
+    def scan_modules(config: RsTermConfig, project_path: str) -> Dict[str, str]:
+        """
+        Find every module in the configured entrypoint_paths without importing any of them.
+        Returns: Dict[str, str] absolute module file path -> module name to import
+        """
+        modules = {}
+        for entrypoint_path in config.entrypoint_paths:
+            doted_path = entrypoint_path.replace('/', '.')
+            search_path = f"{project_path}/{entrypoint_path}"
+
+            for name, is_pkg in iter_modules(search_path):
+                module_file = Path(search_path) / name / '__init__.py' if is_pkg else Path(search_path) / f"{name}.py"
+
+                if not module_file.exists():
+                    # compiled or extension modules are always treated as changed
+                    module_file = Path(search_path) / name
+
+                if config.is_pip_package:
+                    modules[module_file.as_posix()] = f"{config.app_name}.{doted_path}.{name}"
+                else:
+                    modules[module_file.as_posix()] = doted_path
+        return modules
+
+    @staticmethod
+    def import_entry_points(module_name: str, reload: bool = False) -> Dict[str, Dict[str, Any]]:
+        """
+        Import a module, and collect the EntryPoint classes it exposes.
+        Returns: Dict[str, Dict[str, Any]] verb_noun key -> attribute name of the class in the module, with
+                 its help line and serialized arguments
+        """
+        if reload and module_name in sys.modules:
+            # a fresh import, so that classes removed from the module do not linger in its namespace
+            del sys.modules[module_name]
+            importlib.invalidate_caches()
+
+        with phase(f"import {module_name}"):
+            module = import_module(module_name)
+
+        entry_points = {}
+        for attr_name, obj in sorted(vars(module).items()):
+            if isinstance(obj, type) and issubclass(obj, EntryPoint) and obj.is_entry_point():
+                entry_points[obj.name()] = dict(describe_entry_point(obj), **{'class': attr_name})
+        return entry_points
+
+    @staticmethod
+    def stat_of(path: Path) -> Tuple[Optional[int], Optional[int]]:
+        """
+        Returns: Tuple[Optional[int], Optional[int]] mtime_ns and size of the file, both None if it does not exist
+        """
+        try:
+            stat = path.stat()
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None, None
+
+    def dependencies_changed(self) -> bool:
+        """
+        Returns: bool True if any recorded dependency has changed, or no longer exists
+        """
+        return any(self.stat_of(Path(dependency_file)) != (record['mtime_ns'], record['size'])
+                   for dependency_file, record in self.dependencies.items())
+
+    @classmethod
+    def scan_dependencies(cls, project_path: str, module_files: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Find the modules of the project, other than the entry point modules, which are loaded in this process.
+        Returns: Dict[str, Dict[str, Any]] absolute module file path -> its module name, mtime_ns and size
+        """
+        prefix = os.path.join(project_path, '')
+        dependencies = {}
+
+        for module_name, module in list(sys.modules.items()):
+            module_file = getattr(module, '__file__', None)
+            if not module_file or not module_file.startswith(prefix) or module_file in module_files:
+                continue
+
+            mtime_ns, size = cls.stat_of(Path(module_file))
+            dependencies[module_file] = {'module': module_name, 'mtime_ns': mtime_ns, 'size': size}
+        return dependencies
+
+    def refresh(self, config: RsTermConfig) -> None:
+        """
+        Bring the manifest up to date. Only modules which are new, or whose content hash has changed
+        since the manifest was written are imported, unless a module they depend on has changed.
+        """
+        self._entries = self._commands = self._fingerprint = None
+        project_path = self.get_project_path(config)
+        config_key = self.get_config_key(config, project_path)
+        rebuild = config_key != self.config_key
+
+        if not rebuild and self.dependencies_changed():
+            # any entry point module may import the changed module, so all are imported again, after it
+            for record in self.dependencies.values():
+                sys.modules.pop(record['module'], None)
+            importlib.invalidate_caches()
+            rebuild = True
+
+        if rebuild:
+            reimport = {record['module'] for record in self.modules.values()}
+            self.config_key = config_key
+            self.modules = {}
+            self.dependencies = {}
+            self.changed = True
+        else:
+            reimport = set()
+
+        found = self.scan_modules(config, project_path)
+
+        for module_file in list(self.modules):
+            if module_file not in found:
+                del self.modules[module_file]
+                self.changed = True
+
+        imported = {}
+        for module_file, module_name in found.items():
+            record = self.modules.get(module_file)
+            path = Path(module_file)
+
+            mtime_ns, size = self.stat_of(path)
+
+            if record and record['module'] == module_name and record['mtime_ns'] == mtime_ns and record['size'] == size:
+                continue
+
+            digest = file_digest(path) if path.is_file() else None
+
+            if record and record['module'] == module_name and digest is not None and record['sha256'] == digest:
+                # touched, but not modified
+                record['mtime_ns'] = mtime_ns
+                self.changed = True
+                continue
+
+            if module_name not in imported:
+                imported[module_name] = self.import_entry_points(module_name,
+                                                                 reload=record is not None or module_name in reimport)
+
+            self.modules[module_file] = {
+                'module': module_name,
+                'mtime_ns': mtime_ns,
+                'size': size,
+                'sha256': digest,
+                'entry_points': imported[module_name]
+            }
+            self.changed = True
+
+        if imported:
+            # kept from earlier refreshes as well, as modules imported by them may not be loaded in this process
+            self.dependencies.update(self.scan_dependencies(project_path, found))
+
+    def get_module_names(self) -> List[str]:
+        return sorted({record['module'] for record in self.modules.values()})
+
+    def get_entry_point(self, key: str) -> Optional[Type[EntryPoint]]:
+        """
+        Import only the module which provides the verb_noun key and return its EntryPoint class.
+        Returns: the class, or None if no module provides the key.
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+
+        with phase(f"import {entry['module']}"):
+            module = import_module(entry['module'])
+        entry_point = getattr(module, entry['class'], None)
+
+        if isinstance(entry_point, type) and issubclass(entry_point, EntryPoint) and entry_point.name() == key:
+            return entry_point
+        return None
@@ -0,0 +1,275 @@
+import sys
+import hashlib
+from functools import partial
+from importlib import import_module
+from argparse import ArgumentParser, Namespace, _SubParsersAction
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type, TYPE_CHECKING
+from rsterm.configs.rsterm_config import RsTermConfig
+from rsterm.entrypoint.entrypoint import EntryPoint
+
+if TYPE_CHECKING:
+    from rsterm.discovery.manifest import EntryPointManifest
+
+VERB_DEST = '_rsterm_verb'
+NOUN_DEST = '_rsterm_noun'
+
+# one command parser per app, stored with the fingerprint of the config and manifest it was built from
+_command_parsers: Dict[str, Tuple[str, 'CommandParser']] = {}
+
+
+class Unserializable(ValueError):
+    pass
+
+
+class ImportedCallable:
+    """
+    Stand in for a callable stored in the manifest as "module:qualname", such as the type of an argument.
+    The module is only imported the first time the callable is called, so building a parser, or printing
+    its help, does not import entry point modules.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._target = None
+
+    @property
+    def __name__(self) -> str:
+        return self.path.rpartition('.')[2].rpartition(':')[2]
+
+    @property
+    def target(self) -> Callable:
+        if self._target is None:
+            self._target = resolve_callable(self.path)
+        return self._target
+
+    def __call__(self, *args, **kwargs) -> Any:
+        return self.target(*args, **kwargs)
+
+    def __repr__(self) -> str:
+        return self.__name__
+
+
+def resolve_callable(path: str) -> Callable:
+    module_name, _, qualname = path.partition(':')
+    obj = import_module(module_name)
+    for attr in qualname.split('.'):
+        obj = getattr(obj, attr)
+    return obj
+
+
+def serialize_value(value: Any) -> Any:
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+
+    if isinstance(value, list):
+        return [serialize_value(item) for item in value]
+
+    if isinstance(value, tuple):
+        return {'__tuple__': [serialize_value(item) for item in value]}
+
+    module, qualname = getattr(value, '__module__', None), getattr(value, '__qualname__', None)
+    if callable(value) and module and qualname and '<' not in qualname:
+        path = f"{module}:{qualname}"
+        try:
+            if resolve_callable(path) is value:
+                return {'__callable__': path}
+        except (ImportError, AttributeError):
+            pass
+
+    raise Unserializable(f"can not store {value!r} in the manifest")
+
+
+def deserialize_value(value: Any) -> Any:
+    if isinstance(value, list):
+        return [deserialize_value(item) for item in value]
+
+    if isinstance(value, dict):
+        if '__tuple__' in value:
+            return tuple(deserialize_value(item) for item in value['__tuple__'])
+
+        path = value['__callable__']
+        # builtins, argparse and anything else already imported can be resolved straight away
+        if path.partition(':')[0] in sys.modules:
+            return resolve_callable(path)
+        return ImportedCallable(path)
+
+    return value
+
+
+def serialize_args(args_config: Dict[Tuple[str, ...], Dict[str, Any]]) -> Optional[List]:
+    """
+    Convert an entry_point_args dict to json. Callables such as types and actions are stored as import paths.
+
+    Returns: Optional[List] [[flags, options], ...] or None if any option can not be stored, in which case the
+             entry point module is imported to build its parser
+    """
+    try:
+        return [[list(flags), {key: serialize_value(option) for key, option in options.items()}]
+                for flags, options in args_config.items()]
+    except Unserializable:
+        return None
+
+
+def deserialize_args(spec: List) -> Dict[Tuple[str, ...], Dict[str, Any]]:
+    return {tuple(flags): {key: deserialize_value(option) for key, option in options.items()} for flags, options in spec}
+
+
+def describe_entry_point(entry_point: Type[EntryPoint]) -> Dict[str, Any]:
+    """
+    Returns: Dict[str, Any] the help line and serialized arguments of an entry point, as stored in the manifest
+    """
+    doc = entry_point.__dict__.get('__doc__') or ''
+    return {'help': doc.strip().split('\n')[0].strip(), 'arguments': serialize_args(entry_point.entry_point_args)}
+
+
+class LazyParserMap(dict):
+    """
+    Name to parser map, holding a factory for each parser until it is first looked up.
+    """
+
+    def __getitem__(self, name: str) -> ArgumentParser:
+        parser = super().__getitem__(name)
+
+        if not isinstance(parser, ArgumentParser):
+            parser = parser()
+            self[name] = parser
+        return parser
+
+
+class LazySubParsersAction(_SubParsersAction):
+    """
+    Subcommand action which only builds the parser of the subcommand given on the command line. Building an
+    ArgumentParser for every verb and noun up front costs far more than parsing the one command being run.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._name_parser_map = self.choices = LazyParserMap()
+
+    def add_lazy_parser(self, name: str, build: Callable[[ArgumentParser], None], help: str = None,
+                        **kwargs) -> None:
+        """
+        Args:
+            name:  str the subcommand
+            build: Callable called with the new parser, to add its arguments
+            help:  str listed in the help of the parent parser. If None, the subcommand is accepted but not listed
+        """
+        def factory() -> ArgumentParser:
+            parser = self._parser_class(prog=f"{self._prog_prefix} {name}", **kwargs)
+            build(parser)
+            return parser
+
+        self._name_parser_map[name] = factory
+
+        if help is not None:
+            self._choices_actions.append(self._ChoicesPseudoAction(name, (), help))
+
+
+class CommandParser:
+    """
+    A single parser for the verb, the noun and the arguments of every command, with verbs and nouns as
+    subcommands. It is built from the config and the entry point manifest, which stores each entry point's
+    help line and entry_point_args, so usage, help and validation of any command are answered without importing
+    entry point modules. An entry point whose arguments could not be stored in the manifest is imported to
+    build its parser.
+    """
+
+    def __init__(self, config: RsTermConfig, manifest: 'EntryPointManifest') -> None:
+        self.config = config
+        self.manifest = manifest
+        self.commands = manifest.commands
+        # the parsers of commands with an entry point, by verb_noun key, once they are built
+        self.command_parsers: Dict[str, ArgumentParser] = {}
+        self._parser = None
+
+    @property
+    def parser(self) -> ArgumentParser:
+        if self._parser is None:
+            self._parser = ArgumentParser(prog=self.config.app_name, description=self.config.app_description)
+            # passing prog saves argparse formatting a usage line to work it out
+            verbs = self._parser.add_subparsers(dest=VERB_DEST, metavar='verb', action=LazySubParsersAction,
+                                                title='commands', prog=self.config.app_name)
+            verbs.required = True
+
+            nouns_by_verb = self.get_nouns_by_verb()
+            for verb in self.config.verbs:
+                verbs.add_lazy_parser(verb, partial(self.build_verb, verb), help=', '.join(nouns_by_verb.get(verb, [])))
+        return self._parser
+
+    def get_nouns_by_verb(self) -> Dict[str, List[str]]:
+        """
+        Returns: Dict[str, List[str]] the nouns with an entry point, for each verb
+        """
+        verbs, nouns = set(self.config.verbs), set(self.config.nouns)
+        nouns_by_verb = {}
+
+        for key in self.commands:
+            # verbs and nouns may themselves contain underscores, so try every split of the key
+            for index, char in enumerate(key):
+                if char == '_' and key[:index] in verbs and key[index + 1:] in nouns:
+                    nouns_by_verb.setdefault(key[:index], []).append(key[index + 1:])
+                    break
+        return nouns_by_verb
+
+    def build_verb(self, verb: str, parser: ArgumentParser) -> None:
+        nouns = parser.add_subparsers(dest=NOUN_DEST, metavar='noun', action=LazySubParsersAction, title='commands',
+                                      prog=parser.prog)
+        nouns.required = True
+
+        for noun in self.config.nouns:
+            key = f"{verb}_{noun}"
+            command = self.commands.get(key)
+            nouns.add_lazy_parser(noun, partial(self.build_command, key), help=command['help'] if command else None,
+                                  description=command['help'] if command else None)
+
+    def build_command(self, key: str, parser: ArgumentParser) -> None:
+        args_config = self.get_args_config(key)
+
+        if args_config is not None:
+            for flags, options in args_config.items():
+                parser.add_argument(*flags, **options)
+            self.command_parsers[key] = parser
+
+    def get_args_config(self, key: str) -> Optional[Dict[Tuple[str, ...], Dict[str, Any]]]:
+        command = self.commands.get(key)
+
+        if command is not None and command['arguments'] is not None:
+            return deserialize_args(command['arguments'])
+
+        entry_point = self.manifest.get_entry_point(key)
+        return entry_point.entry_point_args if entry_point is not None else None
+
+    def parse(self, args: List[str]) -> Tuple[str, Namespace]:
+        """
+        Parse a whole command line. Exits through argparse on invalid input or --help, like parse_args.
+        A verb and noun from the config without an entry point are accepted along with any arguments,
+        so the dispatcher can report that the command is not implemented.
+
+        Returns: Tuple[str, Namespace] the verb_noun key, and the arguments of the command
+        """
+        ns, extras = self.parser.parse_known_args(args)
+        key = f"{getattr(ns, VERB_DEST)}_{getattr(ns, NOUN_DEST)}"
+
+        command_parser = self.command_parsers.get(key)
+        if extras and command_parser is not None:
+            command_parser.error(f"unrecognized arguments: {' '.join(extras)}")
+
+        return key, Namespace(**{name: value for name, value in vars(ns).items() if name not in (VERB_DEST, NOUN_DEST)})
+
+    @staticmethod
+    def fingerprint(config: RsTermConfig, manifest: 'EntryPointManifest') -> str:
+        settings = '\n'.join([config.app_name, config.app_description or '', *config.verbs, '', *config.nouns])
+        return hashlib.sha256(f"{settings}\n{manifest.fingerprint}".encode()).hexdigest()
+
+
+def get_command_parser(config: RsTermConfig, manifest: 'EntryPointManifest') -> CommandParser:
+    """
+    Returns: CommandParser for the app, built once per process and rebuilt only when the config or manifest change
+    """
+    fingerprint = CommandParser.fingerprint(config, manifest)
+    memo = _command_parsers.get(config.app_name)
+
+    if memo is None or memo[0] != fingerprint:
+        memo = (fingerprint, CommandParser(config, manifest))
+        _command_parsers[config.app_name] = memo
+    return memo[1]
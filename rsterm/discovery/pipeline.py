@@ -0,0 +1,267 @@
+import os
+import sys
+import json
+import time
+import shlex
+import hashlib
+import traceback
+from pathlib import Path
+from argparse import ArgumentParser
+from contextlib import redirect_stdout, redirect_stderr
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, NamedTuple, Optional
+from rsterm.configs.rsterm_config import RsTermConfig
+from rsterm.discovery.discovery import dispatch, PIPELINE_OPTION
+from rsterm.discovery.manifest import EntryPointManifest
+from rsterm.exceptions import GraphError, PipelineStepFailed
+from rsterm.scheduler import TaskGraph, TaskResult, run_graph, format_results, SUCCESS
+
+# the manifest of a worker process, loaded once and shared by every step the worker runs
+_worker_manifest: Optional[EntryPointManifest] = None
+
+
+class PipelineStep(NamedTuple):
+    name: str
+    args: List[str]
+    depends_on: List[str]
+    retries: int = 0
+    retry_delay: float = 0.0
+
+
+class Pipeline(NamedTuple):
+    name: str
+    steps: Dict[str, PipelineStep]
+    jobs: int = 1
+
+    @property
+    def fingerprint(self) -> str:
+        """
+        Returns: str a hash of the steps, so that state saved by a different definition of the pipeline is not resumed
+        """
+        steps = [[step.name, step.args, sorted(step.depends_on)] for step in self.steps.values()]
+        return hashlib.sha256(json.dumps(sorted(steps)).encode()).hexdigest()
+
+    def graph(self, done: List[str] = None) -> TaskGraph:
+        """
+        Returns: TaskGraph of every step which is not done. Dependencies on done steps are already met.
+        """
+        done = set(done or [])
+        return TaskGraph({name: [dep for dep in step.depends_on if dep not in done]
+                          for name, step in self.steps.items() if name not in done})
+
+
+def read_pipeline(config: RsTermConfig, name: str) -> Pipeline:
+    """
+    Read a pipeline from the pipelines section of the config. A step's command is written as on the terminal,
+    without the app name, either as one string or as a list of arguments.
+
+    pipelines:
+      nightly:
+        jobs: 4               # steps run at once, defaults to 1
+        retries: 1            # default retries of every step, defaults to 0
+        steps:
+          extract:
+            command: run extract --day yesterday
+            retries: 3
+            retry_delay: 30   # seconds between attempts, defaults to 0
+          transform:
+            command: [run, transform]
+            depends_on: [extract]
+
+    Returns: Pipeline
+    Raises:  KeyError naming the pipeline if it is not in the config
+             ValueError naming the pipeline and the step if a step has no command
+    """
+    if name not in config.pipelines:
+        raise KeyError(f"unknown pipeline {name}, must be one of {sorted(config.pipelines)}")
+
+    settings = config.pipelines[name] or {}
+    steps = {}
+
+    for index, (step_name, step) in enumerate((settings.get('steps') or {}).items()):
+        command = step.get('command') if isinstance(step, dict) else None
+        if not command:
+            raise ValueError(f"step {index} ({step_name}) of pipeline {name} has no command")
+        steps[step_name] = PipelineStep(step_name,
+                                        shlex.split(command) if isinstance(command, str) else [str(a) for a in command],
+                                        list(step.get('depends_on') or []),
+                                        int(step.get('retries', settings.get('retries', 0))),
+                                        float(step.get('retry_delay', settings.get('retry_delay', 0))))
+
+    return Pipeline(name, steps, int(settings.get('jobs', 1)))
+
+
+def init_worker(config_path: Path) -> None:
+    """
+    Initializer of the worker processes. Workers forked from the runner inherit its manifest and imported modules,
+    others load the manifest once, without importing anything.
+    """
+    global _worker_manifest
+
+    if _worker_manifest is None:
+        _worker_manifest = EntryPointManifest.for_config(RsTermConfig.load(config_path))
+
+
+class StepTask:
+    """
+    Runs the steps of a pipeline in a worker process, retrying each until it succeeds or has no retries left. The
+    output of each step is written to <log_dir>/<step>.log. Picklable, so it can be sent to a process pool.
+    """
+
+    def __init__(self, config_path: Path, pipeline: Pipeline, log_dir: Path) -> None:
+        self.config_path = config_path
+        self.pipeline = pipeline
+        self.log_dir = log_dir
+
+    def log_path(self, name: str) -> Path:
+        return self.log_dir / f"{name}.log"
+
+    def __call__(self, name: str) -> int:
+        """
+        Returns: int the number of attempts it took
+        Raises:  PipelineStepFailed once the last attempt has failed
+        """
+        step = self.pipeline.steps[name]
+        error = None
+
+        with self.log_path(name).open('w') as log_file, redirect_stdout(log_file), redirect_stderr(log_file):
+            for attempt in range(1, step.retries + 2):
+                if attempt > 1:
+                    print(f"--- attempt {attempt} of {step.retries + 1}, after: {error}")
+                    time.sleep(step.retry_delay)
+
+                try:
+                    exit_code = dispatch(self.config_path, step.args, manifest=_worker_manifest)
+                    error = None if exit_code == 0 else f"exit code {exit_code}"
+                except Exception as exception:
+                    traceback.print_exc()
+                    error = f"{type(exception).__name__}: {exception}"
+                finally:
+                    RsTermConfig.close_db_pools()
+
+                if error is None:
+                    return attempt
+
+        raise PipelineStepFailed(f"{error} after {step.retries + 1} attempt(s)")
+
+
+class PipelineRunner:
+    """
+    Runs the steps of a pipeline on a process pool, starting every step as soon as the steps it depends on have
+    succeeded. The entry point manifest is loaded once, before the workers are started, and each worker runs many
+    steps, so steps do not pay the startup cost of a separate command. When a step fails nothing else is started,
+    and the run can be resumed from the steps which did not succeed.
+
+    The status of every step is saved to the app's cache directory as it finishes, along with its output.
+
+    Args:
+        config_path: Path to the rsterm.yml config file
+        pipeline:    Pipeline to run
+        jobs:        int steps run at once, defaults to the jobs of the pipeline
+    """
+
+    def __init__(self, config_path: Path, pipeline: Pipeline, jobs: int = None) -> None:
+        self.config_path = config_path
+        self.pipeline = pipeline
+        self.jobs = jobs or pipeline.jobs
+        self.state_dir = RsTermConfig.load(config_path).cache_dir / 'pipelines' / pipeline.name
+        self.state_path = self.state_dir / 'state.json'
+        self._statuses: Dict[str, str] = {}
+
+    def read_state(self) -> Dict[str, str]:
+        """
+        Returns: Dict[str, str] step name -> status of the last run, if it ran the same definition of the pipeline
+        """
+        try:
+            state = json.loads(self.state_path.read_text())
+        except (OSError, ValueError):
+            return {}
+
+        if state.get('fingerprint') != self.pipeline.fingerprint:
+            print(f"the steps of {self.pipeline.name} have changed since the last run, starting from the beginning")
+            return {}
+        return state.get('steps', {})
+
+    def save_state(self) -> None:
+        tmp_path = self.state_path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps({'fingerprint': self.pipeline.fingerprint, 'steps': self._statuses}))
+        tmp_path.replace(self.state_path)
+
+    def report(self, result: TaskResult) -> None:
+        self._statuses[result.name] = result.status
+        self.save_state()
+
+        attempts = f", {result.value} attempts" if result.value and result.value > 1 else ''
+        print(f"==> [{result.status}] {result.name} {result.seconds:.2f}s{attempts}")
+
+        log_path = self.state_dir / 'logs' / f"{result.name}.log"
+        if log_path.exists():
+            print(log_path.read_text(), end='')
+        if result.error:
+            print(result.error)
+        sys.stdout.flush()
+
+    def run(self, resume: bool = False) -> Dict[str, TaskResult]:
+        """
+        Args:
+            resume: bool only run the steps which did not succeed in the last run
+
+        Returns: Dict[str, TaskResult] the result of every step, steps which succeeded in the last run included
+        """
+        global _worker_manifest
+
+        done = [name for name, status in self.read_state().items() if status == SUCCESS] if resume else []
+        done = [name for name in done if name in self.pipeline.steps]
+        graph = self.pipeline.graph(done)
+
+        if done:
+            print(f"resuming {self.pipeline.name}, skipping {', '.join(sorted(done))}")
+
+        (self.state_dir / 'logs').mkdir(parents=True, exist_ok=True)
+        self._statuses = {name: SUCCESS for name in done}
+        self.save_state()
+
+        # loaded here, so that forked workers inherit it along with the modules it imported
+        _worker_manifest = EntryPointManifest.for_config(RsTermConfig.load(self.config_path))
+        task = StepTask(self.config_path, self.pipeline, self.state_dir / 'logs')
+        sys.stdout.flush()
+
+        try:
+            with ProcessPoolExecutor(max_workers=self.jobs, initializer=init_worker,
+                                     initargs=(self.config_path,)) as executor:
+                results = run_graph(graph, task, executor, on_complete=self.report)
+        finally:
+            _worker_manifest = None
+
+        results.update({name: TaskResult(name, SUCCESS, error='succeeded in the last run') for name in done})
+        return {name: results[name] for name in self.pipeline.graph().order()}
+
+
+def run_pipeline_option(config_path: Path, args: List[str]) -> int:
+    """
+    Handle the --rsterm-pipeline option of run_entry_point.
+
+    my_app --rsterm-pipeline nightly --jobs 4
+    my_app --rsterm-pipeline nightly --resume
+
+    Returns: int 0 if every step succeeded, otherwise 1
+    """
+    arg_parser = ArgumentParser(prog=PIPELINE_OPTION, description='run a pipeline from the config')
+    arg_parser.add_argument('pipeline', help='name of the pipeline in the pipelines section of the config')
+    arg_parser.add_argument('--resume', action='store_true', help='only run the steps which did not succeed last time')
+    arg_parser.add_argument('--jobs', '-j', type=int, help='number of steps to run at once')
+    ns = arg_parser.parse_args(args)
+
+    try:
+        pipeline = read_pipeline(RsTermConfig.load(config_path), ns.pipeline)
+        # an unknown or cyclic depends_on is reported as a usage error, before any step runs
+        pipeline.graph()
+    except (KeyError, ValueError, GraphError) as error:
+        arg_parser.error(error.args[0])
+
+    start = time.perf_counter()
+    results = PipelineRunner(config_path, pipeline, jobs=ns.jobs).run(resume=ns.resume)
+
+    print(format_results(results.values()))
+    print(f"{pipeline.name} finished in {time.perf_counter() - start:.2f}s")
+    return 0 if all(result.status == SUCCESS for result in results.values()) else 1
@@ -1,2 +1,3 @@
 # flake8: noqa
 from .entrypoint import EntryPoint, parse_cmd_args
+from .resources import Resource, DbConnection, S3Bucket, IamRole, AwsSecret
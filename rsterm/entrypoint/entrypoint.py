@@ -1,17 +1,28 @@
 import sys
-from typing import Dict, Tuple
+from typing import Any, Dict, Iterator, List, Tuple, TYPE_CHECKING
 from abc import ABC, abstractmethod
 from pathlib import Path
 from argparse import ArgumentParser, Namespace
 from rsterm.configs.rsterm_config import RsTermConfig
+from rsterm.entrypoint.resources import OPENED_ATTRIBUTE
+from rsterm.profiler import phase, check_budget
 
+if TYPE_CHECKING:
+    from rsterm.database.bulk_load import LoadResult
+    from rsterm.database.export import ExportResult
+    from rsterm.database.query_cache import QueryResult
+    from rsterm.scheduler import TaskResult
+    from rsterm.storage.sync import SyncResult
 
-def parse_cmd_args(args_config: Dict[Tuple[str, str], Dict[str, str]], arg_index: int = 0) -> Namespace:
+
+def parse_cmd_args(args_config: Dict[Tuple[str, str], Dict[str, str]], arg_index: int = 0,
+                   args: List[str] = None) -> Namespace:
     """
     Parse command line args in one call, using a dict as a configuration.
     Args:
         args_config: Dict[Tuple, Dict[str, Any]] according to standard lib ArgumentParser kwargs
         arg_index:   int starting index of the arguments to be parsed from sys.argv
+        args:        List[str] arguments to parse instead of sys.argv
 
     Returns: Namespace
     """
@@ -19,7 +30,7 @@ def parse_cmd_args(args_config: Dict[Tuple[str, str], Dict[str, str]], arg_index
 
     for command, options in args_config.items():
         arg_parser.add_argument(*command, **options)
-    return arg_parser.parse_args(sys.argv[arg_index:])
+    return arg_parser.parse_args(sys.argv[arg_index:] if args is None else args)
 
 
 class EntryPoint(ABC):
@@ -34,39 +45,255 @@ class EntryPoint(ABC):
         }
     }
 
+    Connections, buckets and other resources can be declared as class attributes. Each is created the first
+    time it is used, and closed by close_resources once run has finished, see rsterm.entrypoint.resources
+
+    warehouse = DbConnection('redshift')
+
     """
 
     # override this class dict with any arguments which apply only to this entry point
     # or which would otherwise apply to all descendant EntryPoint objects.
     entry_point_args = {}
 
-    def __init__(self, config_path: Path = None):
+    # names in the aws_secrets section this entry point needs. They are resolved together, in one
+    # batch, before run is called, and are available in self.secrets
+    required_secrets = []
+
+    # limits on the resources run may use, such as {'max_seconds': 600, 'max_rss_mb': 2048, 'action': 'abort'}.
+    # budgets in the terminal section of the config override these, see rsterm.profiler.accounting
+    resource_budget = {}
+
+    # the connection in db_connections this command runs against, when it is fanned out over several with
+    # --rsterm-fanout. DbConnection() without a name connects to it
+    db_target = None
+
+    def __init__(self, config_path: Path = None, args: List[str] = None, cmd_args: Namespace = None):
         """
         Args:
             config_path: Path[Optional] if provided, must be a path to an rsterm.yml config file.
                          if not provided, will default to root/<my_app>/my_app.yml
+            args:        List[str][Optional] the arguments of this command, following the verb and noun.
+                         if not provided, they are read from sys.argv
+            cmd_args:    Namespace[Optional] the already parsed arguments of this command, as given by the
+                         dispatcher's command parser. args is ignored when this is provided
         """
-        rsterm: RsTermConfig = RsTermConfig.parse_config(config_path)
-
-        if rsterm.override_file:
-            rsterm = RsTermConfig.override_config(rsterm)
+        with phase('load config'):
+            rsterm: RsTermConfig = RsTermConfig.load(config_path)
 
         if rsterm.load_env:
-            RsTermConfig.load_rsterm_env(rsterm)
+            with phase('load env'):
+                RsTermConfig.load_rsterm_env(rsterm)
 
         self.rsterm = rsterm
-        self.cmd_args: Namespace = parse_cmd_args(self.entry_point_args, arg_index=3)
+        self.secrets: Dict[str, str] = {}
+
+        if self.required_secrets:
+            with phase('resolve secrets'):
+                self.secrets = rsterm.resolve_secrets(self.required_secrets)
+
+        # parsed on first use when not given, see cmd_args
+        self._args = args
+        self._cmd_args = cmd_args
+
+    @property
+    def cmd_args(self) -> Namespace:
+        if self._cmd_args is None:
+            with phase('parse command args'):
+                self._cmd_args = parse_cmd_args(self.entry_point_args, arg_index=3, args=self._args)
+        return self._cmd_args
+
+    @cmd_args.setter
+    def cmd_args(self, cmd_args: Namespace) -> None:
+        self._cmd_args = cmd_args
+
+    def close_resources(self) -> None:
+        """
+        Close every Resource this entry point has opened, most recent first, so that each is created again if it is
+        used afterwards. All of them are closed even if closing one fails, and then the first error is raised.
+        """
+        opened = self.__dict__.pop(OPENED_ATTRIBUTE, [])
+        errors = []
+
+        for resource in reversed(opened):
+            value = self.__dict__.pop(resource.name, None)
+            try:
+                resource.close(value)
+            except Exception as error:
+                errors.append(error)
+
+        if errors:
+            raise errors[0]
+
+    def check_budget(self) -> None:
+        """
+        Stop the command if it has gone over a resource_budget with action abort. The budget is checked by a
+        watchdog thread, which only flags the command, so long loops should call this between their steps. It is also
+        checked whenever a Resource is created, and by the helpers below.
+
+        Raises: ResourceBudgetExceeded if the command has been aborted
+        """
+        check_budget()
+
+    def __enter__(self) -> 'EntryPoint':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close_resources()
 
     @abstractmethod
     def run(self) -> None:
         """
         Must be implemented by the child entry point class. This is where you put the code
-        you want to execute when your command is run.
+        you want to execute when your command is run. May also be declared with async def, in which
+        case the dispatcher runs it on an event loop.
         Returns:
 
         """
         pass
 
+    def export_query(self, connection_name: str, sql: str, output_dir: Path, **kwargs) -> 'ExportResult':
+        """
+        Stream the result of a query into rolling, optionally compressed csv files with constant memory use,
+        and print the rows per second achieved. kwargs are passed to rsterm.database.export.export_query
+        Args:
+            connection_name: str name of the connection in db_connections
+            sql:             str the query to export
+            output_dir:      Path directory to write the files to
+
+        Returns: ExportResult
+        """
+        from rsterm.database.export import export_query
+
+        self.check_budget()
+
+        with self.rsterm.db_connection(connection_name) as conn:
+            result = export_query(conn, sql, Path(output_dir), **kwargs)
+
+        print(result.summary())
+        return result
+
+    def cached_query(self, connection_name: str, sql: str, params: Any = None, ttl: float = None,
+                     refresh: bool = False) -> 'QueryResult':
+        """
+        Run a read only query, returning its result from the on disk query cache when the same sql and params
+        have been run on the connection within ttl seconds. A connection is only opened on a cache miss.
+        Clear the cache with my_app --rsterm-query-cache clear, see rsterm.database.query_cache
+        Args:
+            connection_name: str name of the connection in db_connections
+            sql:             str the query to run
+            params:          parameters of the query, as given to cursor.execute
+            ttl:             float seconds to keep this result for, defaults to the ttl of the query_cache section
+            refresh:         bool run the query even if it is cached, and cache the new result
+
+        Returns: QueryResult the column names and rows
+        """
+        from rsterm.database.query_cache import cached_query
+
+        self.check_budget()
+
+        # keyed on the connection string as well as the name, which may point at another database next time
+        result, _ = cached_query(self.rsterm.get_query_cache(), connection_name,
+                                 lambda: self.rsterm.get_db_connection(connection_name), sql, params=params, ttl=ttl,
+                                 refresh=refresh, target=self.rsterm.get_connection_string(connection_name))
+        return result
+
+    def fetch_batches(self, connection_name: str, sql: str, params: Any = None, batch_size: int = 10000,
+                      output: str = 'numpy') -> Iterator[Any]:
+        """
+        Run a query through a server side cursor, yielding its result in batches of up to batch_size rows as dicts of
+        column name -> numpy array, or as pyarrow record batches with output='arrow'. The connection is released once
+        every batch has been read, or the iterator is closed. See rsterm.database.batches.fetch_batches
+
+        for batch in self.fetch_batches('redshift', 'select id, amount from payments', batch_size=100000):
+            total += batch['amount'].sum()
+
+        Returns: Iterator of batches
+        """
+        from rsterm.database.batches import fetch_batches
+
+        self.check_budget()
+
+        with self.rsterm.db_connection(connection_name) as conn:
+            for batch in fetch_batches(conn, sql, params=params, batch_size=batch_size, output=output):
+                yield batch
+                self.check_budget()
+
+    def bulk_load(self, connection_name: str, path: Path, table: str, jobs: int = None, **kwargs) -> 'LoadResult':
+        """
+        Load a large csv or jsonl file into a table, copying chunks of it into a staging table on pooled connections
+        in parallel, then appending, swapping or merging the staging table into the table in one transaction.
+        Rejected records are written to <path>.rejects. See rsterm.database.bulk_load.BulkLoader
+
+        self.bulk_load('warehouse', 'orders.csv', 'sales.orders', mode='merge', keys=['order_id'], max_rejects=10)
+
+        Args:
+            connection_name: str name of the connection in db_connections
+            path:            Path of the csv or jsonl file
+            table:           str [schema.]table to load into
+            jobs:            int chunks loaded at once, defaults to and is bounded by the max_size of the pool
+            kwargs:          chunk_bytes, max_rejects and verbose of BulkLoader, and the arguments of BulkLoader.load
+
+        Returns: LoadResult
+        """
+        from rsterm.database.bulk_load import BulkLoader
+
+        self.check_budget()
+
+        loader_kwargs = {key: kwargs.pop(key) for key in ('chunk_bytes', 'max_rejects', 'verbose') if key in kwargs}
+        pool = self.rsterm.get_db_pool(connection_name)
+        loader = BulkLoader(pool.getconn, jobs=min(jobs or pool.max_size, pool.max_size), **loader_kwargs)
+        return loader.load(Path(path), table, **kwargs)
+
+    def run_sql_scripts(self, connection_name: str, directory: Path, max_workers: int = 4,
+                        manifest_path: Path = None, stop_on_failure: bool = True) -> Dict[str, 'TaskResult']:
+        """
+        Run a directory of .sql files, executing scripts whose dependencies have completed concurrently, with
+        a connection per worker. Dependencies are declared with "-- depends_on: other_script" header comments,
+        or in a sql_manifest.yml file in the directory. Per script timings are printed as they finish.
+
+        Returns: Dict[str, TaskResult] the result of every script, by name
+        """
+        from rsterm.database.sql_runner import SqlScriptRunner
+
+        self.check_budget()
+
+        runner = SqlScriptRunner(lambda: self.rsterm.get_db_connection(connection_name),
+                                 max_workers=max_workers, stop_on_failure=stop_on_failure)
+        return runner.run(Path(directory), Path(manifest_path) if manifest_path else None)
+
+    def sync_directory(self, bucket_name: str, local_dir: Path, prefix: str = '', delete: bool = False,
+                       **kwargs) -> 'SyncResult':
+        """
+        Upload the files of a directory which have changed since the last sync to a bucket from s3_buckets, on a
+        thread pool, in parts for large files. What was uploaded is kept in a manifest in the app's cache directory,
+        so an interrupted sync is resumed where it stopped. See rsterm.storage.sync.DirectorySync
+
+        self.sync_directory('exports', 'build/unload', prefix='unload/2020-01-01', jobs=16)
+
+        Args:
+            bucket_name: str name of the bucket in s3_buckets
+            local_dir:   Path of the directory to upload
+            prefix:      str key prefix the files are uploaded under
+            delete:      bool also delete objects of files which no longer exist locally
+            kwargs:      jobs, part_size, multipart_threshold and verbose of DirectorySync
+
+        Returns: SyncResult
+        Raises:  SyncError if any file failed to upload, after every other file has been uploaded
+        """
+        from rsterm.exceptions import SyncError
+        from rsterm.storage.sync import sync_directory
+
+        self.check_budget()
+
+        result = sync_directory(self.rsterm.get_storage_backend(bucket_name), Path(local_dir), prefix,
+                                self.rsterm.get_sync_manifest_path(bucket_name, prefix), delete=delete, **kwargs)
+        print(result.summary())
+
+        if result.failed:
+            raise SyncError('\n'.join(f"{name}: {error}" for name, error in sorted(result.failed.items())))
+        return result
+
     @classmethod
     def name(cls) -> str:
         """
@@ -0,0 +1,114 @@
+from typing import Any, Callable, Optional, TYPE_CHECKING
+from rsterm.profiler.accounting import check_budget
+
+if TYPE_CHECKING:
+    from rsterm.entrypoint.entrypoint import EntryPoint
+
+# instance attribute holding the resources an entry point has opened, in the order they were opened
+OPENED_ATTRIBUTE = '_opened_resources'
+
+
+class Resource:
+    """
+    A value an entry point creates the first time it is used, and keeps for the rest of the command. Declare
+    resources as class attributes. Commands which never use a resource never create it, and those which do have
+    it closed by EntryPoint.close_resources, which the dispatcher calls once run has finished, even if it failed.
+    A command aborted for going over its resource budget raises ResourceBudgetExceeded when it next creates one.
+
+    class ExportReport(EntryPoint):
+        warehouse = DbConnection('redshift')
+        bucket = S3Bucket('exports')
+        tmp_dir = Resource(lambda entry_point: tempfile.mkdtemp(), close=shutil.rmtree)
+
+    Args:
+        create: Callable[[EntryPoint], Any] makes the value, given the entry point
+        close:  Callable[[Any], None] optional, releases the value
+    """
+
+    def __init__(self, create: Callable[['EntryPoint'], Any] = None,
+                 close: Callable[[Any], None] = None) -> None:
+        self._create = create
+        self._close = close
+        self.name: Optional[str] = None
+
+    def __set_name__(self, owner: type, name: str) -> None:
+        self.name = name
+
+    def __get__(self, instance: Optional['EntryPoint'], owner: type) -> Any:
+        if instance is None:
+            return self
+
+        check_budget()
+        value = self.create(instance)
+        # stored on the instance, which hides this descriptor from then on
+        instance.__dict__[self.name] = value
+        instance.__dict__.setdefault(OPENED_ATTRIBUTE, []).append(self)
+        return value
+
+    def create(self, entry_point: 'EntryPoint') -> Any:
+        return self._create(entry_point)
+
+    def close(self, value: Any) -> None:
+        if self._close is not None:
+            self._close(value)
+
+
+class DbConnection(Resource):
+    """
+    A connection from db_connections, checked out of its pool when pooled, and closed or returned when the command
+    is finished. Without a connection name, it is the entry point's db_target, the connection the command was
+    fanned out to.
+    """
+
+    def __init__(self, connection_name: str = None) -> None:
+        super().__init__()
+        self.connection_name = connection_name
+
+    def create(self, entry_point: 'EntryPoint') -> Any:
+        connection_name = self.connection_name or entry_point.db_target
+        if connection_name is None:
+            raise ValueError(f"{self.name} has no connection name, and the command was not run with --rsterm-fanout")
+        return entry_point.rsterm.get_db_connection(connection_name)
+
+    def close(self, value: Any) -> None:
+        value.close()
+
+
+class S3Bucket(Resource):
+    """
+    The name of a bucket from s3_buckets.
+    """
+
+    def __init__(self, bucket_name: str) -> None:
+        super().__init__()
+        self.bucket_name = bucket_name
+
+    def create(self, entry_point: 'EntryPoint') -> str:
+        return entry_point.rsterm.get_s3_bucket(self.bucket_name)
+
+
+class IamRole(Resource):
+    """
+    The arn of a role from iam_roles.
+    """
+
+    def __init__(self, role_name: str) -> None:
+        super().__init__()
+        self.role_name = role_name
+
+    def create(self, entry_point: 'EntryPoint') -> str:
+        return entry_point.rsterm.get_iam_role(self.role_name)
+
+
+class AwsSecret(Resource):
+    """
+    A secret from aws_secrets, resolved through the app's secret resolver. Use required_secrets instead when an
+    entry point always needs several secrets, so they are fetched in one batch.
+    """
+
+    def __init__(self, secret_name: str) -> None:
+        super().__init__()
+        self.secret_name = secret_name
+
+    def create(self, entry_point: 'EntryPoint') -> str:
+        return entry_point.rsterm.get_aws_secret(self.secret_name)
@@ -1,2 +1,34 @@
 class AppConfigFileNotSet(Exception):
     pass
+
+
+class PoolExhausted(Exception):
+    pass
+
+
+class PoolClosed(Exception):
+    pass
+
+
+class GraphError(Exception):
+    pass
+
+
+class SecretNotFound(Exception):
+    pass
+
+
+class PipelineStepFailed(Exception):
+    pass
+
+
+class BulkLoadError(Exception):
+    pass
+
+
+class ResourceBudgetExceeded(Exception):
+    pass
+
+
+class SyncError(Exception):
+    pass
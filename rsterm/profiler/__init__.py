@@ -0,0 +1,5 @@
+# flake8: noqa
+from .profiler import PhaseProfiler, phase, call_profiled, get_profiler, start_profiling, stop_profiling, \
+    extract_profile_options, print_report
+from .accounting import ResourceBudget, ResourceMonitor, get_budget, check_budget, current_monitor, append_metrics, \
+    CommandScope, command_scope, current_command, bind_command
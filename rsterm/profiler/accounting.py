@@ -0,0 +1,393 @@
+import gc
+import os
+import sys
+import json
+import time
+import threading
+from pathlib import Path
+from functools import wraps
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Type, TYPE_CHECKING
+from rsterm.exceptions import ResourceBudgetExceeded
+
+if TYPE_CHECKING:
+    from rsterm.configs.rsterm_config import RsTermConfig
+
+BUDGET_ACTIONS = ('warn', 'abort')
+
+# what a command's metrics record says happened to it
+SUCCESS = 'success'
+FAILED = 'failed'
+ABORTED = 'aborted'
+
+# exit code of a process killed for not stopping within kill_after seconds of being aborted
+KILLED_EXIT_CODE = 3
+
+# the monitor of the command running on this thread, checked by check_budget
+_current = threading.local()
+
+# the command running in this context, so that totals kept per command, such as those of
+# rsterm.database.instrumentation, are kept apart when commands run at once on threads of one process
+_command: 'ContextVar[Optional[CommandScope]]' = ContextVar('rsterm_command', default=None)
+
+
+class ResourceBudget(NamedTuple):
+    """
+    Limits on what one command may use. A limit of None is not checked. kill_after is the seconds an aborted
+    command has to stop before the whole process is killed, see ResourceMonitor.
+    """
+    max_seconds: Optional[float] = None
+    max_cpu_seconds: Optional[float] = None
+    max_rss_mb: Optional[float] = None
+    action: str = 'warn'
+    check_interval: float = 0.5
+    kill_after: Optional[float] = None
+
+    @classmethod
+    def from_dict(cls, settings: Dict[str, Any]) -> 'ResourceBudget':
+        action = settings.get('action', 'warn')
+        if action not in BUDGET_ACTIONS:
+            raise ValueError(f"unsupported budget action {action}, must be one of {list(BUDGET_ACTIONS)}")
+
+        def limit(name: str) -> Optional[float]:
+            return float(settings[name]) if settings.get(name) is not None else None
+
+        return cls(limit('max_seconds'), limit('max_cpu_seconds'), limit('max_rss_mb'), action,
+                   float(settings.get('check_interval', 0.5)), limit('kill_after'))
+
+    @property
+    def is_set(self) -> bool:
+        return any(value is not None for value in (self.max_seconds, self.max_cpu_seconds, self.max_rss_mb))
+
+    def exceeded(self, wall_seconds: float, cpu_seconds: Optional[float], rss_mb: Optional[float]) -> Dict[str, str]:
+        """
+        Returns: Dict[str, str] limit -> a description of the usage over it, for each limit the usage is over. Usage
+                 which could not be measured is None, and is not checked
+        """
+        exceeded = {}
+        if self.max_seconds is not None and wall_seconds > self.max_seconds:
+            exceeded['max_seconds'] = f"wall time {wall_seconds:.2f}s over {self.max_seconds:g}s"
+        if self.max_cpu_seconds is not None and cpu_seconds is not None and cpu_seconds > self.max_cpu_seconds:
+            exceeded['max_cpu_seconds'] = f"cpu time {cpu_seconds:.2f}s over {self.max_cpu_seconds:g}s"
+        if self.max_rss_mb is not None and rss_mb is not None and rss_mb > self.max_rss_mb:
+            exceeded['max_rss_mb'] = f"peak rss {rss_mb:.1f}MB over {self.max_rss_mb:g}MB"
+        return exceeded
+
+
+def get_budget(config: 'RsTermConfig', key: str, entry_point_class: Type = None) -> ResourceBudget:
+    """
+    The budget of a command, built from the default budget in the config, the resource_budget of its entry point
+    class, and the budget of the command in the config, each overriding the one before.
+
+    terminal:
+      budgets:
+        default:
+          max_rss_mb: 4096
+        load_orders:          # verb_noun
+          max_seconds: 600
+          max_cpu_seconds: 300
+          action: abort       # or warn, the default
+          kill_after: 60      # optional, seconds an aborted command has to stop before the process is killed
+
+    Returns: ResourceBudget
+    """
+    settings = dict(config.budgets.get('default') or {})
+    settings.update(getattr(entry_point_class, 'resource_budget', None) or {})
+    settings.update(config.budgets.get(key) or {})
+    return ResourceBudget.from_dict(settings)
+
+
+class CommandScope:
+    """
+    Identifies one run of a command. Two runs of the same command at once have different scopes.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    def __repr__(self) -> str:
+        return f"CommandScope({self.name!r})"
+
+
+@contextmanager
+def command_scope(name: str) -> Iterator[CommandScope]:
+    """
+    Run the code in the block as a command of its own, as dispatch runs each command.
+    """
+    token = _command.set(CommandScope(name))
+    try:
+        yield _command.get()
+    finally:
+        _command.reset(token)
+
+
+def current_command() -> Optional[CommandScope]:
+    """
+    Returns: Optional[CommandScope] the command running in this context, None outside of any command
+    """
+    return _command.get()
+
+
+def bind_command(func: Callable) -> Callable:
+    """
+    Returns: Callable func, running in the command of the caller when it is called from another thread, as new
+             threads and thread pool workers do not inherit it
+    """
+    scope = _command.get()
+
+    @wraps(func)
+    def bound(*args, **kwargs) -> Any:
+        token = _command.set(scope)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _command.reset(token)
+    return bound
+
+
+def current_monitor() -> Optional['ResourceMonitor']:
+    """
+    Returns: Optional[ResourceMonitor] the monitor of the command running on this thread, if any
+    """
+    return getattr(_current, 'monitor', None)
+
+
+def check_budget() -> None:
+    """
+    Raise ResourceBudgetExceeded if the command running on this thread has been aborted for going over its budget.
+    Commands call this through EntryPoint.check_budget, and resources call it before they are created.
+
+    Raises: ResourceBudgetExceeded
+    """
+    monitor = current_monitor()
+    if monitor is not None:
+        monitor.check()
+
+
+def read_proc_status_mb(field: str) -> Optional[float]:
+    """
+    Returns: Optional[float] a memory field of /proc/self/status, such as VmRSS or VmHWM, in MB, or None when there
+             is no /proc
+    """
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith(f"{field}:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss() -> bool:
+    """
+    Reset the peak rss of the process on linux, so that it measures a single command in a long running process.
+
+    Returns: bool True if it was reset
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def read_peak_rss_mb() -> Optional[float]:
+    """
+    Returns: Optional[float] the peak rss of the process in MB, since it was last reset on linux
+    """
+    peak = read_proc_status_mb('VmHWM')
+    if peak is not None:
+        return peak
+
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    # kilobytes on linux, bytes on macos
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024) if sys.platform == 'darwin' else maxrss / 1024
+
+
+def read_rss_mb() -> Optional[float]:
+    rss = read_proc_status_mb('VmRSS')
+    return read_peak_rss_mb() if rss is None else rss
+
+
+class ResourceMonitor:
+    """
+    Measures the wall time, cpu time, peak rss and garbage collections of the process while a command runs, and
+    enforces its budget. When the budget has limits, a watchdog thread checks them every check_interval seconds.
+    Over budget, a warning is printed to stderr, or with action abort the command is flagged as aborted. Nothing is
+    raised into the command from another thread, so it is never interrupted while returning a connection or in a
+    finally block. Instead ResourceBudgetExceeded is raised where the command checks its budget, with check_budget,
+    when it next uses a resource, and otherwise once it has finished. A command which does not stop within
+    kill_after seconds of being aborted has the whole process killed, with KILLED_EXIT_CODE. That includes every
+    other command running in it, as in the daemon or --rsterm-batch --jobs, so only set kill_after for commands
+    which would otherwise hang.
+
+    Measurements are of the whole process, so they are only accurate for one command at a time, as dispatch,
+    the daemon and pipeline workers run them. When commands run at once on threads of one process, as
+    --rsterm-batch --jobs and --rsterm-fanout run them, pass per_thread. Cpu time is then that of the command's
+    thread, without the threads it starts, and the peak rss and garbage collections, which are shared by every
+    thread, are neither reset nor measured, so max_rss_mb is not checked.
+
+    with ResourceMonitor(budget) as monitor:
+        entry_point.run()
+    record = monitor.record('run_step', SUCCESS)
+    """
+
+    def __init__(self, budget: ResourceBudget = None, per_thread: bool = False) -> None:
+        self.budget = budget or ResourceBudget()
+        self.per_thread = per_thread
+        # limit -> the usage over it, as first reported
+        self.exceeded: Dict[str, str] = {}
+        self.aborted = False
+        self.wall_seconds = 0.0
+        self.cpu_seconds: Optional[float] = 0.0
+        self.peak_rss_mb: Optional[float] = None
+        self.gc_collections: Optional[List[int]] = [0, 0, 0]
+        self.gc_collected: Optional[int] = 0
+        self.gc_seconds: Optional[float] = 0.0
+        self._peak_reset = False
+        self._stopped = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+        self._thread_id: Optional[int] = None
+        self._cpu_clock_id: Optional[int] = None
+        self._gc_start: Optional[float] = None
+
+    def __enter__(self) -> 'ResourceMonitor':
+        self._thread_id = threading.get_ident()
+        self._outer = current_monitor()
+        _current.monitor = self
+
+        if self.per_thread:
+            self.gc_collections = self.gc_collected = self.gc_seconds = None
+            if hasattr(time, 'pthread_getcpuclockid'):
+                # readable from the watchdog thread as well, unlike thread_time
+                self._cpu_clock_id = time.pthread_getcpuclockid(self._thread_id)
+        else:
+            self._peak_reset = reset_peak_rss()
+            self._gc_stats = gc.get_stats()
+            gc.callbacks.append(self._on_gc)
+
+        self._start_wall = time.perf_counter()
+        self._start_cpu = self._cpu_time()
+
+        if self.budget.is_set:
+            self._watchdog = threading.Thread(target=self._watch, name='rsterm-budget', daemon=True)
+            self._watchdog.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.wall_seconds = time.perf_counter() - self._start_wall
+        self.cpu_seconds = self._cpu_since_start()
+
+        _current.monitor = self._outer
+        self._stopped.set()
+        if self._watchdog is not None:
+            self._watchdog.join()
+
+        if not self.per_thread:
+            gc.callbacks.remove(self._on_gc)
+            for generation, (before, after) in enumerate(zip(self._gc_stats, gc.get_stats())):
+                self.gc_collections[generation] = after['collections'] - before['collections']
+                self.gc_collected += after['collected'] - before['collected']
+
+            self.peak_rss_mb = read_peak_rss_mb()
+        self._report(self.budget.exceeded(self.wall_seconds, self.cpu_seconds, self.peak_rss_mb))
+
+        if self.aborted and exc_type is None:
+            # the command finished without checking its budget after it was aborted
+            self.check()
+
+    def check(self) -> None:
+        """
+        Raises: ResourceBudgetExceeded if the command has been aborted
+        """
+        if self.aborted:
+            raise ResourceBudgetExceeded(f"aborted, {'; '.join(self.exceeded.values())}")
+
+    def _cpu_time(self) -> Optional[float]:
+        """
+        Returns: Optional[float] cpu seconds of the process, or of the command's thread when per_thread, or None when
+                 the thread's cpu time can not be read from this thread
+        """
+        if not self.per_thread:
+            return time.process_time()
+        if self._cpu_clock_id is not None:
+            return time.clock_gettime(self._cpu_clock_id)
+        if threading.get_ident() == self._thread_id and hasattr(time, 'thread_time'):
+            return time.thread_time()
+        return None
+
+    def _cpu_since_start(self) -> Optional[float]:
+        cpu_time = self._cpu_time()
+        return cpu_time - self._start_cpu if cpu_time is not None and self._start_cpu is not None else None
+
+    def _on_gc(self, gc_phase: str, info: Dict[str, int]) -> None:
+        if gc_phase == 'start':
+            self._gc_start = time.perf_counter()
+        elif self._gc_start is not None:
+            self.gc_seconds += time.perf_counter() - self._gc_start
+            self._gc_start = None
+
+    def _report(self, exceeded: Dict[str, str]) -> None:
+        # each limit is only reported the first time it is gone over
+        for limit, description in exceeded.items():
+            if limit not in self.exceeded:
+                self.exceeded[limit] = description
+                print(f"[rsterm] over budget: {description}", file=sys.stderr)
+
+    def _watch(self) -> None:
+        while not self._stopped.wait(self.budget.check_interval):
+            exceeded = self.budget.exceeded(time.perf_counter() - self._start_wall, self._cpu_since_start(),
+                                            None if self.per_thread else read_rss_mb())
+            self._report(exceeded)
+
+            if exceeded and self.budget.action == 'abort':
+                self.aborted = True
+                if self.budget.kill_after is not None and not self._stopped.wait(self.budget.kill_after):
+                    print(f"[rsterm] killed: the command did not stop within {self.budget.kill_after:g}s of being "
+                          f"aborted", file=sys.stderr)
+                    sys.stderr.flush()
+                    os._exit(KILLED_EXIT_CODE)
+                return
+
+    def record(self, command: str, status: str, **fields) -> Dict[str, Any]:
+        """
+        Returns: Dict[str, Any] the metrics of the command, as written to the metrics file
+        """
+        return dict({
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'command': command,
+            'status': status,
+            'wall_seconds': round(self.wall_seconds, 6),
+            'cpu_seconds': round(self.cpu_seconds, 6) if self.cpu_seconds is not None else None,
+            'peak_rss_mb': round(self.peak_rss_mb, 3) if self.peak_rss_mb is not None else None,
+            # a peak which could not be reset is the peak of the whole process so far
+            'peak_rss_is_process_peak': self.peak_rss_mb is not None and not self._peak_reset,
+            # thread when the command ran alongside others, and only its cpu time is its own
+            'measured': 'thread' if self.per_thread else 'process',
+            'gc_collections': self.gc_collections,
+            'gc_collected': self.gc_collected,
+            'gc_seconds': round(self.gc_seconds, 6) if self.gc_seconds is not None else None,
+            'over_budget': list(self.exceeded.values())
+        }, **fields)
+
+
+def append_metrics(path: Path, record: Dict[str, Any]) -> None:
+    """
+    Append a record to a jsonl metrics file. Each record is written with a single write of one line, so records of
+    processes writing to the same file at once are not interleaved.
+    """
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open('a') as metrics_file:
+            metrics_file.write(json.dumps(record, default=str) + '\n')
+    except OSError as error:
+        print(f"[rsterm] could not write metrics to {path}: {error}", file=sys.stderr)
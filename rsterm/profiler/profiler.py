@@ -0,0 +1,169 @@
+import os
+import sys
+import json
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+PROFILE_OPTION = '--rsterm-profile'
+PSTATS_OPTION = '--rsterm-profile-pstats'
+REPORT_FORMATS = ('table', 'json')
+
+
+class PhaseProfiler:
+    """
+    Records how long each phase of dispatching a command takes. Phases can be nested, and are reported
+    in the order they started, indented by depth.
+
+    Args:
+        report_format: str 'table' or 'json'
+        pstats_path:   str if set, the entry point's run method is profiled with cProfile and the stats
+                       are dumped to this path
+    """
+
+    def __init__(self, report_format: str = 'table', pstats_path: str = None) -> None:
+        if report_format not in REPORT_FORMATS:
+            raise ValueError(f"unsupported profile format {report_format}, must be one of {REPORT_FORMATS}")
+
+        self.report_format = report_format
+        self.pstats_path = pstats_path
+        self.phases: List[Dict[str, Any]] = []
+        self._depth = 0
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        record = {'phase': name, 'depth': self._depth, 'seconds': 0.0}
+        self.phases.append(record)
+        self._depth += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            record['seconds'] = time.perf_counter() - start
+            self._depth -= 1
+
+    def call(self, func: Callable[[], Any]) -> Any:
+        """
+        Call func, under cProfile if a pstats path was given.
+        """
+        if not self.pstats_path:
+            return func()
+
+        import cProfile
+
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(func)
+        finally:
+            profile.dump_stats(self.pstats_path)
+
+    @property
+    def total_seconds(self) -> float:
+        return time.perf_counter() - self._start
+
+    def report(self) -> str:
+        return self.report_json() if self.report_format == 'json' else self.report_table()
+
+    def report_json(self) -> str:
+        return json.dumps({'total_seconds': self.total_seconds, 'phases': self.phases,
+                           'pstats': self.pstats_path}, indent=2)
+
+    def report_table(self) -> str:
+        total = self.total_seconds
+        names = [f"{'  ' * record['depth']}{record['phase']}" for record in self.phases]
+        width = max([len(name) for name in names] + [len('total')])
+        lines = [f"{'phase'.ljust(width)}  {'ms':>9}  {'%':>5}"]
+
+        for name, record in zip(names, self.phases):
+            percent = record['seconds'] / total * 100 if total else 0.0
+            lines.append(f"{name.ljust(width)}  {record['seconds'] * 1000:9.2f}  {percent:5.1f}")
+
+        lines.append(f"{'total'.ljust(width)}  {total * 1000:9.2f}  {100.0:5.1f}")
+        if self.pstats_path:
+            lines.append(f"cProfile stats for run() written to {self.pstats_path}")
+        return '\n'.join(lines)
+
+
+_active: Optional[PhaseProfiler] = None
+
+
+def get_profiler() -> Optional[PhaseProfiler]:
+    return _active
+
+
+def start_profiling(report_format: str = 'table', pstats_path: str = None) -> PhaseProfiler:
+    global _active
+    _active = PhaseProfiler(report_format, pstats_path)
+    return _active
+
+
+def stop_profiling() -> Optional[PhaseProfiler]:
+    global _active
+    profiler, _active = _active, None
+    return profiler
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """
+    Time a phase of dispatch when profiling is switched on, otherwise do nothing.
+    """
+    if _active is None:
+        yield
+    else:
+        with _active.phase(name):
+            yield
+
+
+def call_profiled(func: Callable[[], Any]) -> Any:
+    """
+    Call func under cProfile when profiling with a pstats path, otherwise just call it.
+    """
+    return func() if _active is None else _active.call(func)
+
+
+def extract_profile_options(args: List[str]) -> Tuple[List[str], Optional[Dict[str, str]]]:
+    """
+    Remove the profiling options from the front of a command line. Profiling can also be switched on with the
+    RSTERM_PROFILE (table or json) and RSTERM_PROFILE_PSTATS environment variables.
+
+    my_app --rsterm-profile run spam
+    my_app --rsterm-profile=json --rsterm-profile-pstats=run.pstats run spam
+
+    Returns: Tuple[List[str], Optional[Dict[str, str]]] the remaining args, and the start_profiling kwargs,
+             or None if profiling is not switched on
+    Raises:  SystemExit with a usage message when the report format given on the command line is not supported
+    """
+    report_format = os.environ.get('RSTERM_PROFILE') or None
+    pstats_path = os.environ.get('RSTERM_PROFILE_PSTATS') or None
+
+    if report_format and report_format not in REPORT_FORMATS:
+        report_format = 'table'
+
+    while args and args[0].startswith(PROFILE_OPTION):
+        option, _, value = args[0].partition('=')
+
+        if option == PROFILE_OPTION:
+            report_format = value or 'table'
+
+            if report_format not in REPORT_FORMATS:
+                from argparse import ArgumentParser
+
+                arg_parser = ArgumentParser(prog=PROFILE_OPTION, usage=f"{PROFILE_OPTION}[={'|'.join(REPORT_FORMATS)}] "
+                                                                       f"[{PSTATS_OPTION}[=PATH]] verb noun ...")
+                arg_parser.error(f"unsupported profile format {report_format}, must be one of {', '.join(REPORT_FORMATS)}")
+        elif option == PSTATS_OPTION:
+            pstats_path = value or 'rsterm.pstats'
+            report_format = report_format or 'table'
+        else:
+            break
+        args = args[1:]
+
+    if report_format is None and pstats_path is None:
+        return args, None
+    return args, {'report_format': report_format or 'table', 'pstats_path': pstats_path}
+
+
+def print_report(profiler: PhaseProfiler) -> None:
+    print(profiler.report(), file=sys.stderr)
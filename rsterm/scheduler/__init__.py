@@ -0,0 +1,4 @@
+# flake8: noqa
+from .graph import TaskGraph, TaskResult, run_graph, format_results, SUCCESS, FAILED, SKIPPED
+from .aio import run_coroutine, gather_bounded, map_bounded
+from .output import CapturedOutput, ThreadRoutedStream
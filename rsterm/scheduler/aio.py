@@ -0,0 +1,46 @@
+import asyncio
+from typing import Awaitable, Callable, Iterable, List, TypeVar
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+
+def run_coroutine(coroutine: Awaitable[T]) -> T:
+    """
+    Drive a coroutine to completion on a new event loop, used by the dispatcher for async entry points.
+    """
+    if hasattr(asyncio, 'run'):
+        return asyncio.run(coroutine)
+
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+async def gather_bounded(awaitables: Iterable[Awaitable[T]], limit: int, return_exceptions: bool = False) -> List[T]:
+    """
+    Like asyncio.gather, but at most limit of the awaitables run at any one time. Results are in input order.
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def bounded(awaitable: Awaitable[T]) -> T:
+        async with semaphore:
+            return await awaitable
+
+    return await asyncio.gather(*[bounded(a) for a in awaitables], return_exceptions=return_exceptions)
+
+
+async def map_bounded(func: Callable[[T], Awaitable[R]], items: Iterable[T], limit: int,
+                      return_exceptions: bool = False) -> List[R]:
+    """
+    Call an async function for every item, with at most limit calls in flight. Results are in input order.
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def bounded(item: T) -> R:
+        async with semaphore:
+            return await func(item)
+
+    return await asyncio.gather(*[bounded(item) for item in items], return_exceptions=return_exceptions)
@@ -0,0 +1,176 @@
+import time
+from concurrent.futures import Executor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+from rsterm.exceptions import GraphError
+
+SUCCESS = 'success'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+
+
+class TaskResult(NamedTuple):
+    name: str
+    status: str
+    seconds: float = 0.0
+    error: Optional[str] = None
+    value: Any = None
+
+
+class TaskGraph:
+    """
+    A directed acyclic graph of named tasks. dependencies maps every task name to the names of the tasks
+    which must complete before it can start.
+
+    Raises: GraphError when a dependency does not exist, or the dependencies contain a cycle.
+    """
+
+    def __init__(self, dependencies: Dict[str, List[str]]) -> None:
+        self.dependencies = {name: list(deps) for name, deps in dependencies.items()}
+
+        for name, deps in self.dependencies.items():
+            for dep in deps:
+                if dep not in self.dependencies:
+                    raise GraphError(f"{name} depends on {dep}, which does not exist")
+                if dep == name:
+                    raise GraphError(f"{name} depends on itself")
+
+        self._order = self._topological_order()
+
+    @property
+    def names(self) -> List[str]:
+        return list(self.dependencies)
+
+    def order(self) -> List[str]:
+        """
+        Returns: List[str] task names in an order where every task comes after its dependencies
+        """
+        return list(self._order)
+
+    def dependants(self, name: str) -> List[str]:
+        """
+        Returns: List[str] every task which depends on name, directly or indirectly
+        """
+        found, stack = set(), [name]
+        while stack:
+            current = stack.pop()
+            for other, deps in self.dependencies.items():
+                if current in deps and other not in found:
+                    found.add(other)
+                    stack.append(other)
+        return [n for n in self._order if n in found]
+
+    def _topological_order(self) -> List[str]:
+        remaining = {name: set(deps) for name, deps in self.dependencies.items()}
+        order = []
+
+        while remaining:
+            ready = sorted(name for name, deps in remaining.items() if not deps)
+            if not ready:
+                raise GraphError(f"dependency cycle between {', '.join(sorted(remaining))}")
+
+            for name in ready:
+                order.append(name)
+                del remaining[name]
+            for deps in remaining.values():
+                deps.difference_update(ready)
+        return order
+
+
+def timed_call(task: Callable[[str], Any], name: str) -> Tuple[float, Any, Optional[str]]:
+    """
+    Run a task and time it in the worker, so queueing time is not counted. Module level, so it can be
+    sent to a process pool, and errors are returned as text so they never need to be pickled.
+
+    Returns: Tuple[float, Any, Optional[str]] seconds taken, the task's return value, and the error if it failed
+    """
+    start = time.perf_counter()
+    try:
+        value = task(name)
+        return time.perf_counter() - start, value, None
+    except Exception as error:
+        return time.perf_counter() - start, None, f"{type(error).__name__}: {error}"
+
+
+def run_graph(graph: TaskGraph,
+              task: Callable[[str], Any],
+              executor: Executor,
+              stop_on_failure: bool = True,
+              on_complete: Callable[[TaskResult], None] = None) -> Dict[str, TaskResult]:
+    """
+    Run every task in the graph on the executor, starting each one as soon as its dependencies have succeeded.
+
+    Args:
+        graph:           TaskGraph to run
+        task:            Callable[[str], Any] called with the name of the task to run. Must be picklable for a process pool.
+        executor:        Executor the tasks are submitted to, its worker count bounds the concurrency
+        stop_on_failure: bool when a task fails, stop scheduling anything else. Otherwise only the dependants of
+                         the failed task are skipped.
+        on_complete:     Callable[[TaskResult], None] called in the submitting thread as each task finishes
+
+    Returns: Dict[str, TaskResult] in topological order
+    """
+    results: Dict[str, TaskResult] = {}
+    running = {}
+    stopped = False
+
+    def finish(result: TaskResult) -> None:
+        results[result.name] = result
+        if on_complete:
+            on_complete(result)
+
+    while True:
+        if not stopped:
+            for name in graph.order():
+                if name in results or name in running.values():
+                    continue
+
+                deps = graph.dependencies[name]
+                if any(dep in results and results[dep].status != SUCCESS for dep in deps):
+                    finish(TaskResult(name, SKIPPED, error='a dependency did not succeed'))
+                    continue
+
+                if all(dep in results for dep in deps):
+                    running[executor.submit(timed_call, task, name)] = name
+
+        if not running:
+            break
+
+        done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+
+        for future in done:
+            name = running.pop(future)
+            try:
+                seconds, value, error = future.result()
+            except Exception as executor_error:
+                # the worker itself died, or the return value could not be sent back
+                seconds, value, error = 0.0, None, f"{type(executor_error).__name__}: {executor_error}"
+
+            if error is None:
+                finish(TaskResult(name, SUCCESS, seconds, value=value))
+            else:
+                finish(TaskResult(name, FAILED, seconds, error=error))
+                stopped = stopped or stop_on_failure
+
+    for name in graph.order():
+        if name not in results:
+            finish(TaskResult(name, SKIPPED, error='stopped after a failure'))
+
+    return {name: results[name] for name in graph.order()}
+
+
+def format_results(results: Iterable[TaskResult]) -> str:
+    """
+    Returns: str a plain text table of task name, status and duration, with the total wall time of every task.
+    """
+    results = list(results)
+    width = max([len(result.name) for result in results] + [4])
+    lines = [f"{'name'.ljust(width)}  {'status'.ljust(7)}  seconds"]
+
+    for result in results:
+        line = f"{result.name.ljust(width)}  {result.status.ljust(7)}  {result.seconds:7.2f}"
+        if result.error:
+            line += f"  {result.error}"
+        lines.append(line)
+
+    lines.append(f"{'total'.ljust(width)}  {''.ljust(7)}  {sum(result.seconds for result in results):7.2f}")
+    return '\n'.join(lines)
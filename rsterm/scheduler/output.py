@@ -0,0 +1,64 @@
+import io
+import sys
+import threading
+from typing import Optional, TextIO, Tuple
+
+
+class ThreadRoutedStream:
+    """
+    Stand in for sys.stdout / sys.stderr which sends each thread's writes to that thread's own buffer, if it has
+    started capturing, and to the original stream otherwise. This lets commands run concurrently on a thread pool
+    without their output being interleaved.
+    """
+
+    def __init__(self, stream: TextIO) -> None:
+        self.stream = stream
+        self._local = threading.local()
+
+    @property
+    def buffer_for_thread(self) -> Optional[io.StringIO]:
+        return getattr(self._local, 'buffer', None)
+
+    def start_capture(self) -> None:
+        self._local.buffer = io.StringIO()
+
+    def stop_capture(self) -> str:
+        buffer = self.buffer_for_thread
+        self._local.buffer = None
+        return buffer.getvalue() if buffer is not None else ''
+
+    def write(self, data: str) -> int:
+        buffer = self.buffer_for_thread
+        return (buffer or self.stream).write(data)
+
+    def flush(self) -> None:
+        if self.buffer_for_thread is None:
+            self.stream.flush()
+
+    def __getattr__(self, item: str):
+        return getattr(self.stream, item)
+
+
+class CapturedOutput:
+    """
+    Context manager which installs ThreadRoutedStreams as sys.stdout and sys.stderr, and restores the originals
+    on exit. Worker threads call capture_start() before running a command, and capture_stop() afterwards to get
+    what the command wrote.
+    """
+
+    def __enter__(self) -> 'CapturedOutput':
+        self._stdout, self._stderr = sys.stdout, sys.stderr
+        self.stdout = ThreadRoutedStream(self._stdout)
+        self.stderr = ThreadRoutedStream(self._stderr)
+        sys.stdout, sys.stderr = self.stdout, self.stderr
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        sys.stdout, sys.stderr = self._stdout, self._stderr
+
+    def capture_start(self) -> None:
+        self.stdout.start_capture()
+        self.stderr.start_capture()
+
+    def capture_stop(self) -> Tuple[str, str]:
+        return self.stdout.stop_capture(), self.stderr.stop_capture()
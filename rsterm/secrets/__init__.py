@@ -0,0 +1,3 @@
+# flake8: noqa
+from .backends import SecretBackend, DictBackend, EnvBackend, FileBackend, AwsSecretsManagerBackend, get_backend
+from .resolver import SecretResolver, EncryptedFileCache, get_resolver
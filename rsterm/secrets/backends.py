@@ -0,0 +1,148 @@
+import os
+import json
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Dict, List
+
+
+class SecretBackend(ABC):
+    """
+    A store of secrets. Backends are asked for every secret a command needs in a single call, so that those
+    which talk to a remote service can fetch them in as few requests as possible.
+    """
+
+    @abstractmethod
+    def get_secrets(self, secret_ids: List[str]) -> Dict[str, str]:
+        """
+        Returns: Dict[str, str] secret id -> value, for every secret id that was found. Missing secrets are left out.
+        """
+        pass
+
+
+class DictBackend(SecretBackend):
+    """
+    Secrets held in a dict, for tests and local development.
+    """
+
+    def __init__(self, secrets: Dict[str, str]) -> None:
+        self.secrets = secrets
+        self.calls = 0
+
+    def get_secrets(self, secret_ids: List[str]) -> Dict[str, str]:
+        self.calls += 1
+        return {secret_id: self.secrets[secret_id] for secret_id in secret_ids if secret_id in self.secrets}
+
+
+class EnvBackend(SecretBackend):
+    """
+    Secrets held in environment variables, named by the secret id. This is the default backend.
+    """
+
+    def get_secrets(self, secret_ids: List[str]) -> Dict[str, str]:
+        return {secret_id: os.environ[secret_id] for secret_id in secret_ids if secret_id in os.environ}
+
+
+class FileBackend(SecretBackend):
+    """
+    Secrets held in a json file of secret id -> value. The file is read on each call, so it may be edited
+    while a daemon is running.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+
+    def get_secrets(self, secret_ids: List[str]) -> Dict[str, str]:
+        with self.path.open() as secrets_file:
+            secrets = json.load(secrets_file)
+        return {secret_id: secrets[secret_id] for secret_id in secret_ids if secret_id in secrets}
+
+
+class AwsSecretsManagerBackend(SecretBackend):
+    """
+    Secrets held in AWS Secrets Manager, fetched with BatchGetSecretValue, up to 20 at a time. A secret id of
+    the form "name#key" reads one key of a secret holding a json object.
+
+    Args:
+        region_name:  str aws region, defaults to the region boto3 is configured with
+        profile_name: str aws profile, defaults to the profile boto3 is configured with
+    """
+
+    batch_size = 20
+
+    def __init__(self, region_name: str = None, profile_name: str = None) -> None:
+        self.region_name = region_name
+        self.profile_name = profile_name
+        self._client = None
+
+    @property
+    def client(self) -> Any:
+        if self._client is None:
+            try:
+                import boto3
+            except ImportError:
+                raise ImportError("the aws secrets backend requires the boto3 package. pip install boto3")
+
+            session = boto3.session.Session(profile_name=self.profile_name, region_name=self.region_name)
+            self._client = session.client('secretsmanager')
+        return self._client
+
+    def fetch(self, names: List[str]) -> Dict[str, str]:
+        """
+        Returns: Dict[str, str] secret name or arn, as requested -> secret string
+        """
+        values = {}
+        requested = set(names)
+
+        if not hasattr(self.client, 'batch_get_secret_value'):
+            # boto3 older than 1.33
+            for name in names:
+                try:
+                    values[name] = self.client.get_secret_value(SecretId=name)['SecretString']
+                except self.client.exceptions.ResourceNotFoundException:
+                    pass
+            return values
+
+        for start in range(0, len(names), self.batch_size):
+            response = self.client.batch_get_secret_value(SecretIdList=names[start:start + self.batch_size])
+
+            for secret in response['SecretValues']:
+                for name in (secret.get('Name'), secret.get('ARN')):
+                    if name in requested and 'SecretString' in secret:
+                        values[name] = secret['SecretString']
+        return values
+
+    def get_secrets(self, secret_ids: List[str]) -> Dict[str, str]:
+        names = sorted({secret_id.partition('#')[0] for secret_id in secret_ids})
+        values = self.fetch(names)
+        secrets = {}
+
+        for secret_id in secret_ids:
+            name, _, key = secret_id.partition('#')
+
+            if name not in values:
+                continue
+
+            if not key:
+                secrets[secret_id] = values[name]
+                continue
+
+            document = json.loads(values[name])
+            if key in document:
+                secrets[secret_id] = str(document[key])
+        return secrets
+
+
+BACKENDS = {
+    'env': EnvBackend,
+    'file': FileBackend,
+    'aws': AwsSecretsManagerBackend
+}
+
+
+def get_backend(name: str, **options) -> SecretBackend:
+    """
+    Create a backend by the name used in the secrets section of the config.
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"unknown secrets backend {name}, must be one of {sorted(BACKENDS)}")
+    return BACKENDS[name](**options)
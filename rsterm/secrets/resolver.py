@@ -0,0 +1,144 @@
+import os
+import json
+import time
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+from rsterm.exceptions import SecretNotFound
+from rsterm.secrets.backends import SecretBackend
+
+# secret id -> [expiry as a unix timestamp, value]
+CacheEntries = Dict[str, Tuple[float, str]]
+
+
+class EncryptedFileCache:
+    """
+    Secrets cached in a local file, encrypted with Fernet from the cryptography package. The file is only readable
+    by its owner. A file which can not be decrypted, because it is corrupt or the key has changed, is ignored.
+
+    Args:
+        path: Path to the cache file
+        key:  str a Fernet key, as made by cryptography.fernet.Fernet.generate_key()
+    """
+
+    def __init__(self, path: Path, key: str) -> None:
+        try:
+            from cryptography.fernet import Fernet
+        except ImportError:
+            raise ImportError("the encrypted secrets cache requires the cryptography package. pip install cryptography")
+
+        self.path = Path(path)
+        self.fernet = Fernet(key.encode() if isinstance(key, str) else key)
+
+    def load(self) -> CacheEntries:
+        from cryptography.fernet import InvalidToken
+
+        try:
+            return json.loads(self.fernet.decrypt(self.path.read_bytes()).decode())
+        except (OSError, ValueError, InvalidToken):
+            return {}
+
+    def save(self, entries: CacheEntries) -> None:
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(f".{os.getpid()}.tmp")
+            fd = os.open(tmp_path.as_posix(), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'wb') as cache_file:
+                cache_file.write(self.fernet.encrypt(json.dumps(entries).encode()))
+            tmp_path.replace(self.path)
+        except OSError:
+            # failing to write the cache is never fatal
+            pass
+
+
+class SecretResolver:
+    """
+    Resolves secrets from a backend, fetching every secret that is not cached in one call to the backend, and
+    caching the values in memory, and optionally in an encrypted file, for ttl seconds. The memory cache makes
+    repeated lookups in a long lived process, such as the daemon, free. The file cache does the same for
+    commands run one after the other.
+
+    Args:
+        backend:    SecretBackend to fetch secrets from
+        ttl:        float seconds a secret is cached for
+        file_cache: EncryptedFileCache optional second level cache
+    """
+
+    def __init__(self, backend: SecretBackend, ttl: float = 300.0, file_cache: EncryptedFileCache = None) -> None:
+        self.backend = backend
+        self.ttl = ttl
+        self.file_cache = file_cache
+        self._memory: CacheEntries = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def unexpired(entries: CacheEntries, secret_ids: List[str], now: float) -> Dict[str, str]:
+        found = {}
+        for secret_id in secret_ids:
+            entry = entries.get(secret_id)
+            if entry is not None and entry[0] > now:
+                found[secret_id] = entry[1]
+        return found
+
+    def resolve(self, secret_ids: List[str]) -> Dict[str, str]:
+        """
+        Returns: Dict[str, str] secret id -> value, for every secret id
+        Raises:  SecretNotFound naming every secret the backend does not have
+        """
+        with self._lock:
+            now = time.time()
+            secrets = self.unexpired(self._memory, secret_ids, now)
+            missing = [secret_id for secret_id in secret_ids if secret_id not in secrets]
+
+            file_entries: Optional[CacheEntries] = None
+            if missing and self.file_cache is not None:
+                file_entries = self.file_cache.load()
+                cached = self.unexpired(file_entries, missing, now)
+                self._memory.update({secret_id: file_entries[secret_id] for secret_id in cached})
+                secrets.update(cached)
+                missing = [secret_id for secret_id in missing if secret_id not in cached]
+
+            if not missing:
+                return secrets
+
+            fetched = self.backend.get_secrets(missing)
+            not_found = [secret_id for secret_id in missing if secret_id not in fetched]
+
+            if not_found:
+                raise SecretNotFound(f"secrets not found: {', '.join(not_found)}")
+
+            expires = now + self.ttl
+            self._memory.update({secret_id: (expires, value) for secret_id, value in fetched.items()})
+            secrets.update(fetched)
+
+            if self.file_cache is not None:
+                file_entries = {secret_id: entry for secret_id, entry in file_entries.items() if entry[0] > now}
+                file_entries.update({secret_id: (expires, value) for secret_id, value in fetched.items()})
+                self.file_cache.save(file_entries)
+
+            return secrets
+
+    def get(self, secret_id: str) -> str:
+        return self.resolve([secret_id])[secret_id]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+
+
+_resolvers: Dict[str, SecretResolver] = {}
+_resolvers_lock = threading.Lock()
+
+
+def get_resolver(key: str, create: Callable[[], SecretResolver]) -> SecretResolver:
+    """
+    Return the process wide resolver for an app's secrets settings, creating it on first use, so that secrets
+    stay cached in memory for every command run by the process.
+    """
+    with _resolvers_lock:
+        resolver = _resolvers.get(key)
+
+        if resolver is None:
+            resolver = create()
+            _resolvers[key] = resolver
+        return resolver
@@ -0,0 +1,3 @@
+# flake8: noqa
+from .backends import StorageBackend, LocalBackend, S3Backend, get_backend
+from .sync import DirectorySync, SyncManifest, SyncResult, sync_directory
@@ -0,0 +1,188 @@
+import os
+import uuid
+import shutil
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class StorageBackend(ABC):
+    """
+    An object store, which files are uploaded to whole, or in parts for large files. A multipart upload can be
+    continued after an interruption, by listing the parts which were already uploaded.
+    """
+
+    @abstractmethod
+    def put_object(self, key: str, path: Path) -> None:
+        pass
+
+    @abstractmethod
+    def create_multipart_upload(self, key: str) -> str:
+        """
+        Returns: str the id of the upload
+        """
+        pass
+
+    @abstractmethod
+    def upload_part(self, key: str, upload_id: str, part_number: int, data: bytes) -> str:
+        """
+        Returns: str the etag of the part, needed to complete the upload
+        """
+        pass
+
+    @abstractmethod
+    def list_parts(self, key: str, upload_id: str) -> Optional[Dict[int, str]]:
+        """
+        Returns: Optional[Dict[int, str]] part number -> etag of the parts uploaded so far, or None if the upload no
+                 longer exists
+        """
+        pass
+
+    @abstractmethod
+    def complete_multipart_upload(self, key: str, upload_id: str, parts: List[Tuple[int, str]]) -> None:
+        pass
+
+    @abstractmethod
+    def abort_multipart_upload(self, key: str, upload_id: str) -> None:
+        pass
+
+    @abstractmethod
+    def delete_object(self, key: str) -> None:
+        pass
+
+
+class LocalBackend(StorageBackend):
+    """
+    Objects kept as files under a directory, standing in for a bucket in tests and local development. Parts of
+    multipart uploads are kept in .multipart/<upload id> until the upload is completed.
+    """
+
+    def __init__(self, root: Path) -> None:
+        self.root = Path(root)
+
+    def object_path(self, key: str) -> Path:
+        return self.root / key
+
+    def upload_dir(self, upload_id: str) -> Path:
+        return self.root / '.multipart' / upload_id
+
+    def put_object(self, key: str, path: Path) -> None:
+        target = self.object_path(key)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = target.with_name(f".{target.name}.{uuid.uuid4().hex}.tmp")
+        shutil.copyfile(path.as_posix(), tmp_path.as_posix())
+        tmp_path.replace(target)
+
+    def create_multipart_upload(self, key: str) -> str:
+        upload_id = uuid.uuid4().hex
+        self.upload_dir(upload_id).mkdir(parents=True)
+        return upload_id
+
+    def upload_part(self, key: str, upload_id: str, part_number: int, data: bytes) -> str:
+        (self.upload_dir(upload_id) / str(part_number)).write_bytes(data)
+        return f"{upload_id}-{part_number}"
+
+    def list_parts(self, key: str, upload_id: str) -> Optional[Dict[int, str]]:
+        upload_dir = self.upload_dir(upload_id)
+        if not upload_dir.exists():
+            return None
+        return {int(part.name): f"{upload_id}-{part.name}" for part in upload_dir.iterdir()}
+
+    def complete_multipart_upload(self, key: str, upload_id: str, parts: List[Tuple[int, str]]) -> None:
+        target = self.object_path(key)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = target.with_name(f".{target.name}.{upload_id}.tmp")
+
+        with tmp_path.open('wb') as target_file:
+            for part_number, _ in sorted(parts):
+                with (self.upload_dir(upload_id) / str(part_number)).open('rb') as part_file:
+                    shutil.copyfileobj(part_file, target_file)
+
+        tmp_path.replace(target)
+        shutil.rmtree(self.upload_dir(upload_id).as_posix())
+
+    def abort_multipart_upload(self, key: str, upload_id: str) -> None:
+        shutil.rmtree(self.upload_dir(upload_id).as_posix(), ignore_errors=True)
+
+    def delete_object(self, key: str) -> None:
+        try:
+            os.remove(self.object_path(key).as_posix())
+        except FileNotFoundError:
+            pass
+
+
+class S3Backend(StorageBackend):
+    """
+    Objects in an s3 bucket. boto3 is imported when the first request is made.
+
+    Args:
+        bucket:       str name of the bucket, as given by RsTermConfig.get_s3_bucket
+        region_name:  str aws region, defaults to the region boto3 is configured with
+        profile_name: str aws profile, defaults to the profile boto3 is configured with
+    """
+
+    def __init__(self, bucket: str, region_name: str = None, profile_name: str = None) -> None:
+        self.bucket = bucket
+        self.region_name = region_name
+        self.profile_name = profile_name
+        self._client = None
+
+    @property
+    def client(self) -> Any:
+        if self._client is None:
+            try:
+                import boto3
+            except ImportError:
+                raise ImportError("the s3 storage backend requires the boto3 package. pip install boto3")
+
+            session = boto3.session.Session(profile_name=self.profile_name, region_name=self.region_name)
+            self._client = session.client('s3')
+        return self._client
+
+    def put_object(self, key: str, path: Path) -> None:
+        with path.open('rb') as body:
+            self.client.put_object(Bucket=self.bucket, Key=key, Body=body)
+
+    def create_multipart_upload(self, key: str) -> str:
+        return self.client.create_multipart_upload(Bucket=self.bucket, Key=key)['UploadId']
+
+    def upload_part(self, key: str, upload_id: str, part_number: int, data: bytes) -> str:
+        response = self.client.upload_part(Bucket=self.bucket, Key=key, UploadId=upload_id, PartNumber=part_number,
+                                           Body=data)
+        return response['ETag']
+
+    def list_parts(self, key: str, upload_id: str) -> Optional[Dict[int, str]]:
+        parts = {}
+        paginator = self.client.get_paginator('list_parts')
+        try:
+            for page in paginator.paginate(Bucket=self.bucket, Key=key, UploadId=upload_id):
+                parts.update({part['PartNumber']: part['ETag'] for part in page.get('Parts', [])})
+        except self.client.exceptions.NoSuchUpload:
+            return None
+        return parts
+
+    def complete_multipart_upload(self, key: str, upload_id: str, parts: List[Tuple[int, str]]) -> None:
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket, Key=key, UploadId=upload_id,
+            MultipartUpload={'Parts': [{'PartNumber': number, 'ETag': etag} for number, etag in sorted(parts)]})
+
+    def abort_multipart_upload(self, key: str, upload_id: str) -> None:
+        self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+
+    def delete_object(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+
+BACKENDS = {
+    'local': LocalBackend,
+    's3': S3Backend
+}
+
+
+def get_backend(name: str, **options) -> StorageBackend:
+    """
+    Create a backend by the name used in the storage section of the config.
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"unknown storage backend {name}, must be one of {sorted(BACKENDS)}")
+    return BACKENDS[name](**options)
@@ -0,0 +1,283 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, Executor
+from typing import Any, Dict, List, NamedTuple, Optional
+from rsterm.exceptions import SyncError
+from rsterm.storage.backends import StorageBackend
+
+MANIFEST_VERSION = 1
+
+# s3 parts must be at least 5MB, except the last one, and an upload has at most 10000 parts
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+DEFAULT_MULTIPART_THRESHOLD = 64 * 1024 * 1024
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PARTS = 10000
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+class SyncResult(NamedTuple):
+    uploaded: List[str]
+    skipped: int
+    deleted: List[str]
+    failed: Dict[str, str]
+    bytes: int
+    seconds: float
+
+    def summary(self) -> str:
+        summary = (f"uploaded {len(self.uploaded)} file(s) ({self.bytes} bytes) in {self.seconds:.2f}s, "
+                   f"{self.skipped} unchanged, {len(self.deleted)} deleted")
+        if self.failed:
+            summary += f", {len(self.failed)} failed: {', '.join(sorted(self.failed))}"
+        return summary
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open('rb') as input_file:
+        for block in iter(lambda: input_file.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class SyncManifest:
+    """
+    What was uploaded to a bucket and prefix: the sha256, size and modification time of every file, and the
+    multipart uploads which have been started but not completed. A file whose size and modification time have not
+    changed is not hashed again.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.uploads: Dict[str, Dict[str, Any]] = {}
+        self.lock = threading.Lock()
+
+        try:
+            content = json.loads(path.read_text())
+        except (OSError, ValueError):
+            return
+
+        if content.get('version') == MANIFEST_VERSION:
+            self.files = content.get('files', {})
+            self.uploads = content.get('uploads', {})
+
+    def save(self) -> None:
+        with self.lock:
+            content = json.dumps({'version': MANIFEST_VERSION, 'files': self.files, 'uploads': self.uploads})
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f".{self.path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp_path.write_text(content)
+        tmp_path.replace(self.path)
+
+    def is_unchanged(self, name: str, stat: os.stat_result) -> bool:
+        entry = self.files.get(name)
+        return entry is not None and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns
+
+
+class DirectorySync:
+    """
+    Uploads the files of a directory which have changed since the last sync to the same bucket and prefix, as
+    recorded in a manifest. Files are hashed and uploaded on a thread pool, and those of multipart_threshold bytes
+    or more are uploaded in parts of part_size bytes, also in parallel. Files too large for max_parts parts of
+    part_size are uploaded in larger parts. A file which changes while it is uploaded fails, and is not recorded,
+    so the next sync uploads it again.
+
+    The manifest is saved every few seconds and when the sync ends, so an interrupted sync only uploads what it
+    had not finished. A multipart upload which was interrupted is continued from the parts already uploaded, if
+    the file has not changed since.
+
+    Args:
+        backend:             StorageBackend the files are uploaded to
+        manifest_path:       Path of the manifest of the bucket and prefix
+        jobs:                int files, and parts of large files, uploaded at once
+        part_size:           int bytes in each part of a multipart upload
+        multipart_threshold: int files this size or larger are uploaded in parts
+        save_interval:       float seconds between saves of the manifest while files are uploading
+        verbose:             bool print each file as it is uploaded
+    """
+
+    max_parts = MAX_PARTS
+    min_part_size = MIN_PART_SIZE
+
+    def __init__(self, backend: StorageBackend, manifest_path: Path, jobs: int = 8,
+                 part_size: int = DEFAULT_PART_SIZE,
+                 multipart_threshold: int = DEFAULT_MULTIPART_THRESHOLD,
+                 save_interval: float = 5.0,
+                 verbose: bool = False) -> None:
+        self.backend = backend
+        self.manifest = SyncManifest(Path(manifest_path))
+        self.jobs = jobs
+        self.part_size = part_size
+        self.multipart_threshold = multipart_threshold
+        self.save_interval = save_interval
+        self.verbose = verbose
+        self._last_save = time.monotonic()
+
+    @staticmethod
+    def object_key(prefix: str, name: str) -> str:
+        return f"{prefix.strip('/')}/{name}" if prefix.strip('/') else name
+
+    def sync(self, local_dir: Path, prefix: str = '', delete: bool = False) -> SyncResult:
+        """
+        Args:
+            local_dir: Path of the directory to upload
+            prefix:    str key prefix in the bucket the files are uploaded under
+            delete:    bool also delete objects of files which were synced before, but no longer exist locally
+
+        Returns: SyncResult
+        """
+        start = time.perf_counter()
+        local_dir = Path(local_dir)
+        files = {path.relative_to(local_dir).as_posix(): path
+                 for path in sorted(local_dir.rglob('*')) if path.is_file()}
+
+        candidates, skipped = [], 0
+        for name, path in files.items():
+            stat = path.stat()
+            if self.manifest.is_unchanged(name, stat):
+                skipped += 1
+            else:
+                candidates.append((name, path, stat))
+
+        uploaded, failed, deleted = [], {}, []
+        total_bytes = 0
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.jobs) as executor, \
+                    ThreadPoolExecutor(max_workers=self.jobs) as part_executor:
+                futures = {name: executor.submit(self.sync_file, prefix, name, path, stat, part_executor)
+                           for name, path, stat in candidates}
+
+                for name, future in futures.items():
+                    try:
+                        size = future.result()
+                    except Exception as error:
+                        failed[name] = f"{type(error).__name__}: {error}"
+                        continue
+
+                    if size is None:
+                        skipped += 1
+                    else:
+                        uploaded.append(name)
+                        total_bytes += size
+
+            if delete:
+                for name in sorted(set(self.manifest.files) - set(files)):
+                    self.backend.delete_object(self.object_key(prefix, name))
+                    with self.manifest.lock:
+                        del self.manifest.files[name]
+                    deleted.append(name)
+        finally:
+            self.manifest.save()
+
+        return SyncResult(uploaded, skipped, deleted, failed, total_bytes, time.perf_counter() - start)
+
+    def part_size_for(self, size: int) -> int:
+        """
+        Returns: int part_size, or when a file of size bytes would need more than max_parts parts of it, the
+                 smallest whole number of MB which fits the file in max_parts parts, and at least min_part_size
+        """
+        if size <= self.part_size * self.max_parts:
+            return self.part_size
+
+        megabyte = 1024 * 1024
+        needed = -(-size // self.max_parts)
+        return max(self.min_part_size, -(-needed // megabyte) * megabyte)
+
+    def sync_file(self, prefix: str, name: str, path: Path, stat: os.stat_result,
+                  part_executor: Executor) -> Optional[int]:
+        """
+        Returns: Optional[int] the bytes uploaded, or None if the content of the file is unchanged
+        Raises:  SyncError if the file changed while it was hashed or uploaded
+        """
+        sha256 = file_sha256(path)
+        entry = {'sha256': sha256, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        previous = self.manifest.files.get(name)
+
+        if previous is None or previous['sha256'] != sha256:
+            key = self.object_key(prefix, name)
+            if stat.st_size >= self.multipart_threshold:
+                self.upload_multipart(key, name, path, stat.st_size, sha256, part_executor)
+            else:
+                self.backend.put_object(key, path)
+
+            if self.verbose:
+                print(f"uploaded {name} to {key}")
+            size = stat.st_size
+        else:
+            # touched, but not changed
+            size = None
+
+        after = path.stat()
+        if (after.st_size, after.st_mtime_ns) != (stat.st_size, stat.st_mtime_ns):
+            # the sha256 may not be that of what was uploaded, so leave the file for the next sync
+            raise SyncError(f"{name} changed while it was synced")
+
+        with self.manifest.lock:
+            self.manifest.files[name] = entry
+        self.save_now_and_then()
+        return size
+
+    def upload_multipart(self, key: str, name: str, path: Path, size: int, sha256: str,
+                         part_executor: Executor) -> None:
+        upload = self.manifest.uploads.get(name)
+        done = None
+
+        if upload is not None:
+            # uploads started before part_size was recorded with them were split by part_size
+            upload.setdefault('part_size', self.part_size)
+            if upload['sha256'] == sha256 and upload['key'] == key:
+                done = self.backend.list_parts(key, upload['upload_id'])
+            else:
+                # the file has changed since the upload was started
+                self.backend.abort_multipart_upload(upload['key'], upload['upload_id'])
+
+        if done is None:
+            # kept with the upload, as a resumed upload must be split the same way
+            upload = {'upload_id': self.backend.create_multipart_upload(key), 'sha256': sha256, 'key': key,
+                      'part_size': self.part_size_for(size)}
+            with self.manifest.lock:
+                self.manifest.uploads[name] = upload
+            self.manifest.save()
+            done = {}
+
+        upload_id = upload['upload_id']
+        part_size = upload['part_size']
+        part_count = max((size + part_size - 1) // part_size, 1)
+
+        def upload_part(part_number: int) -> str:
+            with path.open('rb') as input_file:
+                input_file.seek((part_number - 1) * part_size)
+                data = input_file.read(part_size)
+            return self.backend.upload_part(key, upload_id, part_number, data)
+
+        pending = {number: part_executor.submit(upload_part, number)
+                   for number in range(1, part_count + 1) if number not in done}
+        parts = dict(done)
+        parts.update({number: future.result() for number, future in pending.items()})
+
+        self.backend.complete_multipart_upload(key, upload_id, sorted(parts.items()))
+        with self.manifest.lock:
+            del self.manifest.uploads[name]
+
+    def save_now_and_then(self) -> None:
+        if time.monotonic() - self._last_save >= self.save_interval:
+            self._last_save = time.monotonic()
+            self.manifest.save()
+
+
+def sync_directory(backend: StorageBackend, local_dir: Path, prefix: str, manifest_path: Path,
+                   delete: bool = False, **kwargs) -> SyncResult:
+    """
+    Upload the files of a directory which changed since the last sync to a bucket and prefix, see DirectorySync.
+    kwargs are passed to DirectorySync.
+
+    Returns: SyncResult
+    """
+    return DirectorySync(backend, manifest_path, **kwargs).sync(Path(local_dir), prefix, delete=delete)
@@ -1,3 +1,4 @@
+import sys
 import subprocess
 from pathlib import Path
 from rsterm import EntryPoint
@@ -101,3 +102,45 @@ class NewProject(EntryPoint):
         if self.cmd_args.install:
             cmd = ['pip', 'install', '-e', '.']
             subprocess.run(cmd)
+
+
+class BuildProject(EntryPoint):
+    entry_point_args = {
+        ('project_name',): {
+            'help': "the name of your cli application."
+        },
+
+        ('--config', '-c'): {
+            'help': 'path to the rsterm config of the project, defaults to <project_name>/<project_name>.yml'
+        },
+
+        ('--output', '-o'): {
+            'help': 'path of the archive to build, defaults to dist/<project_name>.pyz'
+        },
+
+        ('--python', '-p'): {
+            'help': 'interpreter to put in the shebang line of the archive',
+            'default': '/usr/bin/env python3'
+        },
+
+        ('--compress',): {
+            'help': 'set to deflate the archive, which is smaller but slower to start',
+            'action': 'store_true'
+        }
+    }
+
+    def run(self) -> None:
+        from rsterm.discovery.build import build_zipapp
+
+        cwd = TemplateDirs.CWD
+        project_name = self.cmd_args.project_name
+        config_path = Path(self.cmd_args.config) if self.cmd_args.config else cwd / project_name / f"{project_name}.yml"
+        output = Path(self.cmd_args.output) if self.cmd_args.output else cwd / "dist" / f"{project_name}.pyz"
+
+        if cwd.as_posix() not in sys.path:
+            # the project must be importable to build its entry point manifest
+            sys.path.insert(0, cwd.as_posix())
+
+        result = build_zipapp(config_path, output, python=self.cmd_args.python, compress=self.cmd_args.compress)
+        print(result.summary())
+        print(f"run it with {result.path} <verb> <noun>")
@@ -0,0 +1,44 @@
+import sys
+from pathlib import Path
+from argparse import ArgumentParser
+from tests.benchmarks.bench import BASELINE_PATH, DEFAULT_SIZES, run_benchmarks, compare, format_report, \
+    read_baseline, write_results
+
+
+def main() -> int:
+    arg_parser = ArgumentParser(prog='python -m tests.benchmarks',
+                                description='benchmark discovery, config loading and dispatch at scale')
+    arg_parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                            help='number of entry point modules in each generated project')
+    arg_parser.add_argument('--repeat', type=int, default=5, help='number of timed calls per benchmark')
+    arg_parser.add_argument('--baseline', type=Path, default=BASELINE_PATH, help='baseline json file')
+    arg_parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='relative slow down allowed before a metric counts as a regression')
+    arg_parser.add_argument('--output', type=Path, help='write the results to this json file')
+    arg_parser.add_argument('--update-baseline', action='store_true', help='write the results as the new baseline')
+    ns = arg_parser.parse_args()
+
+    current = run_benchmarks(ns.sizes, repeat=ns.repeat)
+    baseline = read_baseline(ns.baseline) if ns.baseline.exists() else None
+    print(format_report(current, baseline))
+
+    if ns.output:
+        write_results(ns.output, current)
+
+    if ns.update_baseline:
+        write_results(ns.baseline, current)
+        print(f"baseline written to {ns.baseline}")
+        return 0
+
+    if baseline is None:
+        print(f"no baseline at {ns.baseline}, run with --update-baseline to create one")
+        return 0
+
+    regressions = compare(baseline, current, tolerance=ns.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
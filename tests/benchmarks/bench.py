@@ -0,0 +1,239 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import statistics
+import subprocess
+import tracemalloc
+from pathlib import Path
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List
+from rsterm.configs import rsterm_config
+from rsterm.configs.rsterm_config import RsTermConfig
+from rsterm.discovery import collect_entry_points, EntryPointManifest, get_command_parser
+from rsterm.discovery import parser as command_parser
+from rsterm.discovery.completion import complete
+from rsterm.discovery.build import build_zipapp
+from tests.benchmarks.projects import SyntheticProject
+
+BASELINE_PATH = Path(__file__).parent / "baseline.json"
+DEFAULT_SIZES = [10, 100, 1000]
+
+# a metric only counts as a regression when it is worse than the baseline by the relative tolerance,
+# and by at least this much, so that sub millisecond noise is ignored
+ABSOLUTE_FLOORS = {'seconds': 0.002, 'peak_kb': 256, 'max_rss_kb': 2048}
+
+RUN_COMMAND = "import sys; from pathlib import Path; from rsterm import run_entry_point; run_entry_point(Path(sys.argv.pop(1)))"
+
+
+def clear_caches(project: SyntheticProject) -> None:
+    """
+    Forget everything rsterm has cached about the project, in memory and on disk, so the next call is cold.
+    """
+    rsterm_config._parsed_files.clear()
+    rsterm_config._loaded_configs.clear()
+    shutil.rmtree((project.root / "cache").as_posix(), ignore_errors=True)
+
+    for module_name in [name for name in sys.modules if name.split('.')[0] == project.name]:
+        del sys.modules[module_name]
+
+
+@contextmanager
+def inside(project: SyntheticProject) -> Iterator[None]:
+    """
+    Make the project importable, and run from its root so the override file is found.
+    """
+    cwd, env = os.getcwd(), os.environ.get('RSTERM_CACHE_DIR')
+    sys.path.insert(0, project.root.as_posix())
+    os.environ['RSTERM_CACHE_DIR'] = (project.root / "cache").as_posix()
+    os.chdir(project.root.as_posix())
+    try:
+        yield
+    finally:
+        os.chdir(cwd)
+        sys.path.remove(project.root.as_posix())
+        if env is None:
+            os.environ.pop('RSTERM_CACHE_DIR', None)
+        else:
+            os.environ['RSTERM_CACHE_DIR'] = env
+
+
+def measure(func: Callable[[], Any], setup: Callable[[], Any] = None, repeat: int = 5) -> Dict[str, float]:
+    """
+    Time func repeat times, calling setup before each call, and then trace one more call to find its peak
+    memory allocation. tracemalloc slows everything down, so it is kept out of the timed calls.
+
+    Returns: Dict[str, float] the median seconds and the peak allocation in KB
+    """
+    timings = []
+
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {'seconds': statistics.median(timings), 'peak_kb': round(peak / 1024, 1)}
+
+
+def run_command(project: SyntheticProject, setup: Callable[[], Any] = None, repeat: int = 3,
+                zipapp: Path = None) -> Dict[str, float]:
+    """
+    Time a command end to end in a fresh interpreter, which is what a user waits for on the terminal. The command
+    is run from the project's source, as an editable install would, or from a zipapp built from it.
+
+    Returns: Dict[str, float] the median seconds and the largest max RSS of the child processes in KB
+    """
+    env = dict(os.environ, RSTERM_CACHE_DIR=(project.root / "cache").as_posix(), RSTERM_NO_DAEMON='1',
+               PYTHONPATH=os.pathsep.join([project.root.as_posix(), Path.cwd().as_posix()]))
+    env.pop('RSTERM_PROFILE', None)
+
+    if zipapp is None:
+        command = [sys.executable, '-c', RUN_COMMAND, project.config_path.as_posix()] + project.first_command
+    else:
+        # everything the command needs from the project and rsterm comes from the archive
+        env.pop('PYTHONPATH')
+        command = [sys.executable, zipapp.as_posix()] + project.first_command
+    timings, max_rss = [], 0
+
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        process = subprocess.Popen(command, cwd=project.root.as_posix(), env=env,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        _, status, usage = os.wait4(process.pid, 0)
+        timings.append(time.perf_counter() - start)
+        process.returncode = status
+        error = process.stderr.read()
+        process.stderr.close()
+
+        if status != 0:
+            raise RuntimeError(f"benchmark command failed: {error.decode()}")
+
+        # ru_maxrss is in bytes on macOS and KB everywhere else
+        max_rss = max(max_rss, usage.ru_maxrss / 1024 if sys.platform == 'darwin' else usage.ru_maxrss)
+
+    return {'seconds': statistics.median(timings), 'max_rss_kb': round(max_rss, 1)}
+
+
+def bench_project(project: SyntheticProject, repeat: int = 5) -> Dict[str, Dict[str, float]]:
+    results = {}
+
+    with inside(project):
+        results['collect_entry_points_cold'] = measure(lambda: collect_entry_points(project.config_path),
+                                                       setup=lambda: clear_caches(project), repeat=repeat)
+        results['collect_entry_points_warm'] = measure(lambda: collect_entry_points(project.config_path),
+                                                       repeat=repeat)
+
+        results['parse_config'] = measure(lambda: RsTermConfig.parse_config(project.config_path),
+                                          setup=rsterm_config._parsed_files.clear, repeat=repeat)
+
+        config = RsTermConfig.parse_config(project.config_path)
+        results['override_config'] = measure(lambda: RsTermConfig.override_config(config),
+                                             setup=rsterm_config._parsed_files.clear, repeat=repeat)
+
+        results['parse_nouns_and_verbs'] = measure(lambda: config.parse_nouns_and_verbs(project.first_command),
+                                                   repeat=repeat)
+
+        manifest = EntryPointManifest.for_config(config)
+        results['parse_command_line'] = measure(lambda: get_command_parser(config, manifest).parse(project.first_command),
+                                                setup=command_parser._command_parsers.clear, repeat=repeat)
+
+        results['complete'] = measure(lambda: complete(project.config_path, 2, project.first_command[:2] + ['--']),
+                                      repeat=repeat)
+
+    results['run_entry_point_cold'] = run_command(project, setup=lambda: clear_caches(project),
+                                                  repeat=max(1, repeat // 2))
+    results['run_entry_point_warm'] = run_command(project, repeat=max(1, repeat // 2))
+
+    with inside(project):
+        zipapp = build_zipapp(project.config_path, project.root / "dist" / f"{project.name}.pyz").path
+    results['run_zipapp_cold'] = run_command(project, setup=lambda: clear_caches(project),
+                                             repeat=max(1, repeat // 2), zipapp=zipapp)
+    results['run_zipapp_warm'] = run_command(project, repeat=max(1, repeat // 2), zipapp=zipapp)
+    return results
+
+
+def run_benchmarks(sizes: List[int] = None, repeat: int = 5) -> Dict[str, Any]:
+    """
+    Generate a synthetic project for each size, and benchmark discovery, config loading and dispatch against it.
+
+    Returns: Dict[str, Any] the results, keyed on the number of entry point modules
+    """
+    results = {}
+
+    for size in sizes or DEFAULT_SIZES:
+        project = SyntheticProject(size).create()
+        try:
+            results[str(size)] = bench_project(project, repeat=repeat)
+        finally:
+            clear_caches(project)
+            project.cleanup()
+
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': repeat,
+        'results': results
+    }
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], tolerance: float = 0.25) -> List[str]:
+    """
+    Compare a benchmark run with a baseline. Sizes and benchmarks which are not in both are skipped.
+
+    Returns: List[str] a description of each metric that regressed by more than the tolerance
+    """
+    regressions = []
+
+    for size, benchmarks in current['results'].items():
+        for name, metrics in benchmarks.items():
+            base_metrics = baseline['results'].get(size, {}).get(name, {})
+
+            for metric, value in metrics.items():
+                base_value = base_metrics.get(metric)
+
+                if base_value is None:
+                    continue
+
+                floor = ABSOLUTE_FLOORS.get(metric, 0)
+                if value > base_value * (1 + tolerance) and value - base_value > floor:
+                    percent = (value / base_value - 1) * 100 if base_value else float('inf')
+                    regressions.append(f"{name}[{size}] {metric}: {base_value:g} -> {value:g} (+{percent:.0f}%)")
+    return regressions
+
+
+def format_report(current: Dict[str, Any], baseline: Dict[str, Any] = None) -> str:
+    lines = [f"{'benchmark':<28} {'modules':>7} {'ms':>9} {'base ms':>9} {'memory KB':>10}"]
+
+    for size, benchmarks in current['results'].items():
+        for name, metrics in benchmarks.items():
+            base = (baseline or {}).get('results', {}).get(size, {}).get(name, {})
+            base_ms = f"{base['seconds'] * 1000:9.2f}" if 'seconds' in base else f"{'-':>9}"
+            memory = metrics.get('peak_kb', metrics.get('max_rss_kb'))
+            lines.append(f"{name:<28} {size:>7} {metrics['seconds'] * 1000:9.2f} {base_ms} {memory:10.1f}")
+    return '\n'.join(lines)
+
+
+def read_baseline(path: Path) -> Dict[str, Any]:
+    with open(path) as file:
+        return json.load(file)
+
+
+def write_results(path: Path, results: Dict[str, Any]) -> None:
+    with open(path, 'w') as file:
+        json.dump(results, file, indent=2, sort_keys=True)
+        file.write('\n')
@@ -0,0 +1,106 @@
+import shutil
+import tempfile
+from pathlib import Path
+
+ENTRY_POINT_MODULE = """
+from rsterm import EntryPoint
+
+
+class {class_name}(EntryPoint):
+    entry_point_args = {{
+        ('--limit', '-l'): {{
+            'help': 'number of rows',
+            'type': int,
+            'default': 10
+        }},
+        ('--dry-run',): {{
+            'action': 'store_true'
+        }}
+    }}
+
+    def run(self) -> None:
+        pass
+"""
+
+CONFIG_TEMPLATE = """rsterm:
+  app:
+    name: {name}
+    description: 'synthetic benchmark project'
+    is_pip_package: true
+    override_file: .{name}
+
+  entrypoint_paths:
+    - entrypoints
+
+  db_connections:
+{db_connections}
+
+  s3_buckets:
+{s3_buckets}
+
+  terminal:
+    verbs:
+{verbs}
+    nouns:
+{nouns}
+"""
+
+OVERRIDE_TEMPLATE = """rsterm:
+  db_connections:
+{db_connections}
+"""
+
+
+class SyntheticProject:
+    """
+    A generated rsterm app with one entry point module per noun, and a config with a verb and noun list of the same
+    size. The project lives in a temporary directory, which must be added to sys.path to import it.
+
+    Args:
+        modules: int number of entry point modules
+        name:    str app name, which must be unique within a process so modules are imported fresh
+    """
+
+    def __init__(self, modules: int, name: str = None) -> None:
+        self.modules = modules
+        self.name = name or f"bench_app_{modules}"
+        self.root = Path(tempfile.mkdtemp(prefix='rsterm_bench_'))
+        self.package_path = self.root / self.name
+        self.config_path = self.package_path / f"{self.name}.yml"
+        self.override_path = self.root / f".{self.name}"
+
+        self.verbs = [f"verb{i}" for i in range(modules)]
+        self.nouns = [f"noun{i}" for i in range(modules)]
+
+    @property
+    def first_command(self):
+        return [self.verbs[0], self.nouns[0], '--limit', '5']
+
+    def create(self) -> 'SyntheticProject':
+        entry_path = self.package_path / "entrypoints"
+        entry_path.mkdir(parents=True)
+        (self.package_path / "__init__.py").touch()
+        (entry_path / "__init__.py").touch()
+
+        for verb, noun in zip(self.verbs, self.nouns):
+            class_name = f"{verb.capitalize()}{noun.capitalize()}"
+            (entry_path / f"{noun}.py").write_text(ENTRY_POINT_MODULE.format(class_name=class_name))
+
+        def listing(values, indent=6):
+            return '\n'.join(f"{' ' * indent}- {value}" for value in values)
+
+        def mapping(prefix, indent=4):
+            return '\n'.join(f"{' ' * indent}{prefix}{i}: {prefix.upper()}{i}_URL" for i in range(self.modules))
+
+        self.config_path.write_text(CONFIG_TEMPLATE.format(
+            name=self.name,
+            db_connections=mapping('db'),
+            s3_buckets=mapping('bucket'),
+            verbs=listing(self.verbs),
+            nouns=listing(self.nouns)
+        ))
+        self.override_path.write_text(OVERRIDE_TEMPLATE.format(db_connections=mapping('override')))
+        return self
+
+    def cleanup(self) -> None:
+        shutil.rmtree(self.root.as_posix(), ignore_errors=True)
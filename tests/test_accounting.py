@@ -0,0 +1,241 @@
+import io
+import os
+import sys
+import json
+import time
+import tempfile
+import threading
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import patch
+from rsterm import EntryPoint
+from rsterm.configs import RsTermConfig
+from rsterm.discovery import EntryPointManifest
+from rsterm.discovery.discovery import dispatch
+from rsterm.entrypoint.resources import Resource
+from rsterm.exceptions import ResourceBudgetExceeded
+from rsterm.profiler import ResourceBudget, ResourceMonitor, get_budget
+from tests.test_async import CONFIG
+
+BUDGETS = """    metrics_file: {metrics_file}
+    budgets:
+      default:
+        max_rss_mb: 100000
+      run_spam:
+        max_seconds: {max_seconds}
+        action: abort
+        check_interval: 0.05
+"""
+
+
+class RunSpam(EntryPoint):
+    resource_budget = {'max_cpu_seconds': 60, 'max_seconds': 30}
+
+    def run(self) -> None:
+        garbage = []
+        garbage.append(garbage)
+        deadline = time.perf_counter() + 0.3
+        while time.perf_counter() < deadline:
+            self.check_budget()
+
+
+class RunEggs(EntryPoint):
+    tmp_dir = Resource(lambda entry_point: 'eggs')
+
+    def run(self) -> None:
+        time.sleep(0.2)
+        return self.tmp_dir
+
+
+class TestResourceBudget(TestCase):
+
+    def test_from_dict(self):
+        budget = ResourceBudget.from_dict({'max_seconds': '10', 'action': 'abort'})
+        self.assertEqual(budget, ResourceBudget(10.0, None, None, 'abort'))
+        self.assertTrue(budget.is_set)
+        self.assertFalse(ResourceBudget().is_set)
+        self.assertRaises(ValueError, ResourceBudget.from_dict, {'action': 'explode'})
+
+    def test_exceeded(self):
+        budget = ResourceBudget(max_seconds=1, max_cpu_seconds=1, max_rss_mb=10)
+        self.assertEqual(budget.exceeded(0.5, 0.5, 5), {})
+        self.assertEqual(list(budget.exceeded(2, 2, 20)), ['max_seconds', 'max_cpu_seconds', 'max_rss_mb'])
+        self.assertEqual(budget.exceeded(0.5, 0.5, None), {})
+
+    def test_get_budget(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            config_path = Path(tmp_dir) / 'spam.yml'
+            config_path.write_text(CONFIG + BUDGETS.format(metrics_file='false', max_seconds=5))
+            config = RsTermConfig.load(config_path)
+
+        self.assertIsNone(config.metrics_path)
+        self.assertEqual(get_budget(config, 'run_spam', RunSpam), ResourceBudget(5, 60, 100000, 'abort', 0.05))
+        self.assertEqual(get_budget(config, 'run_eggs'), ResourceBudget(max_rss_mb=100000))
+
+    def test_metrics_are_opt_in(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            config_path = Path(tmp_dir) / 'spam.yml'
+            config_path.write_text(CONFIG)
+            with patch.dict('os.environ', {'RSTERM_CACHE_DIR': tmp_dir}):
+                self.assertIsNone(RsTermConfig.load(config_path).metrics_path)
+
+                config_path.write_text(CONFIG + "    metrics_file: true\n")
+                os.utime(config_path.as_posix(), ns=(0, 0))
+                self.assertEqual(RsTermConfig.load(config_path).metrics_path, Path(tmp_dir) / 'spam' / 'metrics.jsonl')
+
+
+class TestResourceMonitor(TestCase):
+
+    def test_measures(self):
+        with ResourceMonitor() as monitor:
+            data = [bytearray(1024) for _ in range(1000)]
+            del data
+
+        record = monitor.record('run_spam', 'success', app='spam')
+        self.assertGreater(record['wall_seconds'], 0)
+        self.assertGreaterEqual(record['cpu_seconds'], 0)
+        self.assertEqual(len(record['gc_collections']), 3)
+        self.assertEqual(record['over_budget'], [])
+        self.assertEqual(record['app'], 'spam')
+        json.dumps(record)
+
+    def test_warn(self):
+        with patch.object(sys, 'stderr', io.StringIO()) as stderr:
+            with ResourceMonitor(ResourceBudget(max_seconds=0.05, check_interval=0.01)) as monitor:
+                time.sleep(0.1)
+
+        self.assertEqual(list(monitor.exceeded), ['max_seconds'])
+        self.assertEqual(stderr.getvalue().count('over budget: wall time'), 1)
+
+    def test_abort(self):
+        budget = ResourceBudget(max_cpu_seconds=0.05, action='abort', check_interval=0.01)
+
+        with patch.object(sys, 'stderr', io.StringIO()), self.assertRaises(ResourceBudgetExceeded) as context:
+            with ResourceMonitor(budget) as monitor:
+                while True:
+                    monitor.check()
+
+        self.assertTrue(monitor.aborted)
+        self.assertIn('cpu time', str(context.exception))
+
+    def test_abort_is_raised_on_exit(self):
+        # a command which never checks its budget is not interrupted, and fails once it has finished
+        budget = ResourceBudget(max_seconds=0.02, action='abort', check_interval=0.01)
+
+        with patch.object(sys, 'stderr', io.StringIO()), self.assertRaises(ResourceBudgetExceeded) as context:
+            with ResourceMonitor(budget) as monitor:
+                try:
+                    time.sleep(0.1)
+                finally:
+                    finished = True
+
+        self.assertTrue(finished)
+        self.assertTrue(monitor.aborted)
+        self.assertIn('wall time', str(context.exception))
+
+    def test_abort_is_raised_when_a_resource_is_created(self):
+        budget = ResourceBudget(max_seconds=0.05, action='abort', check_interval=0.01)
+        entry_point = RunEggs.__new__(RunEggs)
+
+        with patch.object(sys, 'stderr', io.StringIO()), self.assertRaises(ResourceBudgetExceeded):
+            with ResourceMonitor(budget):
+                entry_point.run()
+
+        self.assertNotIn('tmp_dir', entry_point.__dict__)
+        self.assertEqual(entry_point.tmp_dir, 'eggs')
+
+    def test_kill_after(self):
+        budget = ResourceBudget(max_seconds=0.02, action='abort', check_interval=0.01, kill_after=0.05)
+
+        with patch('os._exit') as exit_process, patch.object(sys, 'stderr', io.StringIO()) as stderr, \
+                self.assertRaises(ResourceBudgetExceeded):
+            with ResourceMonitor(budget):
+                time.sleep(0.2)
+
+        exit_process.assert_called_once_with(3)
+        self.assertIn('killed', stderr.getvalue())
+
+    def test_per_thread(self):
+        # another thread burns cpu while the monitored one sleeps, and must not be charged for it
+        stop = threading.Event()
+
+        def spin() -> None:
+            while not stop.is_set():
+                pass
+
+        busy = threading.Thread(target=spin)
+        budget = ResourceBudget(max_cpu_seconds=0.1, max_rss_mb=0.001, action='abort', check_interval=0.01)
+
+        busy.start()
+        try:
+            with patch('rsterm.profiler.accounting.reset_peak_rss') as reset_peak_rss, \
+                    patch.object(sys, 'stderr', io.StringIO()):
+                with ResourceMonitor(budget, per_thread=True) as monitor:
+                    time.sleep(0.3)
+        finally:
+            stop.set()
+            busy.join()
+
+        self.assertFalse(monitor.aborted)
+        self.assertEqual(monitor.exceeded, {})
+        self.assertLess(monitor.cpu_seconds, 0.1)
+        reset_peak_rss.assert_not_called()
+
+        record = monitor.record('run_spam', 'success')
+        self.assertEqual(record['measured'], 'thread')
+        self.assertIsNone(record['peak_rss_mb'])
+        self.assertIsNone(record['gc_collections'])
+
+
+class TestDispatchAccounting(TestCase):
+
+    def dispatch(self, max_seconds: float, **kwargs):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            metrics_path = Path(tmp_dir) / 'metrics.jsonl'
+            config_path = Path(tmp_dir) / 'spam.yml'
+            config_path.write_text(CONFIG + BUDGETS.format(metrics_file=metrics_path, max_seconds=max_seconds))
+
+            with patch.dict('os.environ', {'RSTERM_CACHE_DIR': tmp_dir}), \
+                    patch.object(sys, 'stderr', io.StringIO()) as stderr, \
+                    patch.object(EntryPointManifest, 'get_entry_point', return_value=RunSpam):
+                exit_code = dispatch(config_path, ['run', 'spam'], **kwargs)
+
+            records = [json.loads(line) for line in metrics_path.read_text().splitlines()]
+        return exit_code, records, stderr.getvalue()
+
+    def test_metrics_are_recorded(self):
+        exit_code, records, _ = self.dispatch(max_seconds=30)
+
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]['command'], 'run_spam')
+        self.assertEqual(records[0]['status'], 'success')
+        self.assertEqual(records[0]['app'], 'spam')
+        self.assertGreaterEqual(records[0]['wall_seconds'], 0.3)
+
+    def test_abort_over_budget(self):
+        exit_code, records, stderr = self.dispatch(max_seconds=0.1)
+
+        self.assertEqual(exit_code, 1)
+        self.assertEqual(records[0]['status'], 'aborted')
+        self.assertLess(records[0]['wall_seconds'], 0.3)
+        self.assertIn('run_spam aborted, wall time', stderr)
+
+    def test_unmonitored_without_budget_or_metrics(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            config_path = Path(tmp_dir) / 'spam.yml'
+            config_path.write_text(CONFIG)
+
+            with patch.dict('os.environ', {'RSTERM_CACHE_DIR': tmp_dir}), \
+                    patch('rsterm.discovery.discovery.ResourceMonitor') as monitor, \
+                    patch.object(EntryPointManifest, 'get_entry_point', return_value=RunEggs):
+                self.assertEqual(dispatch(config_path, ['run', 'spam']), 0)
+
+        monitor.assert_not_called()
+
+    def test_concurrent_commands_are_measured_per_thread(self):
+        exit_code, records, _ = self.dispatch(max_seconds=30, concurrent=True)
+
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(records[0]['measured'], 'thread')
+        self.assertGreater(records[0]['cpu_seconds'], 0.1)
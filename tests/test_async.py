@@ -0,0 +1,124 @@
+import sys
+import asyncio
+import tempfile
+import threading
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import patch
+from rsterm import EntryPoint, run_entry_point
+from rsterm.database import AsyncConnection, ConnectionPool
+from rsterm.discovery import EntryPointManifest
+from rsterm.scheduler import run_coroutine, gather_bounded, map_bounded
+from tests.test_pool import make_connection
+
+CONFIG = """
+rsterm:
+  app:
+    name: spam
+  entrypoint_paths:
+    - entrypoints
+  terminal:
+    verbs:
+      - run
+    nouns:
+      - spam
+"""
+
+
+class RunSpam(EntryPoint):
+    ran = False
+
+    async def run(self) -> None:
+        await asyncio.sleep(0)
+        RunSpam.ran = True
+
+
+class TestBoundedHelpers(TestCase):
+
+    def test_gather_bounded_limits_concurrency(self):
+        state = {'running': 0, 'peak': 0}
+
+        async def work(value):
+            state['running'] += 1
+            state['peak'] = max(state['peak'], state['running'])
+            await asyncio.sleep(0.01)
+            state['running'] -= 1
+            return value
+
+        results = run_coroutine(gather_bounded([work(i) for i in range(10)], limit=3))
+        self.assertEqual(results, list(range(10)))
+        self.assertEqual(state['peak'], 3)
+
+    def test_map_bounded(self):
+        async def double(value):
+            return value * 2
+
+        self.assertEqual(run_coroutine(map_bounded(double, [1, 2, 3], limit=2)), [2, 4, 6])
+
+
+class TestAsyncConnection(TestCase):
+
+    def test_queries_use_pooled_connections(self):
+        pool = ConnectionPool(make_connection, max_size=2)
+
+        async def query():
+            async with AsyncConnection(pool) as db:
+                return await gather_bounded([db.fetchone("select 1") for _ in range(5)], limit=5)
+
+        results = run_coroutine(query())
+        self.assertEqual(len(results), 5)
+        self.assertLessEqual(pool.size, 2)
+        self.assertEqual(pool.idle, pool.size)
+
+    def test_failed_query_rolled_back(self):
+        conn = make_connection()
+        conn.cursor.return_value.__enter__.return_value.execute.side_effect = ValueError("syntax error")
+        pool = ConnectionPool(lambda: conn, max_size=1, health_check=False)
+
+        async def query():
+            async with AsyncConnection(pool) as db:
+                await db.execute("selec 1")
+
+        self.assertRaises(ValueError, run_coroutine, query())
+        conn.rollback.assert_called()
+
+    def test_max_workers(self):
+        pool = ConnectionPool(make_connection, max_size=2)
+
+        self.assertEqual(AsyncConnection(pool).max_workers, 2)
+        self.assertEqual(AsyncConnection(pool, max_workers=1).max_workers, 1)
+        self.assertRaisesRegex(ValueError, 'max_size=2', AsyncConnection, pool, max_workers=3)
+
+    def test_exit_does_not_block_the_loop(self):
+        pool = ConnectionPool(make_connection, max_size=1)
+        closed_on = []
+
+        async def query():
+            db = AsyncConnection(pool)
+            close = db.close
+            db.close = lambda: (closed_on.append(threading.get_ident()), close())
+            async with db:
+                pass
+            return threading.get_ident()
+
+        loop_thread = run_coroutine(query())
+        self.assertEqual(len(closed_on), 1)
+        self.assertNotEqual(closed_on[0], loop_thread)
+
+
+class TestAsyncEntryPoint(TestCase):
+
+    def test_dispatcher_runs_async_entry_point(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            config_path = Path(tmp_dir) / "spam.yml"
+            config_path.write_text(CONFIG)
+
+            with patch.object(sys, 'argv', ['spam', 'run', 'spam']), \
+                    patch.dict('os.environ', {'RSTERM_CACHE_DIR': tmp_dir}), \
+                    patch.object(EntryPointManifest, 'for_config') as patched_manifest:
+                patched_manifest.return_value.get_entry_point.return_value = RunSpam
+                with self.assertRaises(SystemExit) as exited:
+                    run_entry_point(config_path)
+
+        self.assertEqual(exited.exception.code, 0)
+        self.assertTrue(RunSpam.ran)
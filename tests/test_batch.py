@@ -0,0 +1,84 @@
+import io
+import sys
+import time
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import patch
+from rsterm.discovery.batch import read_batch, run_batch, run_batch_option
+from rsterm.scheduler import SUCCESS, FAILED
+from tests.test_async import CONFIG
+
+BATCH = """
+# nightly jobs
+run spam --eggs 1
+run spam --eggs 'two words'
+
+wait
+run beans
+"""
+
+
+def fake_dispatch(config_path, args, manifest=None, concurrent=False):
+    time.sleep(0.01)
+    print(f"concurrent {concurrent}")
+    print(f"start {args}")
+    print(f"end {args}")
+    if args[1] == 'beans':
+        raise ValueError("no beans")
+    return 0
+
+
+class TestBatch(TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp_dir.name)
+        self.config_path = self.root / "spam.yml"
+        self.config_path.write_text(CONFIG)
+        self.env = patch.dict('os.environ', {'RSTERM_CACHE_DIR': (self.root / "cache").as_posix()})
+        self.env.start()
+
+    def tearDown(self) -> None:
+        self.env.stop()
+        self.tmp_dir.cleanup()
+
+    def test_read_batch(self):
+        groups = read_batch(io.StringIO(BATCH))
+        self.assertEqual(len(groups), 2)
+        self.assertEqual(groups[0][1].args, ['run', 'spam', '--eggs', 'two words'])
+        self.assertEqual(groups[0][1].line_number, 4)
+        self.assertEqual(groups[1][0].args, ['run', 'beans'])
+
+    def run_batch(self, jobs):
+        stdout = io.StringIO()
+        with patch('rsterm.discovery.batch.dispatch', side_effect=fake_dispatch), \
+                patch.object(sys, 'stdout', stdout), patch.object(sys, 'stderr', io.StringIO()):
+            results = run_batch(self.config_path, read_batch(io.StringIO(BATCH)), jobs=jobs)
+        return results, stdout.getvalue()
+
+    def test_sequential(self):
+        results, stdout = self.run_batch(jobs=1)
+        self.assertEqual([r.status for r in results], [SUCCESS, SUCCESS, FAILED])
+        self.assertNotIn('concurrent True', stdout)
+        self.assertEqual(results[2].error, 'ValueError: no beans')
+
+    def test_concurrent_output_not_interleaved(self):
+        results, stdout = self.run_batch(jobs=2)
+        self.assertEqual([r.value for r in results], [0, 0, 1])
+
+        lines = stdout.splitlines()
+        self.assertIn('concurrent True', lines)
+        lines = [line for line in lines if not line.startswith('concurrent')]
+        for index in range(0, len(lines), 2):
+            self.assertEqual(lines[index].replace('start', 'end'), lines[index + 1])
+
+    def test_batch_option(self):
+        batch_path = self.root / "batch.txt"
+        batch_path.write_text("run spam\n")
+
+        with patch('rsterm.discovery.batch.dispatch', return_value=0), patch('builtins.print') as patched_print:
+            exit_code = run_batch_option(self.config_path, [batch_path.as_posix(), '--jobs', '2'])
+
+        self.assertEqual(exit_code, 0)
+        self.assertIn('1: run spam', patched_print.call_args[0][0])
@@ -0,0 +1,98 @@
+import importlib.util
+from decimal import Decimal
+from datetime import date, datetime, timezone
+from unittest import TestCase, skipUnless
+from unittest.mock import MagicMock
+from rsterm.database import fetch_batches
+from rsterm.database.batches import describe_columns
+
+DESCRIPTION = [
+    ('id', 20, None, None, None, None, None),
+    ('name', 1043, None, None, None, None, None),
+    ('amount', 1700, None, None, 10, 2, None),
+    ('paid', 16, None, None, None, None, None),
+    ('day', 1082, None, None, None, None, None),
+    ('created', 1184, None, None, None, None, None),
+    ('extra', 3802, None, None, None, None, None)
+]
+
+ROWS = [
+    (1, 'spam', Decimal('1.50'), True, date(2020, 1, 1), datetime(2020, 1, 1, 1, tzinfo=timezone.utc), {'a': 1}),
+    (2, 'eggs', Decimal('2.25'), False, date(2020, 1, 2), datetime(2020, 1, 2, 2, tzinfo=timezone.utc), None),
+    (None, None, None, None, None, None, None)
+]
+
+
+def make_connection(rows=ROWS) -> MagicMock:
+    conn = MagicMock()
+    conn.autocommit = False
+    cursor = conn.cursor.return_value.__enter__.return_value
+    cursor.description = DESCRIPTION
+    pending = list(rows)
+
+    def fetchmany(size):
+        batch = pending[:size]
+        del pending[:size]
+        return batch
+
+    cursor.fetchmany.side_effect = fetchmany
+    return conn
+
+
+@skipUnless(importlib.util.find_spec('numpy'), 'numpy is not installed')
+class TestNumpyBatches(TestCase):
+
+    def test_batches(self):
+        import numpy
+
+        conn = make_connection()
+        batches = list(fetch_batches(conn, 'select * from spam', batch_size=2))
+
+        self.assertEqual(len(batches), 2)
+        first, last = batches
+        self.assertEqual(first['id'].dtype, numpy.int64)
+        self.assertEqual(first['amount'].tolist(), [1.5, 2.25])
+        self.assertEqual(first['paid'].dtype, numpy.bool_)
+        self.assertEqual(first['day'].dtype, numpy.dtype('datetime64[D]'))
+        self.assertEqual(str(first['created'][1]), '2020-01-02T02:00:00.000000')
+        self.assertEqual(first['extra'][0], {'a': 1})
+
+        self.assertTrue(numpy.isnan(last['id'][0]))
+        self.assertIsNone(last['paid'][0])
+        self.assertTrue(numpy.isnat(last['day'][0]))
+
+        self.assertTrue(conn.cursor.call_args[1]['name'].startswith('rsterm_batches_'))
+        self.assertEqual(conn.cursor.return_value.__enter__.return_value.itersize, 2)
+
+    def test_empty_result(self):
+        self.assertEqual(list(fetch_batches(make_connection([]), 'select * from spam')), [])
+
+    def test_unsupported_output(self):
+        self.assertRaises(ValueError, list, fetch_batches(make_connection(), 'select 1', output='pandas'))
+
+
+@skipUnless(importlib.util.find_spec('pyarrow'), 'pyarrow is not installed')
+class TestArrowBatches(TestCase):
+
+    def test_batches(self):
+        import pyarrow
+
+        batches = list(fetch_batches(make_connection(), 'select * from spam', batch_size=3, output='arrow'))
+
+        self.assertEqual(len(batches), 1)
+        batch = batches[0]
+        self.assertEqual(batch.num_rows, 3)
+        self.assertEqual(batch.schema.field('amount').type, pyarrow.decimal128(10, 2))
+        self.assertEqual(batch.schema.field('created').type, pyarrow.timestamp('us', tz='UTC'))
+        self.assertEqual(batch.column(0).to_pylist(), [1, 2, None])
+
+    def test_auto(self):
+        batches = list(fetch_batches(make_connection(), 'select * from spam', output='auto'))
+        self.assertEqual(batches[0].num_rows, 3)
+
+
+class TestDescribeColumns(TestCase):
+
+    def test_kinds(self):
+        kinds = [column.kind for column in describe_columns(DESCRIPTION)]
+        self.assertEqual(kinds, ['int', 'string', 'decimal', 'bool', 'date', 'timestamptz', 'object'])
@@ -0,0 +1,33 @@
+from unittest import TestCase
+from tests.benchmarks.bench import compare, run_benchmarks
+
+
+def results(seconds, peak_kb):
+    return {'results': {'10': {'parse_config': {'seconds': seconds, 'peak_kb': peak_kb}}}}
+
+
+class TestBenchmarks(TestCase):
+
+    def test_compare_within_tolerance(self):
+        self.assertEqual(compare(results(0.1, 1000), results(0.12, 1100)), [])
+
+    def test_compare_regression(self):
+        regressions = compare(results(0.1, 1000), results(0.2, 1000))
+        self.assertEqual(len(regressions), 1)
+        self.assertIn('parse_config[10] seconds', regressions[0])
+
+    def test_compare_ignores_noise_below_floor(self):
+        self.assertEqual(compare(results(0.0001, 10), results(0.0005, 50)), [])
+
+    def test_compare_skips_missing_benchmarks(self):
+        self.assertEqual(compare({'results': {}}, results(1.0, 1000)), [])
+
+    def test_run_benchmarks(self):
+        current = run_benchmarks([3], repeat=1)
+        benchmarks = current['results']['3']
+
+        self.assertIn('collect_entry_points_cold', benchmarks)
+        self.assertIn('run_entry_point_warm', benchmarks)
+        self.assertIn('run_zipapp_warm', benchmarks)
+        self.assertGreater(benchmarks['parse_config']['seconds'], 0)
+        self.assertEqual(compare(current, current), [])
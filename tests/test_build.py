@@ -0,0 +1,97 @@
+import os
+import sys
+import zipfile
+import tempfile
+import subprocess
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import patch
+from rsterm.configs import RsTermConfig, rsterm_config
+from rsterm.discovery import EntryPointManifest, manifest as entry_point_manifest
+from rsterm.discovery.build import build_zipapp, freeze
+from rsterm.discovery.frozen import install_frozen
+from tests.test_parser import CONFIG, HELPER_MODULE, ENTRY_POINT_MODULE
+
+
+class TestBuildZipapp(TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp_dir.name)
+        self.app_name = f"build_app_{id(self)}"
+        package_path = self.root / self.app_name
+        (package_path / "entrypoints").mkdir(parents=True)
+        (package_path / "__init__.py").touch()
+        (package_path / "helpers.py").write_text(HELPER_MODULE)
+        (package_path / "entrypoints" / "__init__.py").touch()
+        (package_path / "entrypoints" / "spam.py").write_text(ENTRY_POINT_MODULE.replace("APP_NAME", self.app_name))
+        self.config_path = package_path / f"{self.app_name}.yml"
+        self.config_path.write_text(CONFIG.format(name=self.app_name))
+        self.output = self.root / "dist" / f"{self.app_name}.pyz"
+
+        sys.path.insert(0, self.root.as_posix())
+        self.env = patch.dict(os.environ, {'RSTERM_CACHE_DIR': (self.root / "cache").as_posix(),
+                                           'RSTERM_NO_DAEMON': '1'})
+        self.env.start()
+
+    def tearDown(self) -> None:
+        self.env.stop()
+        sys.path.remove(self.root.as_posix())
+        for name in list(sys.modules):
+            if name.startswith(self.app_name):
+                del sys.modules[name]
+        rsterm_config._frozen_configs.clear()
+        entry_point_manifest._frozen_manifests.clear()
+        self.tmp_dir.cleanup()
+
+    def run_zipapp(self, *args: str) -> subprocess.CompletedProcess:
+        env = dict(os.environ)
+        env.pop('PYTHONPATH', None)
+        return subprocess.run([sys.executable, self.output.as_posix()] + list(args), cwd=self.root.as_posix(),
+                              env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+
+    def test_build_contents(self):
+        result = build_zipapp(self.config_path, self.output)
+
+        with zipfile.ZipFile(self.output.as_posix()) as archive:
+            names = archive.namelist()
+
+        self.assertIn('__main__.py', names)
+        self.assertIn('_rsterm_frozen.pyc', names)
+        self.assertIn(f"{self.app_name}/entrypoints/spam.pyc", names)
+        self.assertIn(f"{self.app_name}/{self.app_name}.yml", names)
+        self.assertIn('rsterm/discovery/frozen.pyc', names)
+        self.assertFalse([name for name in names if name.endswith('.py') and name != '__main__.py'])
+        self.assertEqual(result.files, len(names))
+        self.assertTrue(self.output.read_bytes().startswith(b"#!/usr/bin/env python3\n"))
+        self.assertTrue(os.access(self.output.as_posix(), os.X_OK))
+
+    def test_run_zipapp(self):
+        build_zipapp(self.config_path, self.output)
+        self.config_path.unlink()
+
+        process = self.run_zipapp('run', 'spam', '--name', 'eggs', '-c', '2')
+        self.assertEqual(process.returncode, 0, process.stderr)
+        self.assertEqual(process.stdout, "EGGSEGGS\n")
+
+        process = self.run_zipapp('--rsterm-complete', '1', 'run', '')
+        self.assertEqual(process.stdout.split(), ['eggs', 'spam'])
+
+    def test_frozen_config_and_manifest(self):
+        config = RsTermConfig.parse_config(self.config_path)
+        manifest = EntryPointManifest.for_config(config)
+        namespace = {}
+        exec(freeze(self.config_path, config, manifest, self.config_path.parent), namespace)
+
+        frozen_path = self.root / "app.pyz" / namespace['CONFIG_NAME']
+        install_frozen(frozen_path, namespace['CONFIG'], namespace['MANIFEST'])
+
+        with patch('yaml.safe_load') as safe_load:
+            frozen_config = RsTermConfig.load(frozen_path)
+        safe_load.assert_not_called()
+        self.assertEqual(frozen_config.to_dict(), config.to_dict())
+
+        with patch.object(EntryPointManifest, 'refresh') as refresh:
+            frozen_manifest = EntryPointManifest.for_config(frozen_config)
+        refresh.assert_not_called()
+        self.assertEqual(frozen_manifest.entries, manifest.entries)
@@ -0,0 +1,249 @@
+import io
+import csv
+import json
+import tempfile
+import threading
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import patch
+import psycopg2
+from rsterm.database.bulk_load import BulkLoader, ChunkReader, split_file, split_csv_records, to_csv
+from rsterm.exceptions import BulkLoadError
+
+
+class FakeDatabase:
+    """
+    Records the statements run on its connections, and the rows copied and committed. COPY rejects any record
+    with a field of "bad".
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.statements = []
+        self.rows = []
+        self.copied = []
+        self.connections = 0
+
+    def connect(self) -> 'FakeConnection':
+        with self.lock:
+            self.connections += 1
+        return FakeConnection(self)
+
+
+class FakeCursor:
+
+    def __init__(self, conn: 'FakeConnection') -> None:
+        self.conn = conn
+        self.rowcount = -1
+
+    def __enter__(self) -> 'FakeCursor':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+    def execute(self, sql: str) -> None:
+        self.conn.pending_statements.append(sql)
+
+    def copy_expert(self, sql: str, data) -> None:
+        content = data.read()
+        content = content.decode() if isinstance(content, bytes) else content
+        records = list(csv.reader(io.StringIO(content)))
+
+        if any('bad' in record for record in records):
+            raise psycopg2.DataError('invalid input syntax for type integer: "bad"')
+        self.conn.pending_copies.append(content)
+        self.conn.pending_rows.extend(records)
+        self.rowcount = len(records)
+
+
+class FakeConnection:
+
+    def __init__(self, database: FakeDatabase) -> None:
+        self.database = database
+        self.pending_rows = []
+        self.pending_copies = []
+        self.pending_statements = []
+        self.closed = False
+
+    def cursor(self) -> FakeCursor:
+        return FakeCursor(self)
+
+    def commit(self) -> None:
+        with self.database.lock:
+            self.database.rows.extend(self.pending_rows)
+            self.database.copied.extend(self.pending_copies)
+            self.database.statements.extend(self.pending_statements)
+        self.rollback()
+
+    def rollback(self) -> None:
+        self.pending_rows, self.pending_copies, self.pending_statements = [], [], []
+
+    def close(self) -> None:
+        self.closed = True
+
+
+class TestSplitFile(TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp_dir.name) / 'data.csv'
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def read_chunks(self, chunks):
+        contents = []
+        for chunk in chunks:
+            with ChunkReader(self.path, chunk) as reader:
+                contents.append(reader.read())
+        return contents
+
+    def test_chunks_end_on_lines(self):
+        self.path.write_bytes(b''.join(f"{i},row {i}\n".encode() for i in range(100)))
+        chunks = split_file(self.path, 50)
+
+        self.assertGreater(len(chunks), 10)
+        contents = self.read_chunks(chunks)
+        self.assertEqual(b''.join(contents), self.path.read_bytes())
+        self.assertTrue(all(content.endswith(b'\n') for content in contents))
+
+    def test_quoted_line_breaks_stay_in_one_chunk(self):
+        self.path.write_bytes(b'1,"first\nsecond\nthird ""quoted""\nfourth"\n2,plain\n3,"x\ny"\n')
+        chunks = split_file(self.path, 5)
+        records = [list(csv.reader(io.StringIO(content.decode()))) for content in self.read_chunks(chunks)]
+
+        self.assertEqual(records, [[['1', 'first\nsecond\nthird "quoted"\nfourth']], [['2', 'plain']], [['3', 'x\ny']]])
+
+    def test_start_and_small_file(self):
+        self.path.write_bytes(b'id,name\n1,spam\n')
+        self.assertEqual(self.read_chunks(split_file(self.path, 1024, start=8)), [b'1,spam\n'])
+
+
+class TestBulkLoader(TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp_dir.name)
+        self.database = FakeDatabase()
+        self.loader = BulkLoader(self.database.connect, jobs=3, chunk_bytes=40, verbose=False)
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def write_csv(self, rows, name='data.csv') -> Path:
+        path = self.root / name
+        with path.open('w', newline='') as csv_file:
+            csv.writer(csv_file).writerows([['id', 'name']] + rows)
+        return path
+
+    def test_append(self):
+        path = self.write_csv([[i, f"name {i}"] for i in range(50)])
+        result = self.loader.load(path, 'public.users')
+
+        self.assertEqual(result.rows, 50)
+        self.assertEqual(result.rejected, 0)
+        self.assertGreater(result.chunks, 1)
+        self.assertEqual(sorted(int(row[0]) for row in self.database.rows), list(range(50)))
+
+        create, insert, drop = self.database.statements
+        staging = create.split()[2]
+        self.assertTrue(staging.startswith('public.users_rsterm_staging_'))
+        self.assertEqual(create, f"CREATE TABLE {staging} (LIKE public.users INCLUDING DEFAULTS)")
+        self.assertEqual(insert, f'INSERT INTO public.users ("id", "name") SELECT "id", "name" FROM {staging}')
+        self.assertEqual(drop, f"DROP TABLE {staging}")
+        self.assertIn("rows/s", result.summary())
+
+    def test_swap_and_merge(self):
+        path = self.write_csv([[1, 'spam']])
+
+        self.loader.load(path, 'public.users', mode='swap')
+        truncate, insert, drop = self.database.statements[1:]
+        self.assertEqual(truncate, 'TRUNCATE public.users')
+        self.assertTrue(insert.startswith('INSERT INTO public.users ("id", "name") SELECT "id", "name" FROM'))
+        self.assertTrue(drop.startswith('DROP TABLE public.users_rsterm_staging_'))
+
+        self.database.statements = []
+        self.loader.load(path, 'users', mode='merge', keys=['id'])
+        delete = self.database.statements[1]
+        self.assertRegex(delete, r'^DELETE FROM users USING (\w+) WHERE users."id" = \1."id"$')
+
+        self.assertRaises(ValueError, self.loader.load, path, 'users', mode='merge')
+        self.assertRaises(ValueError, self.loader.load, path, 'users; drop table users')
+
+    def test_rejects(self):
+        rows = [[i, 'bad' if i in (7, 31) else f"name {i}"] for i in range(40)]
+        path = self.write_csv(rows)
+        self.loader.max_rejects = 2
+        result = self.loader.load(path, 'users')
+
+        self.assertEqual(result.rows, 38)
+        self.assertEqual(result.rejected, 2)
+        self.assertEqual(result.rejects_path, self.root / 'data.csv.rejects')
+
+        rejects = [json.loads(line) for line in result.rejects_path.read_text().splitlines()]
+        self.assertEqual(sorted(reject['record'] for reject in rejects), ['31,bad', '7,bad'])
+        self.assertIn('invalid input syntax', rejects[0]['error'])
+
+    def test_too_many_rejects_leaves_table(self):
+        path = self.write_csv([[1, 'bad'], [2, 'spam']])
+
+        with self.assertRaises(BulkLoadError):
+            self.loader.load(path, 'users')
+
+        self.assertTrue(self.database.statements[-1].startswith('DROP TABLE IF EXISTS users_rsterm_staging_'))
+        self.assertFalse(any(statement.startswith('INSERT') for statement in self.database.statements))
+
+    def test_jsonl(self):
+        path = self.root / 'data.jsonl'
+        lines = [json.dumps({'id': i, 'name': f"name {i}", 'tags': ['a'] if i == 0 else None}) for i in range(20)]
+        path.write_text('\n'.join(lines[:10] + ['{not json'] + lines[10:]) + '\n')
+        self.loader.max_rejects = 1
+
+        with patch('sys.stdout', io.StringIO()) as stdout:
+            self.loader.verbose = True
+            result = self.loader.load(path, 'users')
+
+        self.assertEqual(result.rows, 20)
+        self.assertEqual(result.rejected, 1)
+        self.assertIn(['0', 'name 0', '["a"]'], self.database.rows)
+        self.assertIn(['1', 'name 1', ''], self.database.rows)
+        self.assertIn('"1","name 1",\n', ''.join(self.database.copied))
+        self.assertIn('INSERT INTO users ("id", "name", "tags")', self.database.statements[-2])
+        self.assertIn("1 rejected", stdout.getvalue())
+
+    def test_empty_strings_and_nulls_are_kept_apart(self):
+        self.assertEqual(to_csv([['', None, 'x', 'say "hi"']]).getvalue(), '"",,"x","say ""hi"""\n')
+        self.assertEqual(split_csv_records('1,"",a\n2,,"b\nc"\n\n'), ['1,"",a\n', '2,,"b\nc"\n'])
+
+        path = self.root / 'data.jsonl'
+        path.write_text('\n'.join(json.dumps(record) for record in [{'id': 1, 'name': ''}, {'id': 2, 'name': None}]))
+        self.loader.load(path, 'users')
+        self.assertEqual(self.database.copied, ['"1",""\n"2",\n'])
+
+        self.database.copied = []
+        path = self.root / 'data.csv'
+        path.write_text('id,name\n1,""\n2,\n3,bad\n')
+        self.loader.max_rejects = 1
+        self.loader.chunk_bytes = 1024
+        self.loader.load(path, 'users')
+        self.assertEqual(sorted(self.database.copied), ['1,""\n', '2,\n'])
+
+    def test_column_names_are_quoted(self):
+        path = self.root / 'data.csv'
+        path.write_text('id); DROP TABLE x; --,Full "Name"\n1,spam\n')
+        copies = []
+
+        with patch.object(FakeCursor, 'copy_expert', autospec=True,
+                          side_effect=lambda cursor, sql, data: copies.append(sql) or cursor.conn.pending_rows.append(1)):
+            self.loader.load(path, 'users', mode='merge', keys=['id); DROP TABLE x; --'])
+
+        columns = '"id); DROP TABLE x; --", "Full ""Name"""'
+        self.assertEqual(copies[0].split(' FROM STDIN')[0].split(' ', 2)[2], f"({columns})")
+        delete, insert = self.database.statements[1:3]
+        self.assertTrue(delete.endswith('."id); DROP TABLE x; --"'))
+        self.assertTrue(insert.startswith(f"INSERT INTO users ({columns}) SELECT {columns} FROM"))
+        self.assertFalse(any(statement.startswith('DROP TABLE x') for statement in self.database.statements))
+
+        path.write_text(',name\n1,spam\n')
+        self.assertRaises(ValueError, self.loader.load, path, 'users')
@@ -0,0 +1,107 @@
+import io
+import os
+import sys
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import patch
+from rsterm import run_entry_point
+from rsterm.configs import RsTermConfig
+from rsterm.discovery import EntryPointManifest
+from rsterm.discovery.completion import complete, completion_script
+from tests.test_parser import CONFIG
+
+ENTRY_POINT_MODULE = """
+from rsterm import EntryPoint
+
+
+class RunSpam(EntryPoint):
+    entry_point_args = {
+        ('--format', '-f'): {'choices': ['csv', 'json']},
+        ('--verbose',): {'action': 'store_true'},
+        ('--tag',): {'action': 'append'}
+    }
+
+    def run(self) -> None:
+        pass
+"""
+
+
+class TestCompletion(TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp_dir.name)
+        self.app_name = f"completion_app_{id(self)}"
+        entry_path = self.root / self.app_name / "entrypoints"
+        entry_path.mkdir(parents=True)
+        (entry_path.parent / "__init__.py").touch()
+        (entry_path / "__init__.py").touch()
+        (entry_path / "spam.py").write_text(ENTRY_POINT_MODULE)
+        self.config_path = self.root / self.app_name / "config.yml"
+        self.config_path.write_text(CONFIG.format(name=self.app_name))
+
+        sys.path.insert(0, self.root.as_posix())
+        self.env = patch.dict(os.environ, {'RSTERM_CACHE_DIR': (self.root / "cache").as_posix()})
+        self.env.start()
+
+    def tearDown(self) -> None:
+        self.env.stop()
+        sys.path.remove(self.root.as_posix())
+        for name in list(sys.modules):
+            if name.startswith(self.app_name):
+                del sys.modules[name]
+        self.tmp_dir.cleanup()
+
+    def refresh_manifest(self) -> None:
+        EntryPointManifest.for_config(RsTermConfig.load(self.config_path))
+        for name in list(sys.modules):
+            if name.startswith(f"{self.app_name}."):
+                del sys.modules[name]
+
+    def complete(self, *words: str):
+        return complete(self.config_path, len(words) - 1, list(words))
+
+    def test_complete_verbs_and_nouns(self):
+        self.refresh_manifest()
+
+        self.assertEqual(self.complete(''), ['make', 'run'])
+        self.assertEqual(self.complete('r'), ['run'])
+        self.assertEqual(self.complete('run', ''), ['spam'])
+        self.assertEqual(self.complete('make', ''), [])
+        self.assertEqual(self.complete('walk', ''), [])
+        self.assertIn('--rsterm-serve', self.complete('--rsterm-s'))
+
+    def test_complete_options(self):
+        self.refresh_manifest()
+
+        self.assertEqual(self.complete('run', 'spam', ''), ['--format', '--help', '--tag', '--verbose', '-f'])
+        self.assertEqual(self.complete('run', 'spam', '--verbose', '--t'), ['--tag'])
+        self.assertEqual(self.complete('run', 'spam', '--verbose', '--v'), [])
+        self.assertEqual(self.complete('run', 'spam', '--tag', 'a', '--t'), ['--tag'])
+        self.assertEqual(self.complete('run', 'spam', '-f', ''), ['csv', 'json'])
+        self.assertEqual(self.complete('run', 'spam', '--tag', ''), [])
+        self.assertNotIn(f"{self.app_name}.entrypoints.spam", sys.modules)
+
+    def test_complete_before_the_manifest_exists(self):
+        self.assertEqual(self.complete('run', ''), ['eggs', 'spam'])
+        self.assertEqual(self.complete('run', 'spam', '--'), ['--help'])
+        self.assertFalse(self.root.joinpath("cache", self.app_name, "manifest.json").exists())
+
+    def test_completion_scripts(self):
+        self.assertIn('complete -o default -F _my_app_complete my-app', completion_script('bash', 'my-app'))
+        self.assertIn('compdef _my_app_complete my-app', completion_script('zsh', 'my-app'))
+
+    def test_run_entry_point(self):
+        self.refresh_manifest()
+
+        for argv, expected in [(['--rsterm-complete', '1', 'run', 's'], "spam\n"),
+                               (['--rsterm-completion', 'bash', '--prog', 'spam'], "complete -o default")]:
+            stdout = io.StringIO()
+
+            with patch.object(sys, 'argv', ['spam'] + argv), patch.object(sys, 'stdout', stdout):
+                with self.assertRaises(SystemExit) as exited:
+                    run_entry_point(self.config_path)
+
+            self.assertEqual(exited.exception.code, 0)
+            self.assertIn(expected, stdout.getvalue())
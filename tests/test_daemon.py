@@ -0,0 +1,108 @@
+import io
+import os
+import sys
+import tempfile
+import threading
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import patch
+from rsterm import run_entry_point
+from rsterm.daemon import DaemonServer, forward_command, stop_daemon
+from tests.test_async import CONFIG
+
+
+def fake_dispatch(config_path, args):
+    print(f"ran {' '.join(args)}")
+    print("warning", file=sys.stderr)
+    return 3
+
+
+class TestDaemon(TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp_dir.name)
+        self.config_path = self.root / "spam.yml"
+        self.config_path.write_text(CONFIG)
+        self.socket_path = self.root / "daemon.sock"
+
+        self.env = patch.dict('os.environ', {'RSTERM_CACHE_DIR': (self.root / "cache").as_posix()})
+        self.env.start()
+
+    def tearDown(self) -> None:
+        self.env.stop()
+        self.tmp_dir.cleanup()
+
+    def start_server(self, requests: int = 1) -> threading.Thread:
+        server = DaemonServer(self.config_path, self.socket_path)
+
+        def serve():
+            for _ in range(requests):
+                server.handle_request()
+            server.server_close()
+
+        thread = threading.Thread(target=serve)
+        thread.start()
+        return thread
+
+    def test_forward_command_streams_output_and_exit_code(self):
+        stdout, stderr = io.StringIO(), io.StringIO()
+
+        with patch('rsterm.daemon.server.dispatch', side_effect=fake_dispatch):
+            thread = self.start_server()
+            with patch.object(sys, 'stdout', stdout), patch.object(sys, 'stderr', stderr):
+                exit_code = forward_command(self.socket_path, ['run', 'spam', '--eggs'])
+            thread.join(5)
+
+        self.assertEqual(exit_code, 3)
+        self.assertEqual(stdout.getvalue(), "ran run spam --eggs\n")
+        self.assertEqual(stderr.getvalue(), "warning\n")
+
+    def test_no_daemon_returns_none(self):
+        self.assertIsNone(forward_command(self.socket_path, ['run', 'spam']))
+        self.assertFalse(stop_daemon(self.socket_path))
+
+    def test_stop(self):
+        server = DaemonServer(self.config_path, self.socket_path)
+        thread = threading.Thread(target=server.handle_request)
+        thread.start()
+        self.assertTrue(stop_daemon(self.socket_path))
+        thread.join(5)
+        server.server_close()
+        self.assertTrue(server.stopping)
+
+    def test_stale_socket_is_replaced(self):
+        self.socket_path.touch()
+        server = DaemonServer(self.config_path, self.socket_path)
+        server.server_close()
+
+    def test_socket_is_created_private(self):
+        umasks = []
+        server_bind = DaemonServer.server_bind
+
+        def record_umask(server):
+            umask = os.umask(0)
+            os.umask(umask)
+            umasks.append(umask)
+            server_bind(server)
+
+        umask = os.umask(0o022)
+        try:
+            with patch.object(DaemonServer, 'server_bind', record_umask):
+                server = DaemonServer(self.config_path, self.socket_path)
+            server.server_close()
+            self.assertEqual(os.umask(0o022), 0o022)
+        finally:
+            os.umask(umask)
+
+        self.assertEqual(umasks, [0o077])
+        self.assertEqual(self.socket_path.stat().st_mode & 0o777, 0o600)
+
+    def test_run_entry_point_falls_back_to_in_process(self):
+        with patch.object(sys, 'argv', ['spam', 'run', 'spam']), \
+                patch('rsterm.discovery.discovery.dispatch', return_value=0) as patched_dispatch:
+            with self.assertRaises(SystemExit) as exited:
+                run_entry_point(self.config_path)
+
+        patched_dispatch.assert_called_once_with(self.config_path, ['run', 'spam'])
+        self.assertEqual(exited.exception.code, 0)
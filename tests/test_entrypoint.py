@@ -0,0 +1,89 @@
+import io
+import os
+import tempfile
+import contextlib
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+from rsterm import EntryPoint
+from rsterm.entrypoint import Resource, DbConnection, S3Bucket, IamRole
+from rsterm.discovery import EntryPointManifest, dispatch
+from tests import FIXTURES_PATH
+from tests.test_async import CONFIG
+
+SPAM_CONFIG_PATH = FIXTURES_PATH / "spam.yml"
+
+
+class RunSpam(EntryPoint):
+    warehouse = DbConnection('redshift')
+    bucket = S3Bucket('blueshift')
+    role = IamRole('redshift')
+    events = Resource(lambda entry_point: [], close=lambda events: events.append('closed'))
+
+    def run(self) -> None:
+        self.warehouse.cursor()
+        raise ValueError("spam")
+
+
+class TestResources(TestCase):
+
+    def test_created_on_first_use(self):
+        with patch('psycopg2.connect') as connect:
+            entry_point = RunSpam(SPAM_CONFIG_PATH, args=[])
+            connect.assert_not_called()
+
+            self.assertIs(entry_point.warehouse, entry_point.warehouse)
+            connect.assert_called_once_with('beans-eggs-banana')
+
+        self.assertEqual(entry_point.bucket, 'this-value-is-direct-reference')
+        self.assertEqual(entry_point.role, os.environ['SPAM_ROLE'])
+
+    def test_close_resources(self):
+        with patch('psycopg2.connect') as connect, RunSpam(SPAM_CONFIG_PATH, args=[]) as entry_point:
+            events = entry_point.events
+            _ = entry_point.warehouse
+
+        self.assertEqual(events, ['closed'])
+        connect.return_value.close.assert_called_once_with()
+
+        # created again once closed
+        self.assertIsNot(entry_point.events, events)
+        entry_point.close_resources()
+        entry_point.close_resources()
+
+    def test_close_errors_raised_after_all_are_closed(self):
+        entry_point = RunSpam(SPAM_CONFIG_PATH, args=[])
+
+        with patch('psycopg2.connect') as connect:
+            connect.return_value.close.side_effect = OSError("gone")
+            events = entry_point.events
+            _ = entry_point.warehouse
+
+        self.assertRaises(OSError, entry_point.close_resources)
+        self.assertEqual(events, ['closed'])
+
+    def test_cmd_args_parsed_on_first_use(self):
+        stderr = io.StringIO()
+        with contextlib.redirect_stderr(stderr):
+            entry_point = RunSpam(SPAM_CONFIG_PATH, args=['--nope'])
+            self.assertEqual(stderr.getvalue(), '')
+
+            with self.assertRaises(SystemExit):
+                _ = entry_point.cmd_args
+        self.assertIn('unrecognized arguments: --nope', stderr.getvalue())
+
+    def test_dispatcher_closes_resources(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            config_path = Path(tmp_dir) / "spam.yml"
+            config_path.write_text(CONFIG + "  db_connections:\n    redshift: SPAM_DB_URL\n")
+            conn = MagicMock()
+
+            with patch.dict('os.environ', {'RSTERM_CACHE_DIR': tmp_dir}), \
+                    patch('psycopg2.connect', return_value=conn), \
+                    patch.object(EntryPointManifest, 'for_config') as patched_manifest:
+                patched_manifest.return_value.get_entry_point.return_value = RunSpam
+
+                with self.assertRaises(ValueError):
+                    dispatch(config_path, ['run', 'spam'])
+
+        conn.close.assert_called_once_with()
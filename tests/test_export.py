@@ -0,0 +1,128 @@
+import gzip
+import tempfile
+import psycopg2
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import MagicMock
+from rsterm.database import export_query, RollingFileWriter
+
+ROWS = [b"1,spam\n", b"2,eggs\n", b"3,beans\n", b"4,ham\n", b"5,toast\n"]
+
+
+def copy_expert(sql, writer):
+    writer.write(b"id,name\n")
+    for row in ROWS:
+        writer.write(row)
+
+
+def make_connection(copy_error: Exception = None) -> MagicMock:
+    conn = MagicMock()
+    cursor = conn.cursor.return_value.__enter__.return_value
+    cursor.copy_expert.side_effect = copy_error or copy_expert
+    cursor.description = [('id',), ('name',)]
+    cursor.__iter__.return_value = iter([(1, 'spam'), (2, 'eggs'), (3, 'beans')])
+    return conn
+
+
+class TestRollingFileWriter(TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.output_dir = Path(self.tmp_dir.name)
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_roll_on_rows_repeats_header(self):
+        with RollingFileWriter(self.output_dir, 'spam', max_rows=2) as writer:
+            copy_expert('', writer)
+
+        self.assertEqual([p.name for p in writer.files], ['spam_00000.csv', 'spam_00001.csv', 'spam_00002.csv'])
+        self.assertEqual(writer.files[1].read_bytes(), b"id,name\n3,beans\n4,ham\n")
+        self.assertEqual(writer.rows, 5)
+
+    def test_roll_on_bytes(self):
+        with RollingFileWriter(self.output_dir, 'spam', max_bytes=10) as writer:
+            copy_expert('', writer)
+        self.assertEqual(len(writer.files), 3)
+
+    def test_gzip(self):
+        with RollingFileWriter(self.output_dir, 'spam', compression='gzip') as writer:
+            copy_expert('', writer)
+
+        self.assertEqual(writer.files[0].name, 'spam_00000.csv.gz')
+        with gzip.open(writer.files[0].as_posix()) as file:
+            self.assertEqual(file.read(), b"id,name\n" + b"".join(ROWS))
+
+    def test_empty_result_has_header(self):
+        with RollingFileWriter(self.output_dir, 'spam') as writer:
+            writer.write(b"id,name\n")
+        self.assertEqual(writer.files[0].read_bytes(), b"id,name\n")
+
+    def test_invalid_compression(self):
+        self.assertRaises(ValueError, RollingFileWriter, self.output_dir, 'spam', compression='rar')
+
+
+class TestExportQuery(TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.output_dir = Path(self.tmp_dir.name)
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_copy_export(self):
+        conn = make_connection()
+        result = export_query(conn, "select * from spam;", self.output_dir, max_rows=3)
+
+        copy_sql = conn.cursor.return_value.__enter__.return_value.copy_expert.call_args[0][0]
+        self.assertEqual(copy_sql, "COPY (select * from spam) TO STDOUT WITH CSV HEADER")
+        self.assertEqual(result.method, 'copy')
+        self.assertEqual(result.rows, 5)
+        self.assertEqual(len(result.files), 2)
+        self.assertGreater(result.rows_per_second, 0)
+
+    def test_falls_back_to_cursor(self):
+        conn = make_connection(copy_error=psycopg2.NotSupportedError("COPY TO STDOUT is not supported"))
+        result = export_query(conn, "select * from spam", self.output_dir)
+
+        conn.rollback.assert_called_once()
+        self.assertEqual(result.method, 'cursor')
+        self.assertEqual(result.files[0].read_text(), "id,name\n1,spam\n2,eggs\n3,beans\n")
+
+    def test_copy_only_raises(self):
+        conn = make_connection(copy_error=psycopg2.NotSupportedError("COPY TO STDOUT is not supported"))
+        self.assertRaises(psycopg2.NotSupportedError, export_query, conn, "select 1", self.output_dir, method='copy')
+
+    def test_copy_failing_part_way_is_not_run_again(self):
+        def copy_part(sql, writer):
+            copy_expert(sql, writer)
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+
+        conn = make_connection()
+        cursor = conn.cursor.return_value.__enter__.return_value
+        cursor.copy_expert.side_effect = copy_part
+        rolled = []
+
+        with self.assertRaises(psycopg2.OperationalError):
+            export_query(conn, "select * from spam", self.output_dir, max_rows=2,
+                         on_roll=lambda path, rows: rolled.append(path))
+
+        self.assertEqual(len(rolled), 2)
+        cursor.execute.assert_not_called()
+        conn.rollback.assert_not_called()
+        self.assertEqual(list(self.output_dir.iterdir()), [])
+
+    def test_cursor_failing_part_way_removes_files(self):
+        def rows():
+            yield 1, 'spam'
+            yield 2, 'eggs'
+            raise RuntimeError("out of memory")
+
+        conn = make_connection()
+        conn.cursor.return_value.__enter__.return_value.__iter__.return_value = rows()
+
+        with self.assertRaisesRegex(RuntimeError, 'out of memory'):
+            export_query(conn, "select * from spam", self.output_dir, method='cursor', max_rows=1)
+        self.assertEqual(list(self.output_dir.iterdir()), [])
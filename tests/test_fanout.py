@@ -0,0 +1,116 @@
+import io
+import sys
+import json
+import tempfile
+import threading
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import patch
+from rsterm import EntryPoint
+from rsterm.configs import RsTermConfig
+from rsterm.discovery import EntryPointManifest
+from rsterm.discovery.fanout import match_targets, run_fanout, run_fanout_option
+from rsterm.entrypoint import DbConnection
+from rsterm.scheduler import SUCCESS, FAILED
+
+CONFIG = """
+rsterm:
+  app:
+    name: spam
+  entrypoint_paths:
+    - entrypoints
+  terminal:
+    verbs:
+      - run
+    nouns:
+      - spam
+    metrics_file: false
+  db_connections:
+    cluster_eu: postgresql://eu/warehouse
+    cluster_us: postgresql://us/warehouse
+    cluster_bad: postgresql://bad/warehouse
+    reporting: postgresql://reporting/warehouse
+"""
+
+
+class RunSpam(EntryPoint):
+    warehouse = DbConnection()
+    barrier = None
+
+    def run(self) -> None:
+        if self.barrier is not None:
+            # every target waits for the others, so this only passes when they run at once
+            self.barrier.wait(timeout=5)
+
+        print(f"connected to {self.warehouse}")
+        if self.db_target == 'cluster_bad':
+            raise RuntimeError('cluster is down')
+
+
+class FakeConnection(str):
+
+    def close(self) -> None:
+        pass
+
+
+class TestFanout(TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.config_path = Path(self.tmp_dir.name) / 'spam.yml'
+        self.config_path.write_text(CONFIG)
+        self.patches = [patch.dict('os.environ', {'RSTERM_CACHE_DIR': self.tmp_dir.name}),
+                        patch.object(EntryPointManifest, 'get_entry_point', return_value=RunSpam),
+                        patch.object(RsTermConfig, 'get_db_connection',
+                                     lambda config, name: FakeConnection(config.get_connection_string(name)))]
+        for patcher in self.patches:
+            patcher.start()
+
+    def tearDown(self) -> None:
+        for patcher in self.patches:
+            patcher.stop()
+        RunSpam.barrier = None
+        self.tmp_dir.cleanup()
+
+    def test_match_targets(self):
+        config = RsTermConfig.load(self.config_path)
+
+        self.assertEqual(match_targets(config, ['cluster_*']), ['cluster_eu', 'cluster_us', 'cluster_bad'])
+        self.assertEqual(match_targets(config, ['reporting', 'cluster_us']), ['cluster_us', 'reporting'])
+        self.assertRaises(KeyError, match_targets, config, ['staging_*'])
+
+    def test_targets_run_concurrently(self):
+        RunSpam.barrier = threading.Barrier(2)
+
+        with patch.object(sys, 'stdout', io.StringIO()) as stdout:
+            results = run_fanout(self.config_path, ['run', 'spam'], ['cluster_eu', 'cluster_us'], jobs=2)
+
+        self.assertEqual([result.result.name for result in results], ['cluster_eu', 'cluster_us'])
+        self.assertTrue(all(result.result.status == SUCCESS for result in results))
+        self.assertEqual(results[1].stdout, 'connected to postgresql://us/warehouse\n')
+        self.assertIn('==> [success] cluster_eu', stdout.getvalue())
+
+    def test_failures_are_isolated(self):
+        report_path = Path(self.tmp_dir.name) / 'report.json'
+
+        with patch.object(sys, 'stdout', io.StringIO()) as stdout, patch.object(sys, 'stderr', io.StringIO()):
+            exit_code = run_fanout_option(self.config_path, ['cluster_*', '--jobs', '2', '--report',
+                                                             report_path.as_posix(), 'run', 'spam'])
+
+        self.assertEqual(exit_code, 1)
+        report = {entry['target']: entry for entry in json.loads(report_path.read_text())}
+        self.assertEqual(report['cluster_bad']['status'], FAILED)
+        self.assertIn('RuntimeError: cluster is down', report['cluster_bad']['stderr'])
+        self.assertEqual(report['cluster_eu']['status'], SUCCESS)
+        self.assertEqual(report['cluster_us']['exit_code'], 0)
+        self.assertIn('2 of 3 targets succeeded', stdout.getvalue())
+        self.assertIn('failed: cluster_bad', stdout.getvalue())
+
+    def test_invalid_patterns(self):
+        with patch.object(sys, 'stderr', io.StringIO()), self.assertRaises(SystemExit):
+            run_fanout_option(self.config_path, ['staging_*', 'run', 'spam'])
+
+    def test_db_connection_needs_a_target(self):
+        entry_point = RunSpam(self.config_path)
+        with self.assertRaises(ValueError):
+            entry_point.warehouse
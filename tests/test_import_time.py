@@ -0,0 +1,43 @@
+import os
+import sys
+import subprocess
+from typing import Dict
+from unittest import TestCase
+from tests import FIXTURES_PATH
+
+PROJECT_ROOT = FIXTURES_PATH.parent.parent
+
+# cumulative time allowed for "import rsterm", can be raised on slow machines with RSTERM_IMPORT_BUDGET_MS
+IMPORT_BUDGET_MS = float(os.environ.get('RSTERM_IMPORT_BUDGET_MS', 150))
+
+# heavy dependencies which must only be imported when they are used
+DEFERRED_MODULES = ['psycopg2', 'yaml', 'dotenv']
+
+
+def import_times(statement: str) -> Dict[str, int]:
+    """
+    Run a statement in a fresh interpreter with -X importtime.
+    Returns: Dict[str, int] module name -> cumulative import time in microseconds
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement],
+                            cwd=PROJECT_ROOT.as_posix(), stderr=subprocess.PIPE, check=True)
+    times = {}
+    for line in result.stderr.decode().splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+class TestImportTime(TestCase):
+
+    def test_heavy_dependencies_are_deferred(self):
+        imported = import_times('import rsterm')
+        for module in DEFERRED_MODULES:
+            self.assertNotIn(module, imported, f"{module} is imported by 'import rsterm'")
+
+    def test_import_budget(self):
+        # best of three, to keep the noise of a busy machine out of the measurement
+        best = min(import_times('import rsterm')['rsterm'] for _ in range(3))
+        self.assertLess(best / 1000, IMPORT_BUDGET_MS, f"import rsterm took {best / 1000:.1f}ms")
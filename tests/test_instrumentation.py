@@ -0,0 +1,291 @@
+import io
+import sys
+import json
+import socket
+import tempfile
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+from rsterm.configs import RsTermConfig
+from rsterm.database import instrumentation
+from rsterm.database.instrumentation import InstrumentedConnection, InstrumentedCursor, PrometheusExporter, \
+    QueryRecorder, StatsdExporter, format_summary, normalize_statement
+from rsterm.profiler import bind_command, command_scope
+
+CONFIG = """
+rsterm:
+  app:
+    name: spam
+  entrypoint_paths:
+    - entrypoints
+  terminal:
+    verbs:
+      - run
+    nouns:
+      - spam
+  db_connections:
+    warehouse: postgresql://localhost/warehouse
+    other: postgresql://localhost/other
+  instrumentation:
+    enabled: true
+    connections: [warehouse]
+    slow_query_ms: 0
+    slow_query_log: {slow_log}
+    statsd:
+      host: 127.0.0.1
+      port: {port}
+      prefix: spam
+"""
+
+
+def make_cursor(rowcount: int = 3, name: str = None) -> MagicMock:
+    cursor = MagicMock()
+    cursor.rowcount = rowcount
+    cursor.name = name
+    cursor.fetchmany.return_value = [(1,), (2,)]
+    return cursor
+
+
+class TestNormalizeStatement(TestCase):
+
+    def test_literals_and_whitespace(self):
+        self.assertEqual(normalize_statement("select *\n  from orders2 -- recent\nwhere id = 42 and name = 'it''s';"),
+                         "select * from orders2 where id = ? and name = ?")
+
+
+class TestQueryRecorder(TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.slow_log = Path(self.tmp_dir.name) / 'slow.jsonl'
+        self.recorder = QueryRecorder(slow_seconds=1.0, slow_log_path=self.slow_log, print_summary=True)
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_record_and_summary(self):
+        self.recorder.record('warehouse', 'select * from spam where id = 1', 0.5, 1)
+        self.recorder.record('warehouse', 'select * from spam where id = 2', 1.5, 1)
+        self.recorder.record('warehouse', 'delete from eggs', 0.1, -1, failed=True)
+
+        with patch.object(sys, 'stderr', io.StringIO()) as stderr:
+            stats = self.recorder.finish_command('run_spam')
+
+        totals = stats[('warehouse', 'select * from spam where id = ?')]
+        self.assertEqual((totals.count, totals.rows, totals.slow, totals.max_seconds), (2, 2, 1, 1.5))
+        self.assertEqual(stats[('warehouse', 'delete from eggs')].errors, 1)
+        self.assertEqual(self.recorder.stats, {})
+
+        summary = stderr.getvalue()
+        self.assertTrue(summary.startswith('run_spam: 3 statement(s) in 2.100s, 1 slow (over 1000ms)'))
+        self.assertLess(summary.index('from spam'), summary.index('from eggs'))
+
+        slow = [json.loads(line) for line in self.slow_log.read_text().splitlines()]
+        self.assertEqual(len(slow), 1)
+        self.assertEqual(slow[0]['seconds'], 1.5)
+        self.assertEqual(slow[0]['connection'], 'warehouse')
+
+    def test_summary_limit(self):
+        for index in range(12):
+            self.recorder.record('warehouse', f"select * from table_{chr(97 + index)}", 0.01, 0)
+        self.assertIn('... and 2 more statement(s)', format_summary('run_spam', self.recorder.stats))
+
+    def test_commands_at_once_are_totalled_apart(self):
+        recorder = QueryRecorder(slow_seconds=None, print_summary=False)
+        both_recorded = threading.Barrier(2)
+
+        def run(command: str, table: str, count: int):
+            with command_scope(command):
+                for _ in range(count):
+                    recorder.record('warehouse', f"select * from {table}", 0.01, 1)
+                both_recorded.wait(5)
+                return recorder.finish_command(command)
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            spam = executor.submit(run, 'run_spam', 'spam', 3)
+            eggs = executor.submit(run, 'run_eggs', 'eggs', 2)
+
+        self.assertEqual({key: totals.count for key, totals in spam.result().items()},
+                         {('warehouse', 'select * from spam'): 3})
+        self.assertEqual({key: totals.count for key, totals in eggs.result().items()},
+                         {('warehouse', 'select * from eggs'): 2})
+        self.assertEqual(recorder.stats, {})
+
+    def test_worker_threads_record_in_the_command(self):
+        recorder = QueryRecorder(slow_seconds=None, print_summary=False)
+
+        with command_scope('run_spam'):
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                list(executor.map(bind_command(lambda table: recorder.record('warehouse', f"select {table}", 0.01, 1)),
+                                  ['a', 'b']))
+            stats = recorder.finish_command('run_spam')
+
+        self.assertEqual(sorted(statement for _, statement in stats), ['select a', 'select b'])
+
+
+class TestInstrumentedCursor(TestCase):
+
+    def setUp(self) -> None:
+        self.recorder = QueryRecorder(slow_seconds=None)
+
+    def test_execute(self):
+        conn = MagicMock()
+        conn.cursor.return_value = make_cursor()
+        instrumented = InstrumentedConnection(conn, 'warehouse', self.recorder)
+        instrumented.autocommit = True
+
+        with instrumented.cursor() as cursor:
+            cursor.execute('update spam set eggs = %s', (1,))
+            cursor.itersize = 10
+
+        self.assertTrue(conn.autocommit)
+        self.assertEqual(conn.cursor.return_value.itersize, 10)
+        conn.cursor.return_value.execute.assert_called_once_with('update spam set eggs = %s', (1,))
+        totals = self.recorder.stats[('warehouse', 'update spam set eggs = %s')]
+        self.assertEqual((totals.count, totals.rows), (1, 3))
+
+    def test_failed_statement(self):
+        raw = make_cursor(rowcount=-1)
+        raw.execute.side_effect = ValueError('broken')
+        cursor = InstrumentedCursor(raw, 'warehouse', self.recorder)
+
+        self.assertRaises(ValueError, cursor.execute, 'select 1')
+        self.assertEqual(self.recorder.stats[('warehouse', 'select ?')].errors, 1)
+
+    def test_named_cursor_fetches(self):
+        cursor = InstrumentedCursor(make_cursor(rowcount=-1, name='batches'), 'warehouse', self.recorder)
+        cursor.execute('select id from spam')
+        self.assertEqual(cursor.fetchmany(2), [(1,), (2,)])
+
+        totals = self.recorder.stats[('warehouse', 'select id from spam')]
+        self.assertEqual((totals.count, totals.rows), (2, 2))
+
+    def test_client_cursor_fetches_are_not_recorded(self):
+        cursor = InstrumentedCursor(make_cursor(), 'warehouse', self.recorder)
+        cursor.fetchmany(2)
+        self.assertEqual(self.recorder.stats, {})
+
+
+class TestExporters(TestCase):
+
+    def test_statsd(self):
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as listener:
+            listener.bind(('127.0.0.1', 0))
+            listener.settimeout(5)
+            exporter = StatsdExporter('127.0.0.1', listener.getsockname()[1], 'spam')
+            self.addCleanup(exporter.close)
+            recorder = QueryRecorder(slow_seconds=None, print_summary=False, exporters=[exporter])
+            recorder.record('ware house', 'select 1', 0.25, 1)
+            recorder.finish_command('run_spam')
+
+            lines = listener.recv(65536).decode().splitlines()
+
+        self.assertEqual(lines, ['spam.query.ware_house:250.000|ms', 'spam.command.run_spam.queries:1|c',
+                                 'spam.command.run_spam.slow_queries:0|c'])
+
+    def test_statsd_packets(self):
+        exporter = StatsdExporter(max_packet=40)
+        self.addCleanup(exporter.close)
+        with patch.object(exporter, '_send', wraps=exporter._send) as send:
+            for _ in range(4):
+                exporter.add('spam.query.warehouse:1.000|ms')
+        self.assertEqual(send.call_count, 3)
+
+    def test_statsd_close(self):
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as listener:
+            listener.bind(('127.0.0.1', 0))
+            listener.settimeout(5)
+            exporter = StatsdExporter('127.0.0.1', listener.getsockname()[1], 'spam')
+            exporter.add('spam.query.warehouse:1.000|ms')
+            exporter.flush()
+            exporter.add('spam.query.warehouse:2.000|ms')
+            sock = exporter._socket
+
+            QueryRecorder(exporters=[exporter]).close()
+
+            self.assertEqual(listener.recv(65536), b'spam.query.warehouse:1.000|ms')
+            self.assertEqual(listener.recv(65536), b'spam.query.warehouse:2.000|ms')
+        self.assertIsNone(exporter._socket)
+        self.assertEqual(sock.fileno(), -1)
+
+    def test_prometheus(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / 'spam.prom'
+            recorder = QueryRecorder(slow_seconds=1.0, print_summary=False, exporters=[PrometheusExporter(path, 'spam')])
+
+            for _ in range(2):
+                recorder.record('warehouse', 'select 1', 2.0, 5)
+                recorder.record('warehouse', 'select 2', 0.5, 1)
+                recorder.finish_command('run_spam')
+
+            content = path.read_text()
+
+        labels = 'app="spam",command="run_spam",connection="warehouse"'
+        self.assertIn('# TYPE rsterm_queries_total counter', content)
+        self.assertIn(f'rsterm_queries_total{{{labels}}} 4', content)
+        self.assertIn(f'rsterm_query_seconds_total{{{labels}}} 5', content)
+        self.assertIn(f'rsterm_query_rows_total{{{labels}}} 12', content)
+        self.assertIn(f'rsterm_slow_queries_total{{{labels}}} 2', content)
+
+    def test_prometheus_counters_keep_precision(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / 'spam.prom'
+            recorder = QueryRecorder(slow_seconds=None, print_summary=False, exporters=[PrometheusExporter(path, 'spam')])
+
+            for _ in range(3):
+                recorder.record('warehouse', 'insert into spam select 1', 0.1, 1234567)
+                recorder.finish_command('run_spam')
+
+            counters = {name: value for (name, _), value in PrometheusExporter(path, 'spam').read_counters().items()}
+
+        self.assertEqual(counters['rsterm_query_rows_total'], 3703701)
+        self.assertIsInstance(counters['rsterm_query_rows_total'], int)
+        self.assertEqual(counters['rsterm_query_seconds_total'], 0.1 + 0.1 + 0.1)
+
+    def test_prometheus_write_errors_do_not_raise(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            blocker = Path(tmp_dir) / 'not_a_dir'
+            blocker.write_text('')
+            recorder = QueryRecorder(slow_seconds=None, print_summary=False,
+                                     exporters=[PrometheusExporter(blocker / 'spam.prom', 'spam')])
+            recorder.record('warehouse', 'select 1', 0.1, 1)
+
+            with patch.object(sys, 'stderr', io.StringIO()) as stderr:
+                recorder.finish_command('run_spam')
+
+        self.assertIn('could not write the prometheus textfile', stderr.getvalue())
+
+
+class TestConfiguredInstrumentation(TestCase):
+
+    def tearDown(self) -> None:
+        RsTermConfig.close_instrumentation()
+
+    def test_get_db_connection(self):
+        with tempfile.TemporaryDirectory() as tmp_dir, \
+                socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as listener:
+            listener.bind(('127.0.0.1', 0))
+            listener.settimeout(5)
+            slow_log = Path(tmp_dir) / 'slow.jsonl'
+            config_path = Path(tmp_dir) / 'spam.yml'
+            config_path.write_text(CONFIG.format(slow_log=slow_log, port=listener.getsockname()[1]))
+            config = RsTermConfig.load(config_path)
+
+            with patch('psycopg2.connect') as connect:
+                connect.return_value.cursor.return_value = make_cursor()
+                conn = config.get_db_connection('warehouse')
+                self.assertIsInstance(conn, InstrumentedConnection)
+                self.assertNotIsInstance(config.get_db_connection('other'), InstrumentedConnection)
+
+                conn.cursor().execute('select 1')
+                conn.close()
+                connect.return_value.close.assert_called_once_with()
+
+            with patch.object(sys, 'stderr', io.StringIO()) as stderr:
+                instrumentation.finish_command('run_spam')
+
+            self.assertEqual(len(slow_log.read_text().splitlines()), 1)
+            self.assertIn('spam.query.warehouse', listener.recv(65536).decode())
+            self.assertIn('run_spam: 1 statement(s)', stderr.getvalue())
@@ -0,0 +1,148 @@
+import os
+import sys
+import tempfile
+import threading
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import patch
+from rsterm.configs import RsTermConfig
+from rsterm.discovery import EntryPointManifest
+
+ENTRY_POINT_MODULE = """
+from rsterm import EntryPoint
+
+
+class {class_name}(EntryPoint):
+
+    def run(self) -> None:
+        print("{class_name}")
+"""
+
+
+class TestEntryPointManifest(TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp_dir.name)
+        self.app_name = f"manifest_app_{id(self)}"
+        self.entry_path = self.root / "src" / self.app_name / "entrypoints"
+        self.entry_path.mkdir(parents=True)
+        (self.entry_path.parent / "__init__.py").touch()
+        (self.entry_path / "__init__.py").touch()
+        self.write_module('spam', 'RunSpam')
+        self.write_module('eggs', 'RunEggs')
+
+        sys.path.insert(0, (self.root / "src").as_posix())
+        self.env = patch.dict(os.environ, {'RSTERM_CACHE_DIR': (self.root / "cache").as_posix()})
+        self.env.start()
+
+        self.config = RsTermConfig(app={'name': self.app_name, 'is_pip_package': True},
+                                   entrypoint_paths=['entrypoints'],
+                                   terminal={'verbs': ['run'], 'nouns': ['spam', 'eggs']})
+
+    def tearDown(self) -> None:
+        self.env.stop()
+        sys.path.remove((self.root / "src").as_posix())
+        for name in list(sys.modules):
+            if name.startswith(self.app_name):
+                del sys.modules[name]
+        self.tmp_dir.cleanup()
+
+    def write_module(self, name: str, class_name: str) -> None:
+        (self.entry_path / f"{name}.py").write_text(ENTRY_POINT_MODULE.format(class_name=class_name))
+
+    def test_manifest_maps_keys_to_modules(self):
+        manifest = EntryPointManifest.for_config(self.config)
+        self.assertEqual(manifest.entries['run_spam'], {'module': f"{self.app_name}.entrypoints.spam", 'class': 'RunSpam'})
+        self.assertEqual(manifest.entries['run_eggs'], {'module': f"{self.app_name}.entrypoints.eggs", 'class': 'RunEggs'})
+        self.assertTrue((self.config.cache_dir / "manifest.json").exists())
+
+    def test_dispatch_imports_only_target_module(self):
+        EntryPointManifest.for_config(self.config)
+        for name in list(sys.modules):
+            if name.startswith(f"{self.app_name}.entrypoints."):
+                del sys.modules[name]
+
+        with patch.object(EntryPointManifest, 'import_entry_points') as patched_import:
+            entry_point = EntryPointManifest.for_config(self.config).get_entry_point('run_spam')
+            patched_import.assert_not_called()
+
+        self.assertEqual(entry_point.__name__, 'RunSpam')
+        self.assertIn(f"{self.app_name}.entrypoints.spam", sys.modules)
+        self.assertNotIn(f"{self.app_name}.entrypoints.eggs", sys.modules)
+
+    def test_changed_module_is_reimported(self):
+        EntryPointManifest.for_config(self.config)
+        self.write_module('eggs', 'NewEggs')
+        os.utime(self.entry_path / "eggs.py", ns=(0, 0))
+
+        manifest = EntryPointManifest.for_config(self.config)
+        self.assertNotIn('run_eggs', manifest.entries)
+        self.assertEqual(manifest.entries['new_eggs']['class'], 'NewEggs')
+        self.assertEqual(manifest.get_entry_point('new_eggs').__name__, 'NewEggs')
+
+    def test_touched_module_is_not_reimported(self):
+        EntryPointManifest.for_config(self.config)
+        os.utime(self.entry_path / "spam.py", ns=(0, 0))
+
+        with patch.object(EntryPointManifest, 'import_entry_points') as patched_import:
+            manifest = EntryPointManifest.for_config(self.config)
+            patched_import.assert_not_called()
+        self.assertIn('run_spam', manifest.entries)
+
+    def test_changed_dependency_reimports_entry_points(self):
+        (self.entry_path.parent / "helpers.py").write_text("NAME = 'RunSpam'\n")
+        (self.entry_path / "spam.py").write_text(
+            "from rsterm import EntryPoint\n"
+            f"from {self.app_name} import helpers\n\n\n"
+            "class RunSpam(EntryPoint):\n"
+            "    run = lambda self: None\n\n\n"
+            "if helpers.NAME == 'RunHam':\n"
+            "    class RunHam(RunSpam):\n"
+            "        pass\n")
+        manifest = EntryPointManifest.for_config(self.config)
+        self.assertNotIn('run_ham', manifest.entries)
+        self.assertIn(f"{self.app_name}.helpers", {record['module'] for record in manifest.dependencies.values()})
+
+        (self.entry_path.parent / "helpers.py").write_text("NAME = 'RunHam'\n")
+        manifest = EntryPointManifest.for_config(self.config)
+        self.assertIn('run_ham', manifest.entries)
+        self.assertIn('run_eggs', manifest.entries)
+
+    def test_removed_module_is_dropped(self):
+        EntryPointManifest.for_config(self.config)
+        (self.entry_path / "eggs.py").unlink()
+        manifest = EntryPointManifest.for_config(self.config)
+        self.assertNotIn('run_eggs', manifest.entries)
+        self.assertIsNone(manifest.get_entry_point('run_eggs'))
+
+    def test_corrupt_manifest_is_rebuilt(self):
+        manifest_path = self.config.cache_dir / "manifest.json"
+        manifest_path.parent.mkdir(parents=True)
+        manifest_path.write_text("{not json")
+        manifest = EntryPointManifest.for_config(self.config)
+        self.assertIn('run_spam', manifest.entries)
+
+    def test_concurrent_saves_use_their_own_temp_files(self):
+        manifest = EntryPointManifest.for_config(self.config)
+        tmp_paths = []
+        replace = Path.replace
+
+        def record_replace(path: Path, target: Path) -> Path:
+            tmp_paths.append(path.name)
+            return replace(path, target)
+
+        def save() -> None:
+            manifest.changed = True
+            manifest.save()
+
+        with patch.object(Path, 'replace', record_replace):
+            save()
+            thread = threading.Thread(target=save)
+            thread.start()
+            thread.join()
+
+        self.assertEqual(len(set(tmp_paths)), 4)
+        self.assertTrue(all(f".{os.getpid()}." in name for name in tmp_paths))
+        self.assertEqual(list(self.config.cache_dir.glob('*.tmp')), [])
+        self.assertEqual(EntryPointManifest.for_config(self.config).entries, manifest.entries)
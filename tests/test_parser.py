@@ -0,0 +1,199 @@
+import io
+import os
+import sys
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import patch
+from rsterm.configs import RsTermConfig
+from rsterm.discovery import EntryPointManifest, dispatch, get_command_parser
+from rsterm.discovery.manifest import iter_modules
+from rsterm.discovery.parser import ImportedCallable, serialize_args, deserialize_args
+
+HELPER_MODULE = """
+def upper(value):
+    return value.upper()
+"""
+
+ENTRY_POINT_MODULE = """
+from rsterm import EntryPoint
+from APP_NAME.helpers import upper
+
+
+class RunSpam(EntryPoint):
+    \"\"\"
+    Print some spam.
+    \"\"\"
+
+    entry_point_args = {
+        ('--count', '-c'): {'type': int, 'default': 1},
+        ('--name',): {'type': upper, 'default': 'spam'},
+        ('--pair',): {'nargs': 2, 'metavar': ('KEY', 'VALUE')}
+    }
+
+    def run(self) -> None:
+        print(self.cmd_args.name * self.cmd_args.count)
+
+
+class RunEggs(EntryPoint):
+    entry_point_args = {('--eggs',): {'type': lambda value: value[::-1]}}
+
+    def run(self) -> None:
+        print(self.cmd_args.eggs)
+"""
+
+CONFIG = """rsterm:
+  app:
+    name: {name}
+    is_pip_package: true
+  entrypoint_paths:
+    - entrypoints
+  terminal:
+    verbs:
+      - run
+      - make
+    nouns:
+      - spam
+      - eggs
+"""
+
+
+def upper(value):
+    return value.upper()
+
+
+class TestArgsSerialization(TestCase):
+
+    def test_round_trip(self):
+        args_config = {('--count', '-c'): {'type': int, 'choices': [1, 2], 'metavar': ('A', 'B')},
+                       ('--name',): {'type': upper}}
+        spec = serialize_args(args_config)
+
+        self.assertEqual(spec[1][1]['type'], {'__callable__': f"{__name__}:upper"})
+        self.assertEqual(deserialize_args(spec), args_config)
+
+    def test_unimported_callable_is_imported_when_called(self):
+        imported = ImportedCallable('os.path:basename')
+        self.assertEqual(imported.__name__, 'basename')
+        self.assertEqual(imported('/spam/eggs'), 'eggs')
+
+    def test_lambda_can_not_be_serialized(self):
+        self.assertIsNone(serialize_args({('--eggs',): {'type': lambda value: value}}))
+
+
+class TestCommandParser(TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp_dir.name)
+        self.app_name = f"parser_app_{id(self)}"
+        entry_path = self.root / self.app_name / "entrypoints"
+        entry_path.mkdir(parents=True)
+        (entry_path.parent / "__init__.py").touch()
+        (entry_path / "__init__.py").touch()
+        (entry_path.parent / "helpers.py").write_text(HELPER_MODULE)
+        (entry_path / "spam.py").write_text(ENTRY_POINT_MODULE.replace("APP_NAME", self.app_name))
+        self.config_path = self.root / self.app_name / "config.yml"
+        self.config_path.write_text(CONFIG.format(name=self.app_name))
+
+        sys.path.insert(0, self.root.as_posix())
+        self.env = patch.dict(os.environ, {'RSTERM_CACHE_DIR': (self.root / "cache").as_posix()})
+        self.env.start()
+
+        self.config = RsTermConfig.load(self.config_path)
+        EntryPointManifest.for_config(self.config)
+        self.forget_modules()
+
+    def tearDown(self) -> None:
+        self.env.stop()
+        sys.path.remove(self.root.as_posix())
+        self.forget_modules()
+        self.tmp_dir.cleanup()
+
+    def forget_modules(self) -> None:
+        for name in list(sys.modules):
+            if name.startswith(f"{self.app_name}."):
+                del sys.modules[name]
+
+    @property
+    def module_name(self) -> str:
+        return f"{self.app_name}.entrypoints.spam"
+
+    def get_parser(self):
+        return get_command_parser(self.config, EntryPointManifest.for_config(self.config))
+
+    def test_parse_without_importing(self):
+        key, cmd_args = self.get_parser().parse(['run', 'spam', '-c', '3', '--name', 'ham', '--pair', 'a', 'b'])
+
+        self.assertEqual(key, 'run_spam')
+        self.assertEqual(cmd_args.count, 3)
+        self.assertEqual(cmd_args.pair, ['a', 'b'])
+        self.assertEqual(cmd_args.name, 'HAM')
+        # only the module of the custom type was imported, to call it
+        self.assertIn(f"{self.app_name}.helpers", sys.modules)
+        self.assertNotIn(self.module_name, sys.modules)
+
+    def test_help_without_importing(self):
+        stdout = io.StringIO()
+
+        with patch.object(sys, 'stdout', stdout), self.assertRaises(SystemExit) as exited:
+            self.get_parser().parse(['run', 'spam', '--help'])
+
+        self.assertEqual(exited.exception.code, 0)
+        self.assertIn('--pair KEY VALUE', stdout.getvalue())
+        self.assertIn('Print some spam.', stdout.getvalue())
+        self.assertNotIn(self.module_name, sys.modules)
+
+    def test_verb_help_lists_implemented_nouns(self):
+        stdout = io.StringIO()
+
+        with patch.object(sys, 'stdout', stdout), self.assertRaises(SystemExit):
+            self.get_parser().parse(['run', '--help'])
+
+        self.assertIn('spam', stdout.getvalue())
+        self.assertIn('eggs', stdout.getvalue())
+
+    def test_unserializable_args_import_the_entry_point(self):
+        key, cmd_args = self.get_parser().parse(['run', 'eggs', '--eggs', 'abc'])
+        self.assertEqual(cmd_args.eggs, 'cba')
+        self.assertIn(self.module_name, sys.modules)
+
+    def test_invalid_commands(self):
+        parser = self.get_parser()
+
+        with patch.object(sys, 'stderr', io.StringIO()):
+            for args in [['walk', 'spam'], ['run'], ['run', 'spam', '--bad']]:
+                with self.assertRaises(SystemExit) as exited:
+                    parser.parse(args)
+                self.assertEqual(exited.exception.code, 2)
+
+    def test_not_implemented_command_is_accepted(self):
+        key, _ = self.get_parser().parse(['make', 'spam', '--anything'])
+        self.assertEqual(key, 'make_spam')
+
+    def test_parser_is_built_once(self):
+        self.assertIs(self.get_parser(), self.get_parser())
+
+    def test_dispatch(self):
+        stdout = io.StringIO()
+
+        with patch.object(sys, 'stdout', stdout):
+            self.assertEqual(dispatch(self.config_path, ['run', 'spam', '-c', '2']), 0)
+            self.assertEqual(dispatch(self.config_path, ['make', 'eggs']), 1)
+
+        self.assertEqual(stdout.getvalue(), "SPAMSPAM\ninvalid command. Not yet implemented, try again.\n")
+
+
+class TestIterModules(TestCase):
+
+    def test_iter_modules(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            root = Path(tmp_dir)
+            (root / "package").mkdir()
+            (root / "package" / "__init__.py").touch()
+            (root / "not_a_package").mkdir()
+            (root / "module.py").touch()
+            (root / "__init__.py").touch()
+            (root / "notes.txt").touch()
+
+            self.assertEqual(iter_modules(tmp_dir), [('module', False), ('package', True)])
@@ -0,0 +1,186 @@
+import io
+import os
+import sys
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import patch
+from rsterm.configs import RsTermConfig
+from rsterm.discovery.pipeline import PipelineRunner, read_pipeline, run_pipeline_option
+from rsterm.exceptions import GraphError
+from rsterm.scheduler import SUCCESS, FAILED, SKIPPED
+
+ENTRY_POINT_MODULE = """
+import os
+from pathlib import Path
+from rsterm import EntryPoint
+
+
+class RunStep(EntryPoint):
+    entry_point_args = {
+        ('name',): {},
+        ('--fail-times',): {'type': int, 'default': 0}
+    }
+
+    def run(self) -> None:
+        marker = Path(os.environ['PIPELINE_DIR']) / self.cmd_args.name
+        attempts = len(marker.read_text()) if marker.exists() else 0
+        marker.write_text('x' * (attempts + 1))
+        print(f"step {self.cmd_args.name} in {os.getpid()}")
+
+        if attempts < self.cmd_args.fail_times:
+            raise RuntimeError(f"{self.cmd_args.name} failed")
+"""
+
+CONFIG = """rsterm:
+  app:
+    name: {name}
+    is_pip_package: true
+  entrypoint_paths:
+    - entrypoints
+  terminal:
+    verbs:
+      - run
+    nouns:
+      - step
+
+  pipelines:
+    nightly:
+      jobs: 2
+      steps:
+        extract:
+          command: run step extract
+        orders:
+          command: [run, step, orders]
+          depends_on: [extract]
+        customers:
+          command: run step customers --fail-times {fail_times}
+          depends_on: [extract]
+          retries: 1
+        report:
+          command: run step report
+          depends_on: [orders, customers]
+    broken:
+      steps:
+        spam:
+          command: run step spam
+          depends_on: [eggs]
+    incomplete:
+      steps:
+        spam:
+          command: run step spam
+        eggs:
+          depends_on: [spam]
+"""
+
+
+class TestPipeline(TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp_dir.name)
+        self.app_name = f"pipeline_app_{id(self)}"
+        entry_path = self.root / self.app_name / "entrypoints"
+        entry_path.mkdir(parents=True)
+        (entry_path.parent / "__init__.py").touch()
+        (entry_path / "__init__.py").touch()
+        (entry_path / "step.py").write_text(ENTRY_POINT_MODULE)
+        self.config_path = self.root / self.app_name / "config.yml"
+        self.markers = self.root / "markers"
+        self.markers.mkdir()
+
+        sys.path.insert(0, self.root.as_posix())
+        self.env = patch.dict(os.environ, {'RSTERM_CACHE_DIR': (self.root / "cache").as_posix(),
+                                           'PIPELINE_DIR': self.markers.as_posix()})
+        self.env.start()
+
+    def tearDown(self) -> None:
+        self.env.stop()
+        sys.path.remove(self.root.as_posix())
+        for name in list(sys.modules):
+            if name.startswith(self.app_name):
+                del sys.modules[name]
+        self.tmp_dir.cleanup()
+
+    def write_config(self, fail_times: int) -> None:
+        self.config_path.write_text(CONFIG.format(name=self.app_name, fail_times=fail_times))
+
+    def run_pipeline(self, resume: bool = False):
+        pipeline = read_pipeline(RsTermConfig.load(self.config_path), 'nightly')
+        stdout = io.StringIO()
+
+        with patch.object(sys, 'stdout', stdout):
+            results = PipelineRunner(self.config_path, pipeline).run(resume=resume)
+        return results, stdout.getvalue()
+
+    def attempts(self, name: str) -> int:
+        return len((self.markers / name).read_text())
+
+    def test_read_pipeline(self):
+        self.write_config(0)
+        pipeline = read_pipeline(RsTermConfig.load(self.config_path), 'nightly')
+
+        self.assertEqual(pipeline.jobs, 2)
+        self.assertEqual(pipeline.steps['orders'].args, ['run', 'step', 'orders'])
+        self.assertEqual(pipeline.steps['customers'].args, ['run', 'step', 'customers', '--fail-times', '0'])
+        self.assertEqual(pipeline.steps['customers'].retries, 1)
+        self.assertEqual(pipeline.graph(['extract']).dependencies['orders'], [])
+        self.assertRaises(KeyError, read_pipeline, RsTermConfig.load(self.config_path), 'weekly')
+        self.assertRaises(GraphError, read_pipeline(RsTermConfig.load(self.config_path), 'broken').graph)
+
+    def test_run_with_retries(self):
+        self.write_config(1)
+        results, output = self.run_pipeline()
+
+        self.assertEqual(list(results), ['extract', 'customers', 'orders', 'report'])
+        self.assertTrue(all(result.status == SUCCESS for result in results.values()))
+        self.assertEqual(results['customers'].value, 2)
+        self.assertEqual(self.attempts('customers'), 2)
+        self.assertIn("==> [success] customers", output)
+        self.assertIn("RuntimeError: customers failed", output)
+        self.assertIn("step report in", output)
+
+    def test_resume_from_failed_step(self):
+        self.write_config(2)
+        results, _ = self.run_pipeline()
+
+        self.assertEqual(results['customers'].status, FAILED)
+        self.assertEqual(results['report'].status, SKIPPED)
+        self.assertEqual(self.attempts('customers'), 2)
+
+        results, output = self.run_pipeline(resume=True)
+
+        self.assertTrue(all(result.status == SUCCESS for result in results.values()))
+        self.assertIn("skipping extract", output)
+        self.assertEqual(self.attempts('extract'), 1)
+        self.assertEqual(self.attempts('customers'), 3)
+        self.assertEqual(self.attempts('report'), 1)
+
+    def test_run_pipeline_option(self):
+        self.write_config(0)
+
+        with patch.object(sys, 'stdout', io.StringIO()) as stdout:
+            self.assertEqual(run_pipeline_option(self.config_path, ['nightly', '--jobs', '1']), 0)
+        self.assertIn("nightly finished in", stdout.getvalue())
+
+        with patch.object(sys, 'stderr', io.StringIO()), self.assertRaises(SystemExit):
+            run_pipeline_option(self.config_path, ['weekly'])
+
+    def test_invalid_graph_is_a_usage_error(self):
+        self.write_config(0)
+
+        with patch.object(sys, 'stderr', io.StringIO()) as stderr, self.assertRaises(SystemExit) as context:
+            run_pipeline_option(self.config_path, ['broken'])
+        self.assertEqual(context.exception.code, 2)
+        self.assertIn('spam depends on eggs, which does not exist', stderr.getvalue())
+        self.assertFalse(any(self.markers.iterdir()))
+
+    def test_step_without_command(self):
+        self.write_config(0)
+
+        with self.assertRaisesRegex(ValueError, r'^step 1 \(eggs\) of pipeline incomplete has no command$'):
+            read_pipeline(RsTermConfig.load(self.config_path), 'incomplete')
+
+        with patch.object(sys, 'stderr', io.StringIO()) as stderr, self.assertRaises(SystemExit):
+            run_pipeline_option(self.config_path, ['incomplete'])
+        self.assertIn('step 1 (eggs) of pipeline incomplete has no command', stderr.getvalue())
@@ -0,0 +1,166 @@
+import threading
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_INTRANS
+from rsterm.configs import RsTermConfig
+from rsterm.database import ConnectionPool, close_pools
+from rsterm.exceptions import PoolExhausted, PoolClosed
+
+
+def make_connection() -> MagicMock:
+    conn = MagicMock()
+    conn.closed = 0
+    conn.autocommit = False
+    conn.get_transaction_status.return_value = TRANSACTION_STATUS_IDLE
+    return conn
+
+
+class TestConnectionPool(TestCase):
+
+    def setUp(self) -> None:
+        self.connect = MagicMock(side_effect=make_connection)
+
+    def test_min_size_filled(self):
+        pool = ConnectionPool(self.connect, min_size=2, max_size=4)
+        pool.fill()
+        self.assertEqual(self.connect.call_count, 2)
+        self.assertEqual(pool.idle, 2)
+
+    def test_connection_reused(self):
+        pool = ConnectionPool(self.connect, max_size=2)
+        first = pool.getconn()
+        raw = first._conn
+        first.close()
+        second = pool.getconn()
+        self.assertIs(second._conn, raw)
+        self.assertEqual(self.connect.call_count, 1)
+
+    def test_close_twice_returns_once(self):
+        pool = ConnectionPool(self.connect, max_size=2)
+        conn = pool.getconn()
+        conn.close()
+        conn.close()
+        self.assertEqual(pool.idle, 1)
+
+    def test_exhausted(self):
+        pool = ConnectionPool(self.connect, max_size=1, checkout_timeout=0.01)
+        pool.getconn()
+        self.assertRaises(PoolExhausted, pool.getconn)
+
+    def test_waits_for_returned_connection(self):
+        pool = ConnectionPool(self.connect, max_size=1, checkout_timeout=5)
+        conn = pool.getconn()
+        threading.Timer(0.05, conn.close).start()
+        self.assertIsNotNone(pool.getconn())
+        self.assertEqual(self.connect.call_count, 1)
+
+    def test_unhealthy_connection_replaced(self):
+        pool = ConnectionPool(self.connect, max_size=1)
+        conn = pool.getconn()
+        raw = conn._conn
+        conn.close()
+        raw.cursor.side_effect = Exception("server closed the connection")
+
+        replacement = pool.getconn()
+        self.assertIsNot(replacement._conn, raw)
+        raw.close.assert_called()
+
+    def test_open_transaction_rolled_back(self):
+        pool = ConnectionPool(self.connect)
+        conn = pool.getconn()
+        conn.get_transaction_status.return_value = TRANSACTION_STATUS_INTRANS
+        raw = conn._conn
+        conn.close()
+        raw.rollback.assert_called_once()
+
+    def test_idle_eviction(self):
+        pool = ConnectionPool(self.connect, min_size=0, idle_timeout=0)
+        conn = pool.getconn()
+        raw = conn._conn
+        conn.close()
+        pool.getconn()
+        raw.close.assert_called()
+        self.assertEqual(pool.size, 1)
+
+    def test_connections_are_closed_outside_the_lock(self):
+        pool = ConnectionPool(self.connect, min_size=0, idle_timeout=0)
+        lock_free = []
+
+        def close() -> None:
+            # another thread can only take the lock if the closing thread does not hold it
+            checker = threading.Thread(target=lambda: lock_free.append(self.try_lock(pool)))
+            checker.start()
+            checker.join()
+
+        idle = pool.getconn()
+        idle._conn.close.side_effect = close
+        idle.close()
+        checked_out = pool.getconn()
+        checked_out._conn.close.side_effect = close
+        pool.closeall()
+
+        self.assertEqual(lock_free, [True, True])
+
+    @staticmethod
+    def try_lock(pool: ConnectionPool) -> bool:
+        acquired = pool._cond.acquire(timeout=1)
+        if acquired:
+            pool._cond.release()
+        return acquired
+
+    def test_context_manager(self):
+        pool = ConnectionPool(self.connect)
+        with pool.connection() as conn:
+            self.assertEqual(pool.idle, 0)
+            self.assertFalse(conn.closed)
+        self.assertEqual(pool.idle, 1)
+
+    def test_closeall(self):
+        pool = ConnectionPool(self.connect, min_size=1)
+        pool.fill()
+        checked_out = pool.getconn()._conn
+        pool.getconn()
+        pool.closeall()
+        checked_out.close.assert_called()
+        self.assertRaises(PoolClosed, pool.getconn)
+
+    def test_invalid_size(self):
+        self.assertRaises(ValueError, ConnectionPool, self.connect, min_size=3, max_size=2)
+
+
+class TestRsTermConfigPool(TestCase):
+
+    def setUp(self) -> None:
+        db_connections = {
+            'redshift': 'direct-dsn',
+            'pooled': {'url': 'pooled-dsn', 'pool': {'min_size': 1, 'max_size': 2}}
+        }
+        self.rsterm = RsTermConfig(app={'name': 'spam'}, entrypoint_paths=[], terminal={'verbs': [], 'nouns': []},
+                                   db_connections=db_connections)
+
+    def tearDown(self) -> None:
+        close_pools()
+
+    @patch('psycopg2.connect')
+    def test_unpooled_connection(self, patched_connect):
+        self.rsterm.get_db_connection('redshift')
+        patched_connect.assert_called_with('direct-dsn')
+
+    @patch('psycopg2.connect')
+    def test_pooled_connection(self, patched_connect):
+        patched_connect.side_effect = lambda dsn: make_connection()
+
+        with self.rsterm.db_connection('pooled') as conn:
+            self.assertIsNotNone(conn.cursor())
+
+        self.rsterm.get_db_connection('pooled').close()
+        patched_connect.assert_called_once_with('pooled-dsn')
+        self.assertIs(self.rsterm.get_db_pool('pooled'), self.rsterm.get_db_pool('pooled'))
+
+    @patch('psycopg2.connect')
+    def test_close_db_pools(self, patched_connect):
+        raw = make_connection()
+        patched_connect.return_value = raw
+        self.rsterm.get_db_connection('pooled')
+        RsTermConfig.close_db_pools()
+        raw.close.assert_called()
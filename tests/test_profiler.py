@@ -0,0 +1,83 @@
+import io
+import sys
+import json
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import patch
+from rsterm import EntryPoint, run_entry_point
+from rsterm.discovery import EntryPointManifest
+from rsterm.profiler import PhaseProfiler, phase, extract_profile_options, start_profiling, stop_profiling
+from tests.test_async import CONFIG
+
+
+class RunSpam(EntryPoint):
+
+    def run(self) -> None:
+        print("spam")
+
+
+class TestPhaseProfiler(TestCase):
+
+    def tearDown(self) -> None:
+        stop_profiling()
+
+    def test_phase_is_noop_when_disabled(self):
+        with phase('nothing'):
+            pass
+
+    def test_nested_phases(self):
+        profiler = start_profiling()
+        with phase('outer'):
+            with phase('inner'):
+                pass
+
+        self.assertEqual([(p['phase'], p['depth']) for p in profiler.phases], [('outer', 0), ('inner', 1)])
+        self.assertIn('  inner', profiler.report_table())
+        self.assertEqual(json.loads(profiler.report_json())['phases'][1]['phase'], 'inner')
+
+    def test_invalid_format(self):
+        self.assertRaises(ValueError, PhaseProfiler, 'xml')
+
+    def test_extract_profile_options(self):
+        args, options = extract_profile_options(['--rsterm-profile=json', '--rsterm-profile-pstats=x.pstats', 'run', 'spam'])
+        self.assertEqual(args, ['run', 'spam'])
+        self.assertEqual(options, {'report_format': 'json', 'pstats_path': 'x.pstats'})
+
+    def test_extract_invalid_profile_format(self):
+        with patch('sys.stderr', io.StringIO()) as stderr, self.assertRaises(SystemExit) as context:
+            extract_profile_options(['--rsterm-profile=jsn', 'run', 'spam'])
+
+        self.assertEqual(context.exception.code, 2)
+        self.assertIn('usage: --rsterm-profile[=table|json]', stderr.getvalue())
+        self.assertIn('unsupported profile format jsn, must be one of table, json', stderr.getvalue())
+
+    def test_extract_profile_options_from_environment(self):
+        with patch.dict('os.environ', {'RSTERM_PROFILE': 'table'}):
+            args, options = extract_profile_options(['run', 'spam'])
+        self.assertEqual(options, {'report_format': 'table', 'pstats_path': None})
+
+    def test_not_profiling(self):
+        with patch.dict('os.environ', {'RSTERM_PROFILE': '', 'RSTERM_PROFILE_PSTATS': ''}):
+            self.assertEqual(extract_profile_options(['run', 'spam']), (['run', 'spam'], None))
+
+    def test_profiled_dispatch(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            config_path = Path(tmp_dir) / "spam.yml"
+            config_path.write_text(CONFIG)
+            pstats_path = Path(tmp_dir) / "run.pstats"
+            stderr = io.StringIO()
+
+            argv = ['spam', '--rsterm-profile', f'--rsterm-profile-pstats={pstats_path}', 'run', 'spam']
+            with patch.object(sys, 'argv', argv), patch.object(sys, 'stderr', stderr), \
+                    patch.object(sys, 'stdout', io.StringIO()), \
+                    patch.dict('os.environ', {'RSTERM_CACHE_DIR': tmp_dir}), \
+                    patch.object(EntryPointManifest, 'get_entry_point', return_value=RunSpam):
+                with self.assertRaises(SystemExit):
+                    run_entry_point(config_path)
+
+            self.assertTrue(pstats_path.exists())
+
+        report = stderr.getvalue()
+        for expected in ['load config', 'discovery', 'parse command line', 'RunSpam.__init__', 'RunSpam.run']:
+            self.assertIn(expected, report)
@@ -0,0 +1,183 @@
+import io
+import os
+import sys
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+from rsterm import EntryPoint
+from rsterm.database import QueryCache, QueryResult, cached_query, normalize_sql
+from rsterm.database.query_cache import cache_key, run_query_cache_option
+from tests.test_async import CONFIG
+
+CACHE_CONFIG = CONFIG + """
+  db_connections:
+    redshift: DATABASE_URL
+
+  query_cache:
+    ttl: 60
+"""
+
+
+def make_connection(rows=((1, 'spam'), (2, 'eggs'))) -> MagicMock:
+    conn = MagicMock()
+    cursor = conn.cursor.return_value.__enter__.return_value
+    cursor.description = [('id',), ('name',)]
+    cursor.fetchall.return_value = list(rows)
+    return conn
+
+
+class ReportSpam(EntryPoint):
+
+    def run(self) -> None:
+        pass
+
+
+class TestNormalizeSql(TestCase):
+
+    def test_formatting_does_not_change_the_key(self):
+        sql = """
+            select id,   name  -- the columns
+            from spam /* all of it */
+            where name = 'a  b';
+        """
+        self.assertEqual(normalize_sql(sql), "select id, name from spam where name = 'a  b'")
+        self.assertEqual(cache_key(sql, [1]), cache_key("select id, name from spam where name = 'a  b'", [1]))
+        self.assertNotEqual(cache_key(sql, [1]), cache_key(sql, [2]))
+
+
+class TestQueryCache(TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = QueryCache(Path(self.tmp_dir.name), default_ttl=60)
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def query(self, sql='select * from spam', conn=None, **kwargs):
+        conn = conn or make_connection()
+        return cached_query(self.cache, 'redshift', lambda: conn, sql, **kwargs)
+
+    def test_hit_and_miss(self):
+        conn = make_connection()
+        result, cached = self.query(conn=conn)
+        self.assertEqual(result, QueryResult(['id', 'name'], [(1, 'spam'), (2, 'eggs')]))
+        self.assertFalse(cached)
+
+        connect = MagicMock()
+        result, cached = cached_query(self.cache, 'redshift', connect, 'select *  from spam;')
+        self.assertTrue(cached)
+        self.assertEqual(result.rows, [(1, 'spam'), (2, 'eggs')])
+        connect.assert_not_called()
+        conn.close.assert_called_once_with()
+
+        self.assertEqual(self.cache.stats()['redshift']['hits'], 1)
+        self.assertEqual(self.cache.stats()['redshift']['misses'], 1)
+        self.assertEqual(self.cache.stats()['redshift']['entries'], 1)
+
+    def test_ttl(self):
+        self.query(ttl=0)
+        self.assertFalse(self.query()[1])
+
+        with patch('time.time', return_value=10 ** 10):
+            self.assertFalse(self.query()[1])
+
+    def test_refresh(self):
+        self.query()
+        result, cached = self.query(conn=make_connection([(3, 'ham')]), refresh=True)
+        self.assertFalse(cached)
+        self.assertEqual(self.query()[0].rows, [(3, 'ham')])
+
+    def test_lru_eviction(self):
+        for number in range(3):
+            self.query(f"select {number}")
+            os.utime(self.cache.path_of('redshift', cache_key(f"select {number}")).as_posix(), (number, number))
+
+        self.cache.get('redshift', cache_key("select 0"))
+        self.cache.max_bytes = sum(entry.size for entry in self.cache.entries()) - 1
+        self.assertEqual(self.cache.evict(), 1)
+
+        self.assertIsNotNone(self.cache.get('redshift', cache_key("select 0")))
+        self.assertIsNone(self.cache.get('redshift', cache_key("select 1")))
+        self.assertIsNotNone(self.cache.get('redshift', cache_key("select 2")))
+
+    def test_put_under_max_bytes_reads_no_headers(self):
+        for number in range(3):
+            self.query(f"select {number}")
+
+        with patch.object(QueryCache, 'read_expires', wraps=QueryCache.read_expires) as read_expires:
+            self.query("select 3")
+            read_expires.assert_not_called()
+
+            self.cache.max_bytes = 1
+            self.query("select 4")
+            self.assertEqual(read_expires.call_count, 5)
+
+    def test_clear(self):
+        self.query()
+        cached_query(self.cache, 'postgres', make_connection, 'select * from spam')
+
+        self.cache.clear('redshift')
+        self.assertEqual(list(self.cache.stats()), ['postgres'])
+        self.assertFalse(self.query()[1])
+
+        self.cache.clear()
+        self.assertEqual(self.cache.entries(), [])
+
+    def test_clear_only_removes_cache_files(self):
+        self.query()
+        directory = Path(self.tmp_dir.name)
+        (directory / 'notes.txt').write_text('spam')
+        (directory / 'project').mkdir()
+        (directory / 'project' / 'main.py').write_text('eggs')
+        (directory / 'redshift' / 'keep.pkl').write_text('ham')
+
+        self.cache.clear()
+
+        self.assertEqual(self.cache.entries(), [])
+        self.assertFalse((directory / 'stats.json').exists())
+        self.assertEqual(sorted(path.relative_to(directory).as_posix() for path in directory.rglob('*')),
+                         ['notes.txt', 'project', 'project/main.py', 'redshift', 'redshift/keep.pkl'])
+
+    def test_key_includes_target(self):
+        self.assertNotEqual(cache_key('select 1', target='postgresql://a/db'), cache_key('select 1', target='postgresql://b/db'))
+        self.assertEqual(cache_key('select 1'), cache_key('select 1', target=None))
+
+
+class TestEntryPointCachedQuery(TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.config_path = Path(self.tmp_dir.name) / "spam.yml"
+        self.config_path.write_text(CACHE_CONFIG)
+        self.env = patch.dict(os.environ, {'RSTERM_CACHE_DIR': self.tmp_dir.name})
+        self.env.start()
+
+    def tearDown(self) -> None:
+        self.env.stop()
+        self.tmp_dir.cleanup()
+
+    def test_cached_query(self):
+        entry_point = ReportSpam(self.config_path, args=[])
+
+        with patch('psycopg2.connect', return_value=make_connection()) as connect:
+            entry_point.cached_query('redshift', 'select * from spam')
+            result = entry_point.cached_query('redshift', 'select * from spam')
+
+        connect.assert_called_once()
+        self.assertEqual(result.columns, ['id', 'name'])
+        self.assertEqual(entry_point.rsterm.get_query_cache().default_ttl, 60)
+
+        stdout = io.StringIO()
+        with patch.object(sys, 'stdout', stdout):
+            run_query_cache_option(self.config_path, ['stats'])
+        self.assertIn('50.0%', stdout.getvalue())
+
+        with patch.dict(os.environ, {'DATABASE_URL': 'postgresql://elsewhere/db'}), \
+                patch('psycopg2.connect', return_value=make_connection([(3, 'ham')])) as connect:
+            self.assertEqual(entry_point.cached_query('redshift', 'select * from spam').rows, [(3, 'ham')])
+        connect.assert_called_once_with('postgresql://elsewhere/db')
+
+        run_query_cache_option(self.config_path, ['clear', '--connection', 'redshift'])
+        self.assertEqual(entry_point.rsterm.get_query_cache().stats(), {})
@@ -1,10 +1,28 @@
 import os
+import tempfile
 from pathlib import Path
 from unittest import TestCase
 from unittest.mock import MagicMock, patch
-from rsterm.configs import RsTermConfig
+from rsterm.configs import RsTermConfig, rsterm_config
 from tests import FIXTURES_PATH
 
+# every test loads configs through the on disk cache, which must not be written to the user's cache directory
+_cache_dir = None
+_cache_env = None
+
+
+def setUpModule() -> None:
+    global _cache_dir, _cache_env
+    _cache_dir = tempfile.TemporaryDirectory()
+    _cache_env = patch.dict(os.environ, {'RSTERM_CACHE_DIR': _cache_dir.name})
+    _cache_env.start()
+
+
+def tearDownModule() -> None:
+    _cache_env.stop()
+    _cache_dir.cleanup()
+
+
 EXPECTED_COMPLETE_ENV_VARS = {
     'SPAM_DB_URL': 'beans-eggs-banana',
     'SPAM_ROLE': 'the-lead-role',
@@ -57,13 +75,13 @@ class TestCompleteRsTermConfig(TestCase):
         for key, value in EXPECTED_COMPLETE_ENV_VARS.items():
             self.assertEqual(os.environ[key], value)
 
-    @patch('rsterm.configs.rsterm_config.psycopg2.connect')
+    @patch('psycopg2.connect')
     def test_psycopg2_connect(self, patched_connect):
         patched_connect.return_value = MagicMock()
         _ = self.rsterm.get_db_connection('redshift')
         patched_connect.assert_called_with('beans-eggs-banana')
 
-    @patch('rsterm.configs.rsterm_config.psycopg2.connect')
+    @patch('psycopg2.connect')
     def test_psycopg2_direct_connect(self, patched_connect):
         patched_connect.return_value = MagicMock()
         _ = self.rsterm.get_db_connection('blueshift')
@@ -115,3 +133,96 @@ class TestCompleteRsTermConfig(TestCase):
         expected_path = FIXTURES_PATH / "spam.env"
         set_path = Path(self.rsterm.env_file_name).absolute()
         self.assertEqual(set_path.as_posix(), expected_path.as_posix())
+
+
+class TestRsTermCacheDir(TestCase):
+
+    def test_xdg_cache_home(self):
+        with patch.dict(os.environ, {'XDG_CACHE_HOME': '/var/cache/me'}):
+            os.environ.pop('RSTERM_CACHE_DIR')
+            self.assertEqual(rsterm_config.rsterm_cache_dir(), Path('/var/cache/me/rsterm'))
+
+    def test_empty_or_relative_xdg_cache_home_is_ignored(self):
+        for value in ('', 'cache', './cache'):
+            with patch.dict(os.environ, {'XDG_CACHE_HOME': value, 'RSTERM_CACHE_DIR': ''}):
+                self.assertEqual(rsterm_config.rsterm_cache_dir(), Path.home() / '.cache' / 'rsterm')
+
+
+class TestRsTermConfigCache(TestCase):
+
+    def setUp(self) -> None:
+        self.cwd = Path.cwd()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp_dir.name)
+        self.config_path = self.root / "spam.yml"
+        self.config_path.write_text((FIXTURES_PATH / "spam.yml").read_text())
+        self.override_path = self.root / ".spam"
+
+        self.env = patch.dict(os.environ, {'RSTERM_CACHE_DIR': (self.root / "cache").as_posix()})
+        self.env.start()
+        os.chdir(self.root)
+
+    def tearDown(self) -> None:
+        os.chdir(self.cwd)
+        self.env.stop()
+        rsterm_config._parsed_files.clear()
+        rsterm_config._loaded_configs.clear()
+        self.tmp_dir.cleanup()
+
+    def write_override(self, bucket: str) -> None:
+        self.override_path.write_text(f"rsterm:\n  s3_buckets:\n    redshift: {bucket}\n")
+
+    def test_config_parsed_once_per_process(self):
+        with patch('yaml.safe_load', wraps=__import__('yaml').safe_load) as patched_load:
+            RsTermConfig.parse_config(self.config_path)
+            RsTermConfig.parse_config(self.config_path)
+            RsTermConfig.load(self.config_path)
+            RsTermConfig.load(self.config_path)
+        self.assertEqual(patched_load.call_count, 1)
+
+    def test_load_applies_override(self):
+        self.write_override('override-bucket')
+        rsterm = RsTermConfig.load(self.config_path)
+        self.assertEqual(rsterm.get_s3_bucket('redshift'), 'override-bucket')
+
+    def test_warm_start_skips_yaml(self):
+        self.write_override('override-bucket')
+        RsTermConfig.load(self.config_path)
+        rsterm_config._parsed_files.clear()
+        rsterm_config._loaded_configs.clear()
+
+        with patch('yaml.safe_load', side_effect=AssertionError("yaml should not be parsed")):
+            rsterm = RsTermConfig.load(self.config_path)
+        self.assertEqual(rsterm.get_s3_bucket('redshift'), 'override-bucket')
+
+    def test_changed_override_invalidates_cache(self):
+        self.write_override('override-bucket')
+        RsTermConfig.load(self.config_path)
+        self.write_override('another-bucket')
+        os.utime(self.override_path, ns=(0, 0))
+
+        rsterm = RsTermConfig.load(self.config_path)
+        self.assertEqual(rsterm.get_s3_bucket('redshift'), 'another-bucket')
+
+    def test_loaded_configs_are_independent(self):
+        first = RsTermConfig.load(self.config_path)
+        first.s3_buckets['redshift'] = 'mutated'
+        second = RsTermConfig.load(self.config_path)
+        self.assertEqual(second.s3_buckets['redshift'], 'SPAM_BUCKET')
+
+    def test_cache_file_is_private(self):
+        RsTermConfig.load(self.config_path)
+        cache_files = list((self.root / "cache" / "configs").iterdir())
+
+        self.assertEqual(len(cache_files), 1)
+        self.assertEqual(cache_files[0].suffix, '.json')
+        self.assertEqual(cache_files[0].stat().st_mode & 0o777, 0o600)
+
+    def test_load_str_path(self):
+        self.write_override('override-bucket')
+        rsterm = RsTermConfig.load(self.config_path.as_posix())
+        self.assertEqual(rsterm.get_s3_bucket('redshift'), 'override-bucket')
+
+        rsterm_config._parsed_files.clear()
+        rsterm_config._loaded_configs.clear()
+        self.assertEqual(RsTermConfig.load(str(self.config_path)).get_s3_bucket('redshift'), 'override-bucket')
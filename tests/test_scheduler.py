@@ -0,0 +1,66 @@
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+from rsterm.scheduler import TaskGraph, run_graph, format_results, SUCCESS, FAILED, SKIPPED
+from rsterm.exceptions import GraphError
+
+DEPENDENCIES = {
+    'spam': [],
+    'eggs': [],
+    'beans': ['spam'],
+    'toast': ['beans', 'eggs']
+}
+
+
+class TestTaskGraph(TestCase):
+
+    def test_order(self):
+        order = TaskGraph(DEPENDENCIES).order()
+        self.assertLess(order.index('spam'), order.index('beans'))
+        self.assertLess(order.index('beans'), order.index('toast'))
+        self.assertLess(order.index('eggs'), order.index('toast'))
+
+    def test_missing_dependency(self):
+        self.assertRaises(GraphError, TaskGraph, {'spam': ['ham']})
+
+    def test_cycle(self):
+        self.assertRaises(GraphError, TaskGraph, {'spam': ['eggs'], 'eggs': ['spam']})
+
+    def test_dependants(self):
+        self.assertEqual(TaskGraph(DEPENDENCIES).dependants('spam'), ['beans', 'toast'])
+
+
+class TestRunGraph(TestCase):
+
+    def run_graph(self, failing: str = None, stop_on_failure: bool = True):
+        started = []
+
+        def task(name):
+            started.append(name)
+            if name == failing:
+                raise ValueError(f"{name} failed")
+            return name.upper()
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            results = run_graph(TaskGraph(DEPENDENCIES), task, executor, stop_on_failure=stop_on_failure)
+        return results, started
+
+    def test_all_succeed(self):
+        results, started = self.run_graph()
+        self.assertEqual({r.status for r in results.values()}, {SUCCESS})
+        self.assertEqual(results['toast'].value, 'TOAST')
+        self.assertEqual(sorted(started), sorted(DEPENDENCIES))
+
+    def test_failure_skips_dependants(self):
+        results, started = self.run_graph(failing='beans', stop_on_failure=False)
+        self.assertEqual(results['beans'].status, FAILED)
+        self.assertEqual(results['beans'].error, 'ValueError: beans failed')
+        self.assertEqual(results['toast'].status, SKIPPED)
+        self.assertEqual(results['eggs'].status, SUCCESS)
+        self.assertNotIn('toast', started)
+
+    def test_format_results(self):
+        results, _ = self.run_graph(failing='spam')
+        table = format_results(results.values())
+        self.assertIn('spam', table)
+        self.assertIn('ValueError: spam failed', table)
+        self.assertIn('total', table)
@@ -0,0 +1,141 @@
+import os
+import json
+import tempfile
+import importlib.util
+from pathlib import Path
+from unittest import TestCase, skipUnless
+from unittest.mock import MagicMock, patch
+from rsterm import EntryPoint
+from rsterm.configs import RsTermConfig
+from rsterm.exceptions import SecretNotFound
+from rsterm.secrets import SecretResolver, DictBackend, FileBackend, AwsSecretsManagerBackend, EncryptedFileCache
+from rsterm.secrets import resolver as secret_resolver
+from tests.test_async import CONFIG
+
+SECRETS_CONFIG = CONFIG + """
+  aws_secrets:
+    from_env: SPAM_SECRET
+    password:
+      secret_id: prod/warehouse#password
+    token: prod/token
+
+  secrets:
+    ttl: 60
+"""
+
+
+class RunSpam(EntryPoint):
+    required_secrets = ['password', 'token']
+
+    def run(self) -> None:
+        pass
+
+
+class TestSecretResolver(TestCase):
+
+    def setUp(self) -> None:
+        self.backend = DictBackend({'spam': 'eggs', 'ham': 'bacon'})
+        self.resolver = SecretResolver(self.backend, ttl=10)
+
+    def test_resolve_in_one_batch(self):
+        self.assertEqual(self.resolver.resolve(['spam', 'ham']), {'spam': 'eggs', 'ham': 'bacon'})
+        self.assertEqual(self.backend.calls, 1)
+
+    def test_cached_until_expired(self):
+        with patch('time.time', return_value=1000.0):
+            self.resolver.resolve(['spam'])
+            self.assertEqual(self.resolver.get('spam'), 'eggs')
+        self.assertEqual(self.backend.calls, 1)
+
+        with patch('time.time', return_value=1011.0):
+            self.resolver.get('spam')
+        self.assertEqual(self.backend.calls, 2)
+
+    def test_only_missing_secrets_are_fetched(self):
+        self.resolver.resolve(['spam'])
+        with patch.object(self.backend, 'get_secrets', return_value={'ham': 'bacon'}) as patched:
+            self.resolver.resolve(['spam', 'ham'])
+        patched.assert_called_once_with(['ham'])
+
+    def test_not_found(self):
+        with self.assertRaises(SecretNotFound) as raised:
+            self.resolver.resolve(['spam', 'nothing', 'nobody'])
+        self.assertIn('nothing, nobody', str(raised.exception))
+
+    def test_file_backend(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / "secrets.json"
+            path.write_text(json.dumps({'spam': 'eggs'}))
+            self.assertEqual(FileBackend(path).get_secrets(['spam', 'ham']), {'spam': 'eggs'})
+
+    @skipUnless(importlib.util.find_spec('cryptography'), 'cryptography is not installed')
+    def test_encrypted_file_cache(self):
+        from cryptography.fernet import Fernet
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / "secrets.bin"
+            key = Fernet.generate_key().decode()
+            SecretResolver(self.backend, file_cache=EncryptedFileCache(path, key)).resolve(['spam'])
+
+            self.assertNotIn(b'eggs', path.read_bytes())
+            self.assertEqual(path.stat().st_mode & 0o777, 0o600)
+
+            backend = DictBackend({})
+            self.assertEqual(SecretResolver(backend, file_cache=EncryptedFileCache(path, key)).get('spam'), 'eggs')
+            self.assertEqual(backend.calls, 0)
+
+            other_key = Fernet.generate_key().decode()
+            self.assertEqual(EncryptedFileCache(path, other_key).load(), {})
+
+
+class TestAwsSecretsManagerBackend(TestCase):
+
+    def test_batch_fetch(self):
+        backend = AwsSecretsManagerBackend()
+        backend._client = MagicMock()
+        backend._client.batch_get_secret_value.return_value = {'SecretValues': [
+            {'Name': 'prod/warehouse', 'ARN': 'arn:1', 'SecretString': json.dumps({'password': 'hunter2'})},
+            {'Name': 'prod/token', 'ARN': 'arn:2', 'SecretString': 'abc'}
+        ]}
+
+        secrets = backend.get_secrets(['prod/warehouse#password', 'prod/token', 'prod/missing'])
+
+        self.assertEqual(secrets, {'prod/warehouse#password': 'hunter2', 'prod/token': 'abc'})
+        backend._client.batch_get_secret_value.assert_called_once_with(
+            SecretIdList=['prod/missing', 'prod/token', 'prod/warehouse'])
+
+
+class TestConfigSecrets(TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.config_path = Path(self.tmp_dir.name) / "spam.yml"
+        self.config_path.write_text(SECRETS_CONFIG)
+        self.backend = DictBackend({'prod/warehouse#password': 'hunter2', 'prod/token': 'abc'})
+
+        self.env = patch.dict(os.environ, {'RSTERM_CACHE_DIR': self.tmp_dir.name, 'SPAM_SECRET': 'from env'})
+        self.env.start()
+        self.backends = patch('rsterm.secrets.get_backend', return_value=self.backend)
+        self.backends.start()
+
+    def tearDown(self) -> None:
+        self.backends.stop()
+        self.env.stop()
+        secret_resolver._resolvers.clear()
+        self.tmp_dir.cleanup()
+
+    def test_resolve_secrets(self):
+        config = RsTermConfig.load(self.config_path)
+
+        self.assertEqual(config.resolve_secrets(['from_env', 'password', 'token']),
+                         {'from_env': 'from env', 'password': 'hunter2', 'token': 'abc'})
+        self.assertEqual(config.get_aws_secret('token'), 'abc')
+        self.assertEqual(self.backend.calls, 1)
+        self.assertEqual(config.get_secret_resolver().ttl, 60)
+
+    def test_required_secrets(self):
+        entry_point = RunSpam(self.config_path, args=[])
+        self.assertEqual(entry_point.secrets, {'password': 'hunter2', 'token': 'abc'})
+
+        RunSpam(self.config_path, args=[])
+        self.assertEqual(self.backend.calls, 1)
@@ -0,0 +1,73 @@
+import tempfile
+import threading
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+from rsterm.database import SqlScriptRunner, build_script_graph
+from rsterm.scheduler import SUCCESS, FAILED, SKIPPED
+from rsterm.exceptions import GraphError
+
+
+class TestSqlScriptRunner(TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.directory = Path(self.tmp_dir.name)
+        (self.directory / "load_users.sql").write_text("insert into users select 1;")
+        (self.directory / "load_orders.sql").write_text("insert into orders select 1;")
+        (self.directory / "build_report.sql").write_text(
+            "-- nightly report\n-- depends_on: load_users, load_orders.sql\n\ncreate table report as select 1;"
+        )
+        self.connections = []
+        self.lock = threading.Lock()
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def connect(self, failing_sql: str = None) -> MagicMock:
+        conn = MagicMock()
+        cursor = conn.cursor.return_value.__enter__.return_value
+
+        def execute(sql):
+            if failing_sql and failing_sql in sql:
+                raise Exception("relation does not exist")
+
+        cursor.execute.side_effect = execute
+        with self.lock:
+            self.connections.append(conn)
+        return conn
+
+    def test_header_dependencies(self):
+        graph, scripts = build_script_graph(self.directory)
+        self.assertEqual(graph.dependencies['build_report'], ['load_users', 'load_orders'])
+        self.assertEqual(set(scripts), {'load_users', 'load_orders', 'build_report'})
+
+    def test_manifest_dependencies(self):
+        (self.directory / "sql_manifest.yml").write_text("load_orders:\n  - load_users.sql\n")
+        graph, _ = build_script_graph(self.directory)
+        self.assertEqual(graph.dependencies['load_orders'], ['load_users'])
+        self.assertEqual(graph.order(), ['load_users', 'load_orders', 'build_report'])
+
+    def test_manifest_unknown_script(self):
+        (self.directory / "sql_manifest.yml").write_text("spam:\n  - load_users\n")
+        self.assertRaises(GraphError, build_script_graph, self.directory)
+
+    def test_run(self):
+        runner = SqlScriptRunner(self.connect, max_workers=2)
+        with patch('builtins.print'):
+            results = runner.run(self.directory)
+
+        self.assertEqual({r.status for r in results.values()}, {SUCCESS})
+        self.assertLessEqual(len(self.connections), 2)
+        for conn in self.connections:
+            conn.commit.assert_called()
+            conn.close.assert_called_once()
+
+    def test_failure_stops_graph(self):
+        runner = SqlScriptRunner(lambda: self.connect(failing_sql='orders'), max_workers=1)
+        with patch('builtins.print'):
+            results = runner.run(self.directory)
+
+        self.assertEqual(results['load_orders'].status, FAILED)
+        self.assertEqual(results['build_report'].status, SKIPPED)
+        self.connections[0].rollback.assert_called()
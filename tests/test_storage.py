@@ -0,0 +1,220 @@
+import io
+import os
+import sys
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import patch
+from rsterm import EntryPoint
+from rsterm.exceptions import SyncError
+from rsterm.storage import DirectorySync, LocalBackend, SyncManifest, get_backend, sync_directory
+
+CONFIG = """
+rsterm:
+  app:
+    name: spam
+  entrypoint_paths:
+    - entrypoints
+  terminal:
+    verbs:
+      - run
+    nouns:
+      - spam
+  s3_buckets:
+    exports: spam-exports
+  storage:
+    backend: local
+    options:
+      root: {root}
+"""
+
+
+class CountingBackend(LocalBackend):
+    """
+    Counts uploads, and fails to upload the parts in fail_parts once each.
+    """
+
+    def __init__(self, root: Path, fail_parts=()) -> None:
+        super().__init__(root)
+        self.fail_parts = set(fail_parts)
+        self.puts = []
+        self.parts = []
+
+    def put_object(self, key: str, path: Path) -> None:
+        self.puts.append(key)
+        super().put_object(key, path)
+
+    def upload_part(self, key: str, upload_id: str, part_number: int, data: bytes) -> str:
+        if part_number in self.fail_parts:
+            self.fail_parts.discard(part_number)
+            raise ConnectionError(f"part {part_number} timed out")
+        self.parts.append((key, part_number))
+        return super().upload_part(key, upload_id, part_number, data)
+
+
+class RunSpam(EntryPoint):
+
+    def run(self) -> None:
+        pass
+
+
+class TestSyncDirectory(TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp_dir.name)
+        self.local_dir = self.root / 'local'
+        (self.local_dir / 'nested').mkdir(parents=True)
+        (self.local_dir / 'a.csv').write_text('a' * 10)
+        (self.local_dir / 'nested' / 'b.csv').write_text('b' * 10)
+        self.big = self.local_dir / 'big.bin'
+        self.big.write_bytes(os.urandom(1000))
+        self.bucket = self.root / 'bucket'
+        self.manifest_path = self.root / 'manifest.json'
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def sync(self, backend: LocalBackend, **kwargs):
+        return sync_directory(backend, self.local_dir, 'exports/', self.manifest_path, **dict(
+            {'jobs': 4, 'part_size': 300, 'multipart_threshold': 500}, **kwargs))
+
+    def test_only_changed_files_are_uploaded(self):
+        backend = CountingBackend(self.bucket)
+        result = self.sync(backend)
+
+        self.assertEqual(sorted(result.uploaded), ['a.csv', 'big.bin', 'nested/b.csv'])
+        self.assertEqual(result.bytes, 1020)
+        self.assertEqual(sorted(backend.puts), ['exports/a.csv', 'exports/nested/b.csv'])
+        self.assertEqual(len(backend.parts), 4)
+        self.assertEqual((self.bucket / 'exports' / 'big.bin').read_bytes(), self.big.read_bytes())
+        self.assertEqual((self.bucket / 'exports' / 'nested' / 'b.csv').read_text(), 'b' * 10)
+
+        backend = CountingBackend(self.bucket)
+        (self.local_dir / 'a.csv').write_text('c' * 10)
+        os.utime((self.local_dir / 'nested' / 'b.csv').as_posix(), None)
+        result = self.sync(backend)
+
+        self.assertEqual(result.uploaded, ['a.csv'])
+        self.assertEqual(result.skipped, 2)
+        self.assertEqual(backend.puts, ['exports/a.csv'])
+        self.assertEqual((self.bucket / 'exports' / 'a.csv').read_text(), 'c' * 10)
+        self.assertIn('uploaded 1 file(s) (10 bytes)', result.summary())
+
+    def test_interrupted_multipart_upload_resumes(self):
+        backend = CountingBackend(self.bucket, fail_parts=[3])
+        result = self.sync(backend)
+
+        self.assertEqual(list(result.failed), ['big.bin'])
+        self.assertIn('part 3 timed out', result.failed['big.bin'])
+        self.assertIn('big.bin', SyncManifest(self.manifest_path).uploads)
+        self.assertNotIn('big.bin', SyncManifest(self.manifest_path).files)
+
+        backend = CountingBackend(self.bucket)
+        result = self.sync(backend)
+
+        self.assertEqual(result.uploaded, ['big.bin'])
+        self.assertEqual(backend.parts, [('exports/big.bin', 3)])
+        self.assertEqual((self.bucket / 'exports' / 'big.bin').read_bytes(), self.big.read_bytes())
+        self.assertEqual(SyncManifest(self.manifest_path).uploads, {})
+        self.assertFalse((self.bucket / '.multipart').exists() and any((self.bucket / '.multipart').iterdir()))
+
+    def test_resumed_upload_keeps_its_part_size(self):
+        self.sync(CountingBackend(self.bucket, fail_parts=[3]))
+        self.assertEqual(SyncManifest(self.manifest_path).uploads['big.bin']['part_size'], 300)
+
+        backend = CountingBackend(self.bucket)
+        result = self.sync(backend, part_size=400)
+
+        self.assertEqual(result.uploaded, ['big.bin'])
+        self.assertEqual(backend.parts, [('exports/big.bin', 3)])
+        self.assertEqual((self.bucket / 'exports' / 'big.bin').read_bytes(), self.big.read_bytes())
+
+    def test_part_size_fits_max_parts(self):
+        megabyte = 1024 * 1024
+        directory_sync = DirectorySync(LocalBackend(self.bucket), self.manifest_path, part_size=8 * megabyte)
+
+        self.assertEqual(directory_sync.part_size_for(78 * 1024 * megabyte), 8 * megabyte)
+        size = 100 * 1024 * megabyte + 1
+        part_size = directory_sync.part_size_for(size)
+        self.assertEqual(part_size % megabyte, 0)
+        self.assertLessEqual(-(-size // part_size), 10000)
+        self.assertEqual(part_size, 11 * megabyte)
+
+        directory_sync.part_size, directory_sync.max_parts = 300, 2
+        self.assertEqual(directory_sync.part_size_for(1000), 5 * megabyte)
+
+    def test_file_changed_while_uploading_is_not_recorded(self):
+        path = self.local_dir / 'a.csv'
+
+        class ChangingBackend(CountingBackend):
+
+            def put_object(self, key: str, upload_path: Path) -> None:
+                super().put_object(key, upload_path)
+                if upload_path == path:
+                    path.write_text('changed')
+                    os.utime(path.as_posix(), ns=(0, 0))
+
+        result = self.sync(ChangingBackend(self.bucket))
+
+        self.assertEqual(list(result.failed), ['a.csv'])
+        self.assertIn('a.csv changed while it was synced', result.failed['a.csv'])
+        self.assertNotIn('a.csv', SyncManifest(self.manifest_path).files)
+
+        result = self.sync(CountingBackend(self.bucket))
+        self.assertEqual(result.uploaded, ['a.csv'])
+        self.assertEqual((self.bucket / 'exports' / 'a.csv').read_text(), 'changed')
+
+    def test_changed_file_restarts_multipart_upload(self):
+        self.sync(CountingBackend(self.bucket, fail_parts=[2]))
+        self.big.write_bytes(os.urandom(1000))
+
+        backend = CountingBackend(self.bucket)
+        self.sync(backend)
+
+        self.assertEqual(sorted(number for _, number in backend.parts), [1, 2, 3, 4])
+        self.assertEqual((self.bucket / 'exports' / 'big.bin').read_bytes(), self.big.read_bytes())
+
+    def test_delete(self):
+        self.sync(LocalBackend(self.bucket))
+        (self.local_dir / 'a.csv').unlink()
+
+        result = self.sync(LocalBackend(self.bucket), delete=True)
+
+        self.assertEqual(result.deleted, ['a.csv'])
+        self.assertFalse((self.bucket / 'exports' / 'a.csv').exists())
+        self.assertNotIn('a.csv', SyncManifest(self.manifest_path).files)
+
+    def test_get_backend(self):
+        self.assertIsInstance(get_backend('local', root=self.bucket), LocalBackend)
+        self.assertRaises(ValueError, get_backend, 'ftp')
+
+
+class TestEntryPointSync(TestCase):
+
+    def test_sync_directory(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            root = Path(tmp_dir)
+            (root / 'local').mkdir()
+            (root / 'local' / 'report.csv').write_text('spam')
+            config_path = root / 'spam.yml'
+            config_path.write_text(CONFIG.format(root=root / 'buckets'))
+
+            with patch.dict('os.environ', {'RSTERM_CACHE_DIR': tmp_dir}), \
+                    patch.object(sys, 'stdout', io.StringIO()) as stdout:
+                entry_point = RunSpam(config_path)
+                entry_point.sync_directory('exports', root / 'local', prefix='daily')
+                result = entry_point.sync_directory('exports', root / 'local', prefix='daily')
+
+                manifest_path = entry_point.rsterm.get_sync_manifest_path('exports', 'daily')
+                self.assertTrue(manifest_path.exists())
+                self.assertTrue(manifest_path.as_posix().startswith(tmp_dir))
+
+                (root / 'local' / 'report.csv').write_text('eggs')
+                with patch.object(LocalBackend, 'put_object', side_effect=PermissionError('denied')), \
+                        self.assertRaises(SyncError):
+                    entry_point.sync_directory('exports', root / 'local', prefix='daily')
+
+            self.assertEqual((root / 'buckets' / 'spam-exports' / 'daily' / 'report.csv').read_text(), 'spam')
+            self.assertEqual(result.skipped, 1)
+            self.assertIn('uploaded 1 file(s)', stdout.getvalue())